@@ -0,0 +1,80 @@
+import time
+
+from fastapi import APIRouter, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core import profiling
+from core.metrics import (
+    REQUEST_BYTES, REQUEST_LATENCY, REQUESTS_IN_FLIGHT, RESPONSE_BYTES, observe_transfer, render
+)
+
+router = APIRouter()
+
+
+@router.get('/metrics', include_in_schema=False)
+async def metrics():
+    body, content_type = render()
+    return Response(body, media_type=content_type)
+
+
+class MetricsMiddleware:
+    """Per-route latency, body bytes and throughput, plus sampled profiles of slow requests.
+
+    Plain ASGI rather than BaseHTTPMiddleware: it must not buffer or re-wrap streamed bodies.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.routes = {}
+
+    def route(self, scope: Scope) -> str:
+        # label by route template, not by the raw path, to keep the label set small
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return 'unmatched'
+        if endpoint not in self.routes:
+            self.routes = {
+                getattr(route, 'endpoint', None): route.path for route in scope['app'].routes
+            }
+        return self.routes.setdefault(endpoint, 'unmatched')
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        received = sent = 0
+        status = 500
+
+        async def counting_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            received += len(message.get('body', b''))
+            return message
+
+        async def counting_send(message: Message) -> None:
+            nonlocal sent, status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                sent += len(message.get('body', b''))
+            await send(message)
+
+        capture = profiling.start()
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+            route = self.route(scope)
+            REQUEST_LATENCY.labels(scope['method'], route, status).observe(elapsed)
+            if received:
+                REQUEST_BYTES.labels(route).inc(received)
+                observe_transfer('upload', received, elapsed)
+            if sent:
+                RESPONSE_BYTES.labels(route).inc(sent)
+                observe_transfer('download', sent, elapsed)
+            if capture is not None:
+                profiling.finish(capture, route, elapsed)
@@ -0,0 +1,122 @@
+from collections import deque
+from typing import AsyncIterator
+
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+# room for boundaries and part headers on top of the file itself
+MAX_OVERHEAD = 2 ** 14
+
+
+class MultipartError(ValueError):
+    pass
+
+
+# marks the end of a file part in the event queue
+PART_END = object()
+
+
+class MultipartFile:
+    """File fields of a multipart/form-data body, streamed straight from the request.
+
+    Unlike starlette's form parsing nothing is spooled to a temporary file first.
+    With `field=None` every file field is accepted, see `files`.
+    """
+
+    def __init__(self, stream: AsyncIterator[bytes], content_type: str, field: str | None = 'file'):
+        media_type, options = parse_options_header(content_type)
+        if media_type != b'multipart/form-data' or not options.get(b'boundary'):
+            raise MultipartError('Expected a multipart/form-data body')
+        self.stream = stream
+        self.field = field.encode() if field is not None else None
+        self.filename: str | None = None
+        # filenames, data and PART_END in body order
+        self.events: deque[str | bytes | object] = deque()
+        self.finished = False
+        self.current = False
+        self.headers: dict[bytes, bytes] = {}
+        self.header_field = b''
+        self.header_value = b''
+        self.parser = MultipartParser(options[b'boundary'], callbacks={
+            'on_part_begin': self.on_part_begin,
+            'on_header_field': self.on_header_field,
+            'on_header_value': self.on_header_value,
+            'on_header_end': self.on_header_end,
+            'on_headers_finished': self.on_headers_finished,
+            'on_part_data': self.on_part_data,
+            'on_part_end': self.on_part_end,
+            'on_end': self.on_end,
+        })
+
+    def on_part_begin(self) -> None:
+        self.headers.clear()
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self.header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field, self.header_value = b'', b''
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self.headers.get(b'content-disposition', b''))
+        self.current = b'filename' in options and self.field in (None, options.get(b'name'))
+        if self.current:
+            try:
+                self.events.append(options[b'filename'].decode())
+            except UnicodeDecodeError as err:
+                raise MultipartError('Invalid filename') from err
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self.current and end > start:
+            self.events.append(data[start:end])
+
+    def on_part_end(self) -> None:
+        if self.current:
+            self.current = False
+            self.events.append(PART_END)
+
+    def on_end(self) -> None:
+        self.finished = True
+
+    async def feed(self) -> None:
+        chunk = await anext(self.stream, None)
+        if chunk is None:
+            raise MultipartError('Unexpected end of body')
+        try:
+            self.parser.write(chunk)
+        except MultipartParseError as err:
+            raise MultipartError(str(err)) from err
+
+    async def next_event(self) -> str | bytes | object | None:
+        """The next event, or None once the body is complete."""
+        while not self.events:
+            if self.finished:
+                return None
+            await self.feed()
+        return self.events.popleft()
+
+    async def open(self) -> str:
+        """Read up to the headers of the first file field and return its filename."""
+        while not isinstance(event := await self.next_event(), str):
+            if event is None:
+                raise MultipartError('No file in body')
+        self.filename = event
+        return self.filename
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        while (event := await self.next_event()) is not PART_END:
+            if event is None:
+                raise MultipartError('Unexpected end of body')
+            yield event
+
+    async def files(self) -> AsyncIterator[tuple[str, AsyncIterator[bytes]]]:
+        """Every file field as (filename, chunks); each one must be read before the next is produced."""
+        while (event := await self.next_event()) is not None:
+            # data of a part the consumer left unread is skipped
+            if isinstance(event, str):
+                self.filename = event
+                yield event, self.chunks()
@@ -0,0 +1,316 @@
+import datetime
+import secrets
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, AsyncIterator, Callable
+from urllib.parse import quote
+
+import anyio
+import orjson
+from pydantic import BaseModel
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from services.limits import Stream
+from services.storage import read_file
+
+ZEROCOPY_SEND = 'http.response.zerocopysend'
+
+
+def parse_range(header: str, size: int, max_ranges: int = 16) -> list[tuple[int, int]] | None:
+    """Parse a `Range: bytes=...` header (RFC 7233).
+
+    Returns None when the header must be ignored, an empty list when no range is
+    satisfiable and otherwise sorted, coalesced inclusive (start, end) pairs.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec.strip():
+        return None
+    items = spec.split(',')
+    if len(items) > max_ranges:
+        return None
+    ranges = []
+    for item in items:
+        start, sep, end = item.strip().partition('-')
+        if not sep or not (start or end) or (start and not start.isdigit()) or (end and not end.isdigit()):
+            return None
+        if not start:
+            if int(end) and size:
+                ranges.append((max(size - int(end), 0), size - 1))
+            continue
+        first, last = int(start), int(end) if end else None
+        if last is not None and last < first:
+            return None
+        if first < size:
+            ranges.append((first, size - 1 if last is None else min(last, size - 1)))
+    return coalesce_ranges(ranges)
+
+
+def coalesce_ranges(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    merged: list[tuple[int, int]] = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def parse_qvalue(params: str) -> float:
+    for param in params.split(';'):
+        key, _, value = param.partition('=')
+        if key.strip().lower() == 'q':
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def accepts_encoding(header: str, encoding: str) -> bool:
+    """Whether an `Accept-Encoding` header allows the given content coding."""
+    wildcard = False
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if name == encoding:
+            return parse_qvalue(params) > 0
+        if name == '*':
+            wildcard = parse_qvalue(params) > 0
+    return wildcard
+
+
+def weak_compare(left: str, right: str) -> bool:
+    return left.removeprefix('W/') == right.removeprefix('W/')
+
+
+def content_disposition(filename: str) -> str:
+    # the same header FileResponse writes
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+class AccelRedirectResponse(Response):
+    """An empty response telling a fronting nginx to send `location` itself.
+
+    `location` must be an `internal` nginx location; nginx then handles ranges,
+    conditional requests and sendfile, and the app is out of the byte path.
+    """
+
+    def __init__(
+            self,
+            location: str,
+            *,
+            filename: str,
+            media_type: str = 'application/octet-stream',
+            headers: dict[str, str] | None = None,
+    ) -> None:
+        super().__init__(
+            headers={
+                'x-accel-redirect': quote(location),
+                'content-disposition': content_disposition(filename),
+                **(headers or {}),
+            },
+            media_type=media_type,
+        )
+
+
+def json_default(value: Any) -> Any:
+    # what orjson doesn't know natively, encoded as pydantic's json() would
+    if isinstance(value, BaseModel):
+        return value.dict()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, uuid.UUID):
+        # asyncpg returns its own UUID subclass, which orjson doesn't take as a UUID
+        return str(value)
+    if isinstance(value, tuple):
+        return list(value)
+    raise TypeError(f'Type is not JSON serializable: {type(value).__name__}')
+
+
+class TrustedJSONResponse(Response):
+    """JSON rendered by orjson from content a handler built from its own data.
+
+    Returning a response skips FastAPI's validation against the route's response_model
+    and its jsonable_encoder pass, so the content must already have the model's shape.
+    """
+
+    media_type = 'application/json'
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=json_default)
+
+
+class PacedStreamingResponse(StreamingResponse):
+    """A StreamingResponse paced by a transfer `stream`, which is closed once the body is sent."""
+
+    def __init__(self, content: AsyncIterator[bytes], *, stream: Stream, **kwargs) -> None:
+        super().__init__(stream.chunks(content), **kwargs)
+        self.stream = stream
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.stream.close()
+
+
+class RangeFileResponse(FileResponse):
+    """FileResponse with validators, conditional GET and single/multipart byte ranges.
+
+    Content comes from `reader(first, last)`; only a local `path` allows zero-copy sends.
+    A transfer `stream` paces the body and is closed once it is sent, or the client went away.
+    """
+
+    def __init__(
+            self,
+            path: str | None,
+            *,
+            request_headers: Headers,
+            size: int,
+            etag: str,
+            last_modified: float,
+            reader: Callable[[int, int], AsyncIterator[bytes]] | None = None,
+            method: str | None = None,
+            filename: str | None = None,
+            media_type: str = 'application/octet-stream',
+            headers: dict[str, str] | None = None,
+            stream: Stream | None = None,
+    ) -> None:
+        super().__init__(
+            path or '',
+            headers={
+                'content-length': str(size),
+                'etag': etag,
+                'last-modified': formatdate(last_modified, usegmt=True),
+                'accept-ranges': 'bytes',
+                **(headers or {}),
+            },
+            media_type=media_type,
+            filename=filename,
+            method=method,
+        )
+        self.path = path
+        self.reader = reader or (lambda first, last: read_file(path, first, last))
+        self.etag = etag
+        self.last_modified = int(last_modified)
+        self.size = size
+        self.stream = stream
+        self.parts: list[tuple[bytes, int, int]] = [(b'', 0, self.size - 1)] if self.size else []
+        self.closing = b''
+
+        if self.is_not_modified(request_headers):
+            self.status_code = 304
+            self.send_header_only = True
+            del self.headers['content-length']
+            return
+
+        ranges = None
+        if 'range' in request_headers and self.is_range_fresh(request_headers):
+            ranges = parse_range(request_headers['range'], self.size)
+        if ranges is None:
+            return
+        if not ranges:
+            self.status_code = 416
+            self.send_header_only = True
+            self.headers['content-range'] = f'bytes */{self.size}'
+            self.headers['content-length'] = '0'
+        elif len(ranges) == 1:
+            first, last = ranges[0]
+            self.status_code = 206
+            self.parts = [(b'', first, last)]
+            self.headers['content-range'] = f'bytes {first}-{last}/{self.size}'
+            self.headers['content-length'] = str(last - first + 1)
+        else:
+            boundary = secrets.token_hex(16)
+            self.status_code = 206
+            self.parts = []
+            for first, last in ranges:
+                head = (
+                    f'--{boundary}\r\ncontent-type: {self.media_type}\r\n'
+                    f'content-range: bytes {first}-{last}/{self.size}\r\n\r\n'
+                ).encode('latin-1')
+                # every part after the first starts on a new line
+                self.parts.append((b'\r\n' + head if self.parts else head, first, last))
+            self.closing = f'\r\n--{boundary}--\r\n'.encode('latin-1')
+            self.headers['content-type'] = f'multipart/byteranges; boundary={boundary}'
+            self.headers['content-length'] = str(
+                sum(len(head) + last - first + 1 for head, first, last in self.parts) + len(self.closing)
+            )
+
+    def is_not_modified(self, request_headers: Headers) -> bool:
+        if if_none_match := request_headers.get('if-none-match'):
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or any(weak_compare(tag, self.etag) for tag in tags)
+        if if_modified_since := request_headers.get('if-modified-since'):
+            try:
+                return self.last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def is_range_fresh(self, request_headers: Headers) -> bool:
+        if not (if_range := request_headers.get('if-range')):
+            return True
+        if if_range.startswith(('"', 'W/')):
+            # If-Range requires the strong comparison function
+            return not self.etag.startswith('W/') and if_range == self.etag
+        try:
+            return self.last_modified == int(parsedate_to_datetime(if_range).timestamp())
+        except (TypeError, ValueError):
+            return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+            if self.send_header_only:
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+            else:
+                await self.send_parts(scope, send)
+        finally:
+            if self.stream is not None:
+                await self.stream.close()
+        if self.background is not None:
+            await self.background()
+
+    def pieces(self, first: int, last: int) -> list[tuple[int, int]]:
+        # a paced zero-copy send goes out a quantum at a time, so it can wait in between
+        if self.stream is None or not self.stream.paced:
+            return [(first, last - first + 1)]
+        step = self.stream.limits.quantum
+        return [(offset, min(step, last + 1 - offset)) for offset in range(first, last + 1, step)]
+
+    async def send_parts(self, scope: Scope, send: Send) -> None:
+        if self.path is not None and ZEROCOPY_SEND in scope.get('extensions', {}):
+            await self.send_parts_zerocopy(send)
+            return
+        for head, first, last in self.parts:
+            if head:
+                await send({'type': 'http.response.body', 'body': head, 'more_body': True})
+            async for chunk in self.reader(first, last):
+                if self.stream is not None:
+                    await self.stream.consume(len(chunk))
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': self.closing, 'more_body': False})
+
+    async def send_parts_zerocopy(self, send: Send) -> None:
+        async with await anyio.open_file(self.path, mode='rb') as file:
+            for head, first, last in self.parts:
+                if head:
+                    await send({'type': 'http.response.body', 'body': head, 'more_body': True})
+                # the server pushes the bytes with os.sendfile, nothing goes through python
+                for offset, count in self.pieces(first, last):
+                    if self.stream is not None:
+                        await self.stream.consume(count)
+                    await send({
+                        'type': ZEROCOPY_SEND,
+                        'file': file.wrapped,
+                        'offset': offset,
+                        'count': count,
+                        'more_body': True,
+                    })
+        await send({'type': 'http.response.body', 'body': self.closing, 'more_body': False})
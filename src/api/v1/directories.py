@@ -0,0 +1,100 @@
+import base64
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from api.v1.routes import valid_path
+from db.db import get_session
+from models.models import User
+from schemas.files import DirectoryInDB, DirectoryListing, FileInDBBase
+from services.directories import DirectoryExists, DirectoryNotFound, InvalidPath, PathTooLong, directory_crud
+from services.usage import usage_crud
+from services.users import current_active_user
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def parse_name_cursor(cursor: str | None) -> str | None:
+    if cursor is None:
+        return None
+    try:
+        return base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+
+
+@router.get(
+    '/files/directory', description='Directory listing', summary='Directory listing', response_model=DirectoryListing
+)
+async def directory_list_handler(
+        path: str = '',
+        limit: int = Query(100, ge=1, le=1000),
+        cursor: str | None = None,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    path = valid_path(path)
+    if path:
+        directory = await directory_crud.get(db, user_id=user.id, path=path)
+        if directory is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Directory not found')
+        totals = DirectoryInDB.from_orm(directory)
+    else:
+        usage = await usage_crud.get(db, user_id=user.id)
+        totals = DirectoryInDB(path='', files=usage.files if usage else 0, size=usage.used if usage else 0)
+
+    after = parse_name_cursor(cursor)
+    files = await directory_crud.files(db, user_id=user.id, path=path, limit=limit + 1, after=after)
+    # subdirectories come with the first page only
+    directories = await directory_crud.children(db, user_id=user.id, path=path) if after is None else []
+    return DirectoryListing(
+        path=totals.path,
+        files=totals.files,
+        size=totals.size,
+        directories=[DirectoryInDB.from_orm(directory) for directory in directories],
+        entries=[FileInDBBase.from_orm(file) for file in files[:limit]],
+        next_cursor=base64.urlsafe_b64encode(files[limit - 1].name.encode()).decode() if len(files) > limit else None
+    )
+
+
+@router.post(
+    '/files/directory/move', description='Move or rename directory', summary='Move or rename directory',
+    response_model=DirectoryInDB
+)
+async def directory_move_handler(
+        path: str,
+        destination: str,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    try:
+        return await directory_crud.move(
+            db, user_id=user.id, path=valid_path(path), destination=valid_path(destination)
+        )
+    except PathTooLong:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail='Path is too long')
+    except InvalidPath:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid destination')
+    except DirectoryNotFound:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Directory not found')
+    except (DirectoryExists, exc.IntegrityError):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Destination already exists')
+
+
+@router.delete(
+    '/files/directory', description='Delete directory', summary='Delete directory', response_model=DirectoryInDB
+)
+async def directory_delete_handler(
+        path: str,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    try:
+        return await directory_crud.delete(db, user_id=user.id, path=valid_path(path))
+    except DirectoryNotFound:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Directory not found')
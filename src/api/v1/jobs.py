@@ -0,0 +1,39 @@
+import logging
+import uuid
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from db.db import get_session
+from models.models import User
+from schemas.files import JobStatus
+from services.jobs import job_crud
+from services.users import current_active_user
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get('/jobs', description='Background jobs of the user', summary='Jobs list', response_model=list[JobStatus])
+async def jobs_list_handler(
+        status_: Literal['queued', 'running', 'done', 'failed'] | None = Query(None, alias='status'),
+        limit: int = Query(100, ge=1, le=1000),
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    return await job_crud.get_multi(db, user_id=user.id, status=status_, limit=limit)
+
+
+@router.get('/jobs/status', description='Background job status', summary='Job status', response_model=JobStatus)
+async def job_status_handler(
+        id_: uuid.UUID,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    job = await job_crud.get(db, id_=id_, user_id=user.id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Job not found')
+    return job
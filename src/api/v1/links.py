@@ -0,0 +1,87 @@
+import datetime
+import logging
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from api.responses import AccelRedirectResponse
+from api.v1.routes import check_rate, checksum_headers, file_response
+from core.config import settings
+from db.db import get_session, release
+from models.models import File, User
+from schemas.files import SharedLink
+from services.blobs import blob_store
+from services.files import storage_key
+from services.hotfiles import hot_files
+from services.limits import transfer_limits
+from services.links import ExpiredLink, InvalidLink, link_signer
+from services.tiers import access_log
+from services.users import current_active_user
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.post(
+    '/files/links', description='Create an expiring download link that needs no login',
+    summary='Create download link', response_model=SharedLink
+)
+async def link_create_handler(
+        id_: uuid.UUID,
+        request: Request,
+        expires_in: int = Query(settings.LINK_TTL, ge=1, le=settings.LINK_MAX_TTL),
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    file_model = await hot_files.file(db, id_)
+    if file_model is None or file_model.user_id != user.id or not file_model.is_downloadable:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='File not found')
+    token, expires = link_signer.sign(file_model.id, user.id, expires_in)
+    return SharedLink(
+        url=str(request.url_for('shared_download_handler', token=token)),
+        expires_at=datetime.datetime.fromtimestamp(expires, datetime.timezone.utc)
+    )
+
+
+def accel_response(request: Request, file_model: File) -> AccelRedirectResponse | None:
+    """Offload to nginx when it can send the stored bytes as they are.
+
+    Not while streams or bytes are limited: nginx would send outside of them.
+    """
+    key = storage_key(file_model)
+    if not settings.ACCEL_REDIRECT or file_model.encoding is not None or transfer_limits.limits_transfers:
+        return None
+    if blob_store.backend.local_path(key) is None:
+        return None
+    if file_model.blob_hash and request.method == 'GET':
+        access_log.record(file_model.blob_hash)
+    # nginx makes up its own validators for files from before the blob store
+    headers = {'etag': f'"{file_model.blob_hash}"'} | checksum_headers(file_model) if file_model.blob_hash else {}
+    return AccelRedirectResponse(
+        f'{settings.ACCEL_REDIRECT.rstrip("/")}/{key}', filename=file_model.name, headers=headers
+    )
+
+
+@router.get('/files/shared/{token}', description='Download by link', summary='Download by link')
+async def shared_download_handler(
+        token: str,
+        request: Request,
+        db: AsyncSession = Depends(get_session)
+):
+    # a forged or expired link is turned away before any query
+    try:
+        link = link_signer.verify(token)
+    except ExpiredLink:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail='Link expired')
+    except InvalidLink:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Invalid link')
+    file_model = await hot_files.file(db, link.file_id)
+    if file_model is None or file_model.user_id != link.user_id or not file_model.is_downloadable:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='File not found')
+    await release(db)
+    # shared downloads count against the owner's transfer limits
+    await check_rate(file_model.user_id)
+    return accel_response(request, file_model) or await file_response(request, file_model, user_id=file_model.user_id)
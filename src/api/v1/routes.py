@@ -1,22 +1,36 @@
+import base64
 import datetime
 import logging
-import os
+import math
 import sys
 import uuid
+from typing import AsyncIterator
 
-import aiofiles
 import asyncpg
-from fastapi import Depends, APIRouter, UploadFile
+from fastapi import Depends, APIRouter, HTTPException, Query, Request
 from sqlalchemy import text, exc
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
-from starlette.responses import FileResponse
+from starlette.responses import StreamingResponse
 
+from api.multipart import MAX_OVERHEAD, MultipartError, MultipartFile
+from api.responses import PacedStreamingResponse, RangeFileResponse, TrustedJSONResponse, accepts_encoding
 from core.config import settings
-from db.db import get_session
-from models.models import User
-from schemas.files import FileCreate, Ping, Files, MemoryUsage
-from services.files import file_crud
+from db.db import get_session, pool_status, release
+from models.models import File, User
+from schemas.files import ArchiveRequest, FileInDBBase, HashUpload, Ping, Files, MemoryUsage
+from services.archives import ArchiveEntry, ArchiveError, TarReader, gunzip, tar_stream, zip_stream
+from services.blobs import StagedBlob, blob_store
+from services.compression import decompress_range
+from services.directories import InvalidPath, join_path, normalize_path
+from services.files import decode_cursor, encode_cursor, file_crud, storage_key
+from services.hotfiles import hot_files, memory_chunks
+from services.ingest import BlobTooLarge
+from services.limits import RateLimited, Stream, transfer_limits
+from services.storage import ObjectStat
+from services.tiers import access_log
+from services.usage import QuotaExceeded, usage_crud
 from services.users import current_active_user
 
 logger = logging.getLogger(__name__)
@@ -28,16 +42,15 @@ router = APIRouter()
 async def ping(db: AsyncSession = Depends(get_session)):
     logger.info('Test ping.')
     db_response_time = await ping_db(db)
-    return Ping(
-        api='v1',
-        python=sys.version_info,
-        db=db_response_time
-    )
+    ping = {'api': 'v1', 'python': sys.version_info, 'db': db_response_time, 'pool': pool_status()}
+    if settings.FAST_JSON:
+        return TrustedJSONResponse(ping)
+    return Ping(**ping)
 
 
 async def ping_db(db):
     logger.info('Test ping dependent services.')
-    statement = text('SELECT version();')
+    statement = text('SELECT 1')
     start = datetime.datetime.now()
     try:
         await db.execute(statement)
@@ -48,65 +61,449 @@ async def ping_db(db):
 
 
 @router.post('/files/', description='Files list', summary='Files list', response_model=Files)
-async def files_list_handler(user: User = Depends(current_active_user), db: AsyncSession = Depends(get_session)):
-    query = await file_crud.get_multi(db=db, user_id=str(user.id))
+async def files_list_handler(
+        limit: int = Query(100, ge=1, le=1000),
+        cursor: str | None = None,
+        path: str | None = None,
+        name: str | None = None,
+        user: User = Depends(current_active_user),
+        db: AsyncSession = Depends(get_session)
+):
+    query = await file_crud.get_page(
+        db=db, limit=limit + 1, user_id=user.id, path=path, name=name, after=parse_cursor(cursor)
+    )
+    next_cursor = encode_cursor(query[limit - 1]) if len(query) > limit else None
+    if settings.FAST_JSON:
+        # the rows carry exactly FileInDBBase's fields, straight from the database
+        return TrustedJSONResponse(
+            {'account_id': str(user.id), 'files': [row._asdict() for row in query[:limit]], 'next_cursor': next_cursor}
+        )
     return Files(
-        files=query,
-        account_id=str(user.id)
+        files=[FileInDBBase.construct(**row._mapping) for row in query[:limit]],
+        account_id=str(user.id),
+        next_cursor=next_cursor
     )
 
 
-@router.post('/files/upload', description='Upload file', summary='Upload file')
+@router.post('/files/stream', description='Files list as NDJSON stream', summary='Files list as NDJSON stream')
+async def files_stream_handler(
+        cursor: str | None = None,
+        path: str | None = None,
+        name: str | None = None,
+        user: User = Depends(current_active_user),
+        db: AsyncSession = Depends(get_session)
+):
+    after = parse_cursor(cursor)
+
+    async def lines():
+        batch = []
+        async for file in file_crud.stream(db=db, user_id=user.id, path=path, name=name, after=after):
+            # rows already hold exactly the schema's fields and types: no validation needed
+            batch.append(FileInDBBase.construct(**file._mapping).json())
+            if len(batch) == 100:
+                yield '\n'.join(batch) + '\n'
+                batch.clear()
+        if batch:
+            yield '\n'.join(batch) + '\n'
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+
+def valid_path(path: str) -> str:
+    try:
+        return short_path(normalize_path(path))
+    except InvalidPath:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid path')
+
+
+def short_path(path: str) -> str:
+    # as long as File.path allows; a longer one fails the insert with a DataError
+    if len(path) > File.path.type.length:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail='Path is too long')
+    return path
+
+
+def valid_name(name: str) -> str:
+    # one path segment, as long as File.name allows
+    if not name or '/' in name or name in ('.', '..') or len(name) > File.name.type.length:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid name')
+    return name
+
+
+def parse_cursor(cursor: str | None):
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+
+
+async def check_quota(db: AsyncSession, user: User) -> None:
+    # cheap early reject before the body is stored; the final check happens on insert
+    if settings.USER_QUOTA is None:
+        return
+    usage = await usage_crud.get(db, user_id=user.id)
+    if usage is not None and usage.used >= settings.USER_QUOTA:
+        logger.error(f'User {user.id} is out of quota.')
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='Storage quota exceeded')
+
+
+def rate_limited(err: RateLimited) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=f'Too many {err.limit}s',
+        headers={'retry-after': str(math.ceil(err.retry_after))}
+    )
+
+
+async def check_rate(user_id: uuid.UUID) -> None:
+    try:
+        await transfer_limits.check_request(user_id)
+    except RateLimited as err:
+        logger.error(f'User {user_id} is over the {err.limit} limit.')
+        raise rate_limited(err)
+
+
+async def open_stream(user_id: uuid.UUID) -> Stream:
+    try:
+        return await transfer_limits.open(user_id)
+    except RateLimited as err:
+        logger.error(f'User {user_id} is over the {err.limit} limit.')
+        raise rate_limited(err)
+
+
+UPLOAD_FORM = {
+    'requestBody': {
+        'required': True,
+        'content': {'multipart/form-data': {'schema': {
+            'type': 'object',
+            'required': ['file'],
+            'properties': {'file': {'type': 'string', 'format': 'binary'}},
+        }}},
+    },
+}
+
+
+@router.post('/files/upload', description='Upload file', summary='Upload file', openapi_extra=UPLOAD_FORM)
 async def upload_file_handler(
-        file: UploadFile,
+        request: Request,
         path: str,
         db: AsyncSession = Depends(get_session),
         user: User = Depends(current_active_user)
 ):
     logger.info('Save file.')
+    await check_rate(user.id)
     id_ = uuid.uuid4()
-    filename = file.filename
-    out_file_path = os.path.join(settings.FILE_FOLDER, f'{id_}.{filename.split(".")[-1]}')
-    file_path = rf'{path}/{filename}'
-    size = 0
-
-    async with aiofiles.open(out_file_path, 'wb') as out_file:
-        while content := await file.read(2 ** 16):
-            size += len(content)  # async read chunk
-            if size > settings.MAX_FILE_SIZE:
-                logger.error(f'File {id_} is too large.')
-                return status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
-            await out_file.write(content)  # async write chunk
-
-    obj_in = FileCreate(
-        id=id_,
-        path=file_path,
-        name=file.filename,
+    content_length = request.headers.get('content-length', '')
+    if content_length.isdigit() and int(content_length) > settings.MAX_FILE_SIZE + MAX_OVERHEAD:
+        logger.error(f'File {id_} is too large.')
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='File is too large')
+    directory = valid_path(path)
+    await check_quota(db, user)
+    user_id = user.id
+    # give the connection back to the pool while the body streams in
+    await db.rollback()
+
+    stream = await open_stream(user_id)
+    try:
+        # the body goes from the socket to the blob store, it is not spooled by the form parser first
+        upload = MultipartFile(stream.chunks(request.stream()), request.headers.get('content-type', ''))
+        filename = valid_name(await upload.open())
+        file_path = short_path(join_path(directory, filename))
+        staged = await blob_store.stage(upload.chunks(), settings.MAX_FILE_SIZE)
+    except MultipartError as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+    except BlobTooLarge:
+        logger.error(f'File {id_} is too large.')
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='File is too large')
+    finally:
+        await stream.close()
+
+    try:
+        db_obj = await file_crud.create_from_blob(
+            db=db, staged=staged, id_=id_, name=filename, path=file_path, user_id=user_id
+        )
+    except QuotaExceeded:
+        logger.error(f'User {user_id} is out of quota.')
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='Storage quota exceeded')
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='File already exists')
+    return db_obj
+
+
+BATCH_FORM = {
+    'requestBody': {
+        'required': True,
+        'content': {
+            'multipart/form-data': {'schema': {
+                'type': 'object',
+                'properties': {'files': {'type': 'array', 'items': {'type': 'string', 'format': 'binary'}}},
+            }},
+            'application/x-tar': {'schema': {'type': 'string', 'format': 'binary'}},
+            'application/gzip': {'schema': {'type': 'string', 'format': 'binary'}},
+        },
+    },
+}
+TAR_TYPES = ('application/x-tar', 'application/tar')
+GZIP_TYPES = ('application/gzip', 'application/x-gzip', 'application/x-gtar')
+
+
+def batch_entries(request: Request, stream: Stream) -> AsyncIterator[tuple[str, AsyncIterator[bytes]]]:
+    content_type = request.headers.get('content-type', '')
+    media_type = content_type.partition(';')[0].strip().lower()
+    body = stream.chunks(request.stream())
+    if media_type == 'multipart/form-data':
+        return MultipartFile(body, content_type, field=None).files()
+    if media_type in TAR_TYPES:
+        return TarReader(body).entries()
+    if media_type in GZIP_TYPES:
+        return TarReader(gunzip(body)).entries()
+    raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail='Expected multipart or tar')
+
+
+async def stage_entries(request: Request, directory: str, stream: Stream) -> list[tuple[str, StagedBlob]]:
+    """Stage every file of a multipart or tar body as (path, blob); all or nothing."""
+    entries = batch_entries(request, stream)
+    staged, paths = [], set()
+    try:
+        async for name, chunks in entries:
+            if len(staged) == settings.MAX_BATCH_FILES:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='Too many files')
+            # names may carry a relative path, as folder uploads and archives do
+            path = short_path(join_path(directory, valid_path(name)))
+            if path == directory:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid path')
+            valid_name(path.rpartition('/')[2])
+            if path in paths:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f'Duplicate file {name}')
+            paths.add(path)
+            staged.append((path, await blob_store.stage(chunks, settings.MAX_FILE_SIZE)))
+    except BaseException as err:
+        for _, blob in staged:
+            await blob_store.discard(blob.tmp_path)
+        if isinstance(err, (MultipartError, ArchiveError)):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+        if isinstance(err, BlobTooLarge):
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='File is too large')
+        raise
+    return staged
+
+
+@router.post(
+    '/files/upload/batch', description='Upload many files as multipart parts or a tar archive',
+    summary='Upload many files', response_model=list[FileInDBBase], openapi_extra=BATCH_FORM
+)
+async def upload_batch_handler(
+        request: Request,
+        path: str,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    logger.info('Save files.')
+    await check_rate(user.id)
+    directory = valid_path(path)
+    await check_quota(db, user)
+    user_id = user.id
+    await db.rollback()
+
+    stream = await open_stream(user_id)
+    try:
+        staged = await stage_entries(request, directory, stream)
+    finally:
+        await stream.close()
+    try:
+        files = await file_crud.create_many_from_blobs(db=db, staged=staged, user_id=user_id)
+    except QuotaExceeded:
+        logger.error(f'User {user_id} is out of quota.')
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='Storage quota exceeded')
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='File already exists')
+    logger.info(f'Saved {len(files)} files.')
+    return files
+
+
+@router.post(
+    '/files/upload/by-hash', description='Store a file from content the server already has, without its body',
+    summary='Upload file by hash', response_model=FileInDBBase
+)
+async def upload_by_hash_handler(
+        upload: HashUpload,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    await check_rate(user.id)
+    logger.info(f'Save file by hash {upload.sha256}.')
+    valid_name(upload.name)
+    path = short_path(join_path(valid_path(upload.path), upload.name))
+    await check_quota(db, user)
+    user_id = user.id
+    try:
+        db_obj = await file_crud.create_from_existing(
+            db=db, sha256=upload.sha256, size=upload.size, id_=uuid.uuid4(), name=upload.name,
+            path=path, user_id=user_id
+        )
+    except QuotaExceeded:
+        logger.error(f'User {user_id} is out of quota.')
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='Storage quota exceeded')
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='File already exists')
+    if db_obj is None:
+        # the client falls back to a regular upload
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Content not found')
+    return db_obj
+
+
+def checksum_headers(file_model: File) -> dict[str, str]:
+    """Digests of the decoded content, for responses that send it as it is."""
+    headers = {}
+    if file_model.blob_hash:
+        digest = base64.b64encode(bytes.fromhex(file_model.blob_hash)).decode()
+        headers['repr-digest'] = f'sha-256=:{digest}:'
+        # the RFC 3230 header that RFC 9530 replaces, still what most clients check
+        headers['digest'] = f'sha-256={digest}'
+    if file_model.xxh3:
+        headers['x-checksum-xxh3'] = file_model.xxh3
+    return headers
+
+
+async def stored_content(file_model: File, key: str) -> tuple[bytes | None, ObjectStat | None]:
+    """The stored bytes when they are small enough to be cached, and the storage stat unless they were cached."""
+    # blobs are content-addressed, so they can be served from memory; older files can't
+    if file_model.blob_hash and (content := await hot_files.content(key)) is not None:
+        return content, None
+    stat = await blob_store.backend.stat(key)
+    if stat is None:
+        logger.error(f'Content of file {file_model.id} is missing.')
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='File content not found')
+    if file_model.blob_hash and stat.size <= hot_files.max_blob:
+        return await hot_files.load(key, blob_store.backend), stat
+    return None, stat
+
+
+async def file_response(request: Request, file_model: File, *, user_id: uuid.UUID) -> RangeFileResponse:
+    """The download, paced and counted against the transfer limits of `user_id`."""
+    key = storage_key(file_model)
+    content, stat = await stored_content(file_model, key)
+    if file_model.blob_hash and request.method == 'GET':
+        access_log.record(file_model.blob_hash)
+    if file_model.blob_hash:
+        etag = f'"{file_model.blob_hash}"'
+    else:
+        etag = f'W/"{stat.size:x}-{int(stat.modified):x}"'
+
+    if content is not None:
+        path, size, modified = None, len(content), 0.0
+
+        def source(first: int = 0, last: int | None = None):
+            return memory_chunks(content, first, last)
+    else:
+        path, size, modified = blob_store.backend.local_path(key), stat.size, stat.modified
+
+        def source(first: int = 0, last: int | None = None):
+            return blob_store.backend.read(key, first, last)
+
+    reader, headers, encoding = source, {}, file_model.encoding
+    if encoding is not None:
+        headers['vary'] = 'accept-encoding'
+        if accepts_encoding(request.headers.get('accept-encoding', ''), encoding):
+            # the stored bytes are sent as they are; ranges then apply to the encoded representation
+            headers['content-encoding'] = encoding
+            etag = f'"{file_model.blob_hash}-{encoding}"'
+        else:
+            path, size = None, file_model.size
+
+            def reader(first: int, last: int):
+                return decompress_range(source(), encoding, first, last)
+    if 'content-encoding' not in headers:
+        headers.update(checksum_headers(file_model))
+
+    # taken last: the response closes the stream, nothing may raise between the two
+    stream = await open_stream(user_id)
+    return RangeFileResponse(
+        path,
+        request_headers=request.headers,
+        method=request.method,
         size=size,
-        user_id=user.id,
-        is_downloadable=True
+        etag=etag,
+        last_modified=file_model.created_at.timestamp() if file_model.created_at else modified,
+        reader=reader,
+        filename=file_model.name,
+        headers=headers,
+        stream=stream
     )
-    db_obj = await file_crud.create(db=db, obj_in=obj_in)
-    return db_obj
 
 
 @router.get('/files/download', description='Download file', summary='Download file')
 async def download_file_handler(
         id_: uuid.UUID,
+        request: Request,
         db: AsyncSession = Depends(get_session),
         user: User = Depends(current_active_user)
 ):
     logger.info(f'Download file {id_}.')
-    query = await file_crud.get_multi(db=db, id=id_, is_downloadable=True)
-    if not query:
+    await check_rate(user.id)
+    # hot files are served without a query
+    file_model = await hot_files.file(db, id_)
+    if file_model is None or file_model.user_id != user.id or not file_model.is_downloadable:
         logger.error(f'File {id_} not found.')
-        return status.HTTP_404_NOT_FOUND
-    file_model = query[0]
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='File not found')
+    # the body may stream for minutes, it doesn't need a connection
+    await release(db)
+    return await file_response(request, file_model, user_id=user.id)
+
 
-    return FileResponse(
-        rf'{settings.FILE_FOLDER}{id_}.{file_model.name.split(".")[-1]}',
-        media_type='application/octet-stream',
-        filename=file_model.name
+@router.get('/files/download/path', description='Download file by path', summary='Download file by path')
+async def download_by_path_handler(
+        path: str,
+        request: Request,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    logger.info(f'Download file {path}.')
+    await check_rate(user.id)
+    file_model = await file_crud.get_by_path(db=db, user_id=user.id, path=valid_path(path))
+    if file_model is None or not file_model.is_downloadable:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='File not found')
+    await release(db)
+    return await file_response(request, file_model, user_id=user.id)
+
+
+@router.post('/files/archive', description='Download files as archive', summary='Download files as archive')
+async def archive_handler(
+        archive: ArchiveRequest,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    if bool(archive.ids) == (archive.directory is not None):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Pass either ids or directory')
+    if len(archive.ids) > settings.MAX_ARCHIVE_IDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Too many files')
+    directory = valid_path(archive.directory) if archive.directory is not None else None
+    logger.info(f'Archive {len(archive.ids)} files or directory {directory!r}.')
+    await check_rate(user.id)
+
+    async def entries():
+        async for file in file_crud.stream_selection(db=db, user_id=user.id, ids=archive.ids, directory=directory):
+            yield ArchiveEntry(
+                name=file.path[len(directory) + 1:] if directory else file.path,
+                key=storage_key(file),
+                size=file.size,
+                modified=file.created_at,
+                encoding=file.encoding
+            )
+
+    content = (zip_stream if archive.format == 'zip' else tar_stream)(entries(), blob_store.backend)
+    # taken last: the response closes the stream
+    stream = await open_stream(user.id)
+    return PacedStreamingResponse(
+        content,
+        stream=stream,
+        media_type='application/zip' if archive.format == 'zip' else 'application/x-tar',
+        headers={'content-disposition': f'attachment; filename="files.{archive.format}"'}
     )
 
 
@@ -116,10 +513,8 @@ async def usage_memory(
         user: User = Depends(current_active_user)
 ):
     logger.info('Get usage memory.')
-    query = await file_crud.get_multi(db=db, user_id=str(user.id))
-
-    return MemoryUsage(  # если response_model в декораторе указан, то тут не обязательно оборачивать в модель
-        # pydantic, валидация работает и так
-        files=len(query),
-        used=sum([file.size for file in query])
-    )
+    usage = await usage_crud.get(db, user_id=user.id)
+    memory = {'files': usage.files, 'used': usage.used} if usage is not None else {'files': 0, 'used': 0}
+    if settings.FAST_JSON:
+        return TrustedJSONResponse(memory)
+    return MemoryUsage(**memory)
@@ -0,0 +1,82 @@
+import logging
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from core.config import settings
+from db.db import get_session
+from models.models import User
+from schemas.files import DeletedFileInDB, DeleteRequest, FileInDBBase
+from services.files import file_crud
+from services.trash import trash_crud
+from services.usage import QuotaExceeded
+from services.users import current_active_user
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.delete('/files', description='Delete file', summary='Delete file', response_model=DeletedFileInDB)
+async def delete_file_handler(
+        id_: uuid.UUID,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    logger.info(f'Delete file {id_}.')
+    deleted = await file_crud.delete_many(db, user_id=user.id, ids=[id_])
+    if not deleted:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='File not found')
+    return deleted[0]
+
+
+@router.post(
+    '/files/delete', description='Delete many files; ids that are not found are skipped',
+    summary='Delete files', response_model=list[DeletedFileInDB]
+)
+async def delete_files_handler(
+        request: DeleteRequest,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    if len(request.ids) > settings.MAX_BATCH_FILES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Too many files')
+    logger.info(f'Delete {len(request.ids)} files.')
+    return await file_crud.delete_many(db, user_id=user.id, ids=request.ids)
+
+
+@router.get(
+    '/files/trash', description='Deleted files that can still be restored', summary='Deleted files',
+    response_model=list[DeletedFileInDB]
+)
+async def trash_list_handler(
+        limit: int = Query(100, ge=1, le=1000),
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    return await trash_crud.get_multi(db, user_id=user.id, retention=settings.TRASH_RETENTION, limit=limit)
+
+
+@router.post(
+    '/files/trash/restore', description='Restore a deleted file', summary='Restore file', response_model=FileInDBBase
+)
+async def restore_file_handler(
+        id_: uuid.UUID,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    logger.info(f'Restore file {id_}.')
+    try:
+        file = await file_crud.restore(db, user_id=user.id, id_=id_, retention=settings.TRASH_RETENTION)
+    except QuotaExceeded:
+        logger.error(f'User {user.id} is out of quota.')
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='Storage quota exceeded')
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='File already exists')
+    if file is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='File not found')
+    return file
@@ -0,0 +1,203 @@
+import logging
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Request
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from api.v1.routes import check_quota, check_rate, open_stream, short_path, valid_name, valid_path
+from core.config import settings
+from db.db import get_session
+from models.models import File, Upload, User
+from schemas.files import FileInDBBase, UploadInDB, UploadPart, UploadStatus
+from services.blobs import blob_store
+from services.directories import join_path
+from services.files import file_crud
+from services.ingest import BlobTooLarge
+from services.uploads import part_store, upload_crud
+from services.usage import QuotaExceeded, usage_crud
+from services.users import current_active_user
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+async def get_upload(db: AsyncSession, upload_id: uuid.UUID, user: User, lock=False):
+    upload = await upload_crud.get(db=db, id_=upload_id, user_id=user.id, lock=lock)
+    if upload is None:
+        logger.error(f'Upload {upload_id} not found.')
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Upload not found')
+    return upload
+
+
+async def pending_upload(db: AsyncSession, upload_id: uuid.UUID, user: User, lock=False) -> Upload:
+    """An upload that still takes parts: not gone, and not being completed."""
+    upload = await get_upload(db, upload_id, user, lock=lock)
+    if upload.completing:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Upload is being completed')
+    return upload
+
+
+async def check_parts(db: AsyncSession, upload_id: uuid.UUID, number: int, size: int, user: User) -> None:
+    """Reject a part that takes the upload over the size limit or the user over quota."""
+    total = size + sum(
+        part_size for part_number, part_size in (await part_store.parts(upload_id)).items() if part_number != number
+    )
+    if total > settings.MAX_UPLOAD_SIZE:
+        logger.error(f'Upload {upload_id} is too large.')
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='File is too large')
+    if settings.USER_QUOTA is None:
+        return
+    usage = await usage_crud.get(db, user_id=user.id)
+    if (usage.used if usage is not None else 0) + total > settings.USER_QUOTA:
+        logger.error(f'User {user.id} is out of quota.')
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='Storage quota exceeded')
+
+
+@router.post(
+    '/files/uploads', description='Start resumable upload', summary='Start resumable upload',
+    response_model=UploadInDB, status_code=status.HTTP_201_CREATED
+)
+async def upload_create_handler(
+        name: str,
+        path: str,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    await check_rate(user.id)
+    path = valid_path(path)
+    short_path(join_path(path, valid_name(name)))
+    upload = await upload_crud.create(db=db, name=name, path=path, user_id=user.id)
+    logger.info(f'Upload {upload.id} started.')
+    return upload
+
+
+@router.put(
+    '/files/uploads/{upload_id}/parts/{number}', description='Upload part', summary='Upload part',
+    response_model=UploadPart
+)
+async def upload_part_handler(
+        upload_id: uuid.UUID,
+        request: Request,
+        number: int = Path(ge=1, le=settings.MAX_UPLOAD_PARTS),
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    await check_rate(user.id)
+    await pending_upload(db, upload_id, user)
+    await check_quota(db, user)
+    # give the connection back to the pool while the part body streams in
+    await db.rollback()
+    stream = await open_stream(user.id)
+    try:
+        tmp_path, size = await part_store.stage(
+            upload_id, number, stream.chunks(request.stream()), settings.MAX_UPLOAD_PART_SIZE
+        )
+    except BlobTooLarge:
+        logger.error(f'Part {number} of upload {upload_id} is too large.')
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='Part is too large')
+    finally:
+        await stream.close()
+    try:
+        # under the row lock a completion or abort either saw this part or already removed the upload
+        await pending_upload(db, upload_id, user, lock=True)
+        await check_parts(db, upload_id, number, size, user)
+        await part_store.publish(upload_id, number, tmp_path)
+    except HTTPException as err:
+        await part_store.discard(tmp_path)
+        if err.status_code == status.HTTP_404_NOT_FOUND:
+            await part_store.remove(upload_id)
+        raise
+    finally:
+        await db.rollback()
+    return UploadPart(number=number, size=size)
+
+
+@router.get(
+    '/files/uploads/{upload_id}', description='Resumable upload status', summary='Resumable upload status',
+    response_model=UploadStatus
+)
+async def upload_status_handler(
+        upload_id: uuid.UUID,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    upload = await get_upload(db, upload_id, user)
+    parts = await part_store.parts(upload_id)
+    return UploadStatus(
+        id=upload.id,
+        name=upload.name,
+        path=upload.path,
+        created_at=upload.created_at,
+        parts=[UploadPart(number=number, size=size) for number, size in parts.items()]
+    )
+
+
+async def claim_upload(db: AsyncSession, upload_id: uuid.UUID, user: User) -> Upload:
+    upload = await upload_crud.claim(db, upload_id, user_id=user.id)
+    if upload is None:
+        await get_upload(db, upload_id, user)
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Upload is being completed')
+    return upload
+
+
+async def complete_upload(db: AsyncSession, upload: Upload, user: User) -> tuple[File, dict[int, int]]:
+    parts = await part_store.parts(upload.id)
+    if not parts or list(parts) != list(range(1, len(parts) + 1)):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Upload has missing parts')
+    if sum(parts.values()) > settings.MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='File is too large')
+
+    staged = await blob_store.assemble([part_store.path(upload.id, number) for number in parts])
+    await upload_crud.delete(db=db, id_=upload.id)
+    try:
+        db_obj = await file_crud.create_from_blob(
+            db=db, staged=staged, id_=upload.id, name=upload.name, path=join_path(upload.path, upload.name),
+            user_id=user.id
+        )
+    except QuotaExceeded:
+        logger.error(f'User {user.id} is out of quota.')
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='Storage quota exceeded')
+    except IntegrityError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='File already exists')
+    return db_obj, parts
+
+
+@router.post(
+    '/files/uploads/{upload_id}/complete', description='Complete resumable upload',
+    summary='Complete resumable upload', response_model=FileInDBBase
+)
+async def upload_complete_handler(
+        upload_id: uuid.UUID,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    await check_rate(user.id)
+    upload = await claim_upload(db, upload_id, user)
+    # the parts are assembled without a transaction or a pooled connection held
+    try:
+        db_obj, parts = await complete_upload(db, upload, user)
+    except BaseException:
+        await db.rollback()
+        await upload_crud.unclaim(db, id_=upload_id)
+        raise
+    await part_store.remove(upload_id)
+    logger.info(f'Upload {upload_id} completed with {len(parts)} parts.')
+    return db_obj
+
+
+@router.delete(
+    '/files/uploads/{upload_id}', description='Abort resumable upload', summary='Abort resumable upload',
+    status_code=status.HTTP_204_NO_CONTENT
+)
+async def upload_abort_handler(
+        upload_id: uuid.UUID,
+        db: AsyncSession = Depends(get_session),
+        user: User = Depends(current_active_user)
+):
+    await pending_upload(db, upload_id, user, lock=True)
+    await upload_crud.delete(db=db, id_=upload_id)
+    await db.commit()
+    await part_store.remove(upload_id)
@@ -0,0 +1,57 @@
+"""Authenticated requests/sec and queries per request: user lookup on every request vs cache vs trusted claims.
+
+    python src/benchmarks/auth.py --requests 2000 --concurrency 20
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+sys.path.append('src')
+
+from httpx import AsyncClient
+
+from benchmarks.suite import auth_headers, counted_queries, drive, patched, throwaway_user
+from core.config import settings
+from main import app
+from services.users import user_cache
+
+SCENARIOS = {
+    'lookup': {'USER_CACHE_TTL': 0, 'AUTH_TRUST_CLAIMS': 0},
+    'cache': {'USER_CACHE_TTL': 30, 'AUTH_TRUST_CLAIMS': 0},
+    'claims': {'USER_CACHE_TTL': 30, 'AUTH_TRUST_CLAIMS': 60},
+}
+
+
+async def run(client: AsyncClient, name: str, credentials: dict, requests: int, concurrency: int) -> dict:
+    with patched(settings, **SCENARIOS[name]), patched(user_cache, ttl=SCENARIOS[name]['USER_CACHE_TTL']):
+        user_cache.clear()
+        headers = await auth_headers(client, credentials)
+
+        async def send(_):
+            response = await client.get('/v1/user/status', headers=headers)
+            response.raise_for_status()
+
+        with counted_queries() as queries:
+            elapsed, _ = await drive(send, requests, concurrency)
+    user_queries = sum(count for statement, count in queries.items() if 'FROM "user"' in statement)
+    return {
+        'scenario': name,
+        'requests': requests,
+        'requests_per_sec': round(requests / elapsed, 1),
+        'queries_per_request': round(queries.total() / requests, 3),
+        'user_queries_per_request': round(user_queries / requests, 3),
+    }
+
+
+async def main(args) -> None:
+    async with AsyncClient(app=app, base_url='http://bench') as client, throwaway_user(client) as credentials:
+        for name in SCENARIOS:
+            print(json.dumps(await run(client, name, credentials, args.requests, args.concurrency)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,79 @@
+"""Uploading many small files: one request per file vs one batch request (multipart and tar).
+
+    python src/benchmarks/batch.py --files 1000 --size 2048
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+
+sys.path.append('src')
+
+from httpx import AsyncClient
+
+from benchmarks.suite import auth_headers, counted_queries, throwaway_user
+from main import app
+
+
+def contents(files: int, size: int) -> list[tuple[str, bytes]]:
+    return [(f'{n}.bin', os.urandom(size)) for n in range(files)]
+
+
+def tar(files: list[tuple[str, bytes]]) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as archive:
+        for name, content in files:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+async def single(client: AsyncClient, files: list[tuple[str, bytes]]) -> None:
+    for name, content in files:
+        response = await client.post('/v1/files/upload', params={'path': 'single'}, files={'file': (name, content)})
+        response.raise_for_status()
+
+
+async def multipart(client: AsyncClient, files: list[tuple[str, bytes]]) -> None:
+    response = await client.post(
+        '/v1/files/upload/batch', params={'path': 'multipart'}, files=[('files', file) for file in files]
+    )
+    response.raise_for_status()
+
+
+async def tar_archive(client: AsyncClient, files: list[tuple[str, bytes]]) -> None:
+    response = await client.post(
+        '/v1/files/upload/batch', params={'path': 'tar'}, content=tar(files),
+        headers={'content-type': 'application/x-tar'}
+    )
+    response.raise_for_status()
+
+
+async def main(args) -> None:
+    async with AsyncClient(app=app, base_url='http://bench', timeout=600) as client:
+        async with throwaway_user(client) as credentials:
+            client.headers.update(await auth_headers(client, credentials))
+            for name, scenario in (('single', single), ('multipart', multipart), ('tar', tar_archive)):
+                files = contents(args.files, args.size)
+                with counted_queries() as queries:
+                    start = time.perf_counter()
+                    await scenario(client, files)
+                    elapsed = time.perf_counter() - start
+                print(json.dumps({
+                    'scenario': name,
+                    'files': args.files,
+                    'files_per_sec': round(args.files / elapsed, 1),
+                    'queries_per_file': round(queries.total() / args.files, 3),
+                }))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--size', type=int, default=2048)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,76 @@
+"""Duplicate-heavy upload workload: plain per-upload files vs the content-addressed blob store.
+
+    python src/benchmarks/blob_store.py --uploads 500 --distinct 5 --size 1048576
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.append('src')
+
+import aiofiles
+
+from services.blobs import BlobStore
+from services.storage import LocalStorage
+
+CHUNK = 2 ** 16
+
+
+async def chunks(payload: bytes):
+    for start in range(0, len(payload), CHUNK):
+        yield payload[start:start + CHUNK]
+
+
+def disk_usage(root: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        total += sum(os.stat(os.path.join(dirpath, name)).st_blocks * 512 for name in filenames)
+    return total
+
+
+async def plain(root: str, payloads: list[bytes]) -> None:
+    for payload in payloads:
+        async with aiofiles.open(os.path.join(root, f'{uuid.uuid4()}.bin'), 'wb') as out_file:
+            async for chunk in chunks(payload):
+                await out_file.write(chunk)
+
+
+async def content_addressed(root: str, payloads: list[bytes]) -> None:
+    store = BlobStore(root, LocalStorage(root))
+    for payload in payloads:
+        staged = await store.stage(chunks(payload), max_size=len(payload))
+        await store.publish(staged)
+
+
+async def run(name, scenario, payloads: list[bytes]) -> dict:
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        await scenario(root, payloads)
+        elapsed = time.perf_counter() - start
+        return {
+            'scenario': name,
+            'uploads': len(payloads),
+            'seconds': round(elapsed, 3),
+            'uploads_per_sec': round(len(payloads) / elapsed, 1),
+            'disk_bytes': disk_usage(root),
+        }
+
+
+async def main(args) -> None:
+    distinct = [os.urandom(args.size) for _ in range(args.distinct)]
+    payloads = [distinct[i % args.distinct] for i in range(args.uploads)]
+    for name, scenario in (('plain', plain), ('content_addressed', content_addressed)):
+        print(json.dumps(await run(name, scenario, payloads)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uploads', type=int, default=200)
+    parser.add_argument('--distinct', type=int, default=5)
+    parser.add_argument('--size', type=int, default=1024 * 1024)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,130 @@
+"""Disk savings and CPU cost per GB of the upload compression stage, per content type and codec.
+
+    python src/benchmarks/compression.py --size 67108864 --workers 4
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append('src')
+
+from core.config import settings
+from services import compression
+
+GB = 1024 ** 3
+
+
+def corpus(kind: str, size: int) -> bytes:
+    rows, total, n = [], 0, 0
+    levels = ('INFO', 'INFO', 'INFO', 'WARNING', 'ERROR')
+    while total < size:
+        if kind == 'log':
+            row = f'2026-10-18 12:{n // 60 % 60:02d}:{n % 60:02d} {random.choice(levels)} ' \
+                  f'GET /v1/files/{random.getrandbits(64):x} {random.choice((200, 200, 206, 304, 404))} ' \
+                  f'{random.randint(1, 900)}ms\n'
+        elif kind == 'csv':
+            row = f'{n},{random.getrandbits(32)},{random.random():.6f},user{random.randint(1, 500)},{n % 7 == 0}\n'
+        else:
+            row = json.dumps({'id': n, 'name': f'file-{n}.txt', 'size': random.randint(1, 10 ** 9),
+                              'tags': random.sample(['a', 'b', 'c', 'd', 'e'], 2)}) + '\n'
+        rows.append(row.encode())
+        total += len(rows[-1])
+        n += 1
+    return b''.join(rows)[:size]
+
+
+def payloads(size: int) -> dict[str, bytes]:
+    log = corpus('log', size)
+    return {
+        'log': log,
+        'csv': corpus('csv', size),
+        'json': corpus('json', size),
+        'random': os.urandom(size),
+        'gzipped': gzip.compress(log)[:size],
+    }
+
+
+def measure(path: str, payload: bytes) -> dict:
+    encoding = compression.sniff_file(path, len(payload))
+    result = {'encoding': encoding, 'size': len(payload), 'stored_size': len(payload)}
+    if encoding is None:
+        return result
+    start = time.process_time()
+    stored_size = compression.compress_file(path, f'{path}.{encoding}', encoding)
+    compress_cpu = time.process_time() - start
+
+    with open(f'{path}.{encoding}', 'rb') as file:
+        encoded = file.read()
+    decompress = compression.decompressor(encoding)
+    start = time.process_time()
+    for offset in range(0, len(encoded), compression.CHUNK_SIZE):
+        decompress.decompress(encoded[offset:offset + compression.CHUNK_SIZE])
+    decompress_cpu = time.process_time() - start
+    return result | {
+        'stored_size': stored_size,
+        'ratio': round(len(payload) / stored_size, 2),
+        'compress_cpu_sec_per_gb': round(compress_cpu * GB / len(payload), 2),
+        'decompress_cpu_sec_per_gb': round(decompress_cpu * GB / len(payload), 2),
+    }
+
+
+async def pool_throughput(root: str, payload: bytes, uploads: int, encoding: str) -> dict:
+    """Concurrent uploads through the worker pool, with the event loop lag they cause."""
+    paths = []
+    for n in range(uploads):
+        paths.append(os.path.join(root, f'pool-{n}'))
+        with open(paths[-1], 'wb') as file:
+            file.write(payload)
+    lags = []
+
+    async def probe():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - start - 0.01)
+
+    probe_task = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(compression.compress(path, encoding) for path in paths))
+    elapsed = time.perf_counter() - start
+    probe_task.cancel()
+    return {
+        'scenario': 'worker_pool',
+        'encoding': encoding,
+        'workers': settings.COMPRESSION_WORKERS,
+        'uploads': uploads,
+        'mb_per_sec': round(len(payload) * uploads / elapsed / 1024 ** 2, 1),
+        'max_loop_lag_ms': round(max(lags, default=0) * 1000, 2),
+    }
+
+
+async def main(args) -> None:
+    settings.COMPRESSION_WORKERS = args.workers
+    compression.executor = ThreadPoolExecutor(max_workers=args.workers)
+    with tempfile.TemporaryDirectory() as root:
+        for kind, payload in payloads(args.size).items():
+            path = os.path.join(root, kind)
+            with open(path, 'wb') as file:
+                file.write(payload)
+            for codec in ('zstd', 'gzip'):
+                settings.COMPRESSION = codec
+                result = measure(path, payload)
+                savings = 1 - result['stored_size'] / result['size']
+                print(json.dumps({'content': kind, 'codec': codec, 'disk_savings': round(savings, 3)} | result))
+        settings.COMPRESSION = 'zstd'
+        print(json.dumps(await pool_throughput(root, corpus('log', args.size), args.uploads, 'zstd')))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=1024 * 1024 * 16)
+    parser.add_argument('--uploads', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=settings.COMPRESSION_WORKERS)
+    asyncio.run(main(parser.parse_args()))
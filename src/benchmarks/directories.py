@@ -0,0 +1,76 @@
+"""Directory listing for a folder of N files: directory index vs scanning the files table.
+
+    python src/benchmarks/directories.py --files 100000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.append('src')
+
+from sqlalchemy import func, insert, select
+
+from benchmarks.suite import seeded_user
+from db.db import async_session, dispose_engine, init_engine
+from models.models import Base, File
+from services.directories import directory_crud
+
+
+async def seed(user_id: uuid.UUID, count: int) -> None:
+    async with async_session() as db:
+        for start in range(0, count, 10000):
+            rows = [
+                {'id': uuid.uuid4(), 'user_id': user_id, 'name': f'{index:07d}.log', 'size': index,
+                 'path': f'{user_id}/logs/{index:07d}.log', 'directory': f'{user_id}/logs'}
+                for index in range(start, min(start + 10000, count))
+            ]
+            await db.execute(insert(File.__table__), rows)
+        await db.commit()
+        await directory_crud.rebuild(db)
+
+
+async def indexed(db, user_id: uuid.UUID) -> None:
+    path = f'{user_id}/logs'
+    await directory_crud.get(db, user_id=user_id, path=path)
+    await directory_crud.files(db, user_id=user_id, path=path, limit=100)
+
+
+async def scan(db, user_id: uuid.UUID) -> None:
+    prefix = File.path.startswith(f'{user_id}/logs/', autoescape=True)
+    await db.execute(select(func.count(), func.sum(File.size)).where(File.user_id == user_id, prefix))
+    await db.execute(select(File).where(File.user_id == user_id, prefix).order_by(File.name))
+
+
+async def measure(name: str, query, user_id: uuid.UUID, repeat: int) -> dict:
+    samples = []
+    async with async_session() as db:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await query(db, user_id)
+            samples.append(time.perf_counter() - start)
+            db.expunge_all()
+    return {'scenario': name, 'median_ms': round(statistics.median(samples) * 1000, 3),
+            'max_ms': round(max(samples) * 1000, 3)}
+
+
+async def main(args) -> None:
+    async with init_engine().begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    try:
+        async with seeded_user() as user_id:
+            await seed(user_id, args.files)
+            for name, query in (('directory_index', indexed), ('prefix_scan', scan)):
+                print(json.dumps({'files': args.files} | await measure(name, query, user_id, args.repeat)))
+    finally:
+        await dispose_engine()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,90 @@
+"""Partial and repeat downloads: plain FileResponse vs RangeFileResponse.
+
+    python src/benchmarks/downloads.py --size 10485760 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append('src')
+
+from httpx import AsyncClient
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import FileResponse
+from starlette.routing import Route
+
+from api.responses import RangeFileResponse
+
+
+def build_app(path: str) -> Starlette:
+    stat_result = os.stat(path)
+
+    async def plain(request: Request):
+        return FileResponse(path, media_type='application/octet-stream', filename='bench.bin')
+
+    async def ranged(request: Request):
+        return RangeFileResponse(
+            path,
+            request_headers=request.headers,
+            method=request.method,
+            size=stat_result.st_size,
+            etag='"bench"',
+            last_modified=stat_result.st_mtime,
+            filename='bench.bin'
+        )
+
+    return Starlette(routes=[Route('/plain', plain), Route('/ranged', ranged)])
+
+
+def percentile(samples: list[float], q: int) -> float:
+    return round(statistics.quantiles(samples, n=100)[q - 1] * 1000, 3)
+
+
+async def run(client: AsyncClient, url: str, scenario: str, size: int, requests: int) -> dict:
+    latencies = []
+    received = 0
+    etag = None
+    for _ in range(requests):
+        headers = {}
+        if scenario == 'seek':
+            start = random.randrange(0, size - 2 ** 16)
+            headers['range'] = f'bytes={start}-{start + 2 ** 16 - 1}'
+        elif scenario == 'repeat' and etag:
+            headers['if-none-match'] = etag
+        begin = time.perf_counter()
+        response = await client.get(url, headers=headers)
+        latencies.append(time.perf_counter() - begin)
+        received += len(response.content)
+        etag = response.headers.get('etag')
+    return {
+        'handler': url.strip('/'),
+        'scenario': scenario,
+        'requests': requests,
+        'bytes_received': received,
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+    }
+
+
+async def main(args) -> None:
+    with tempfile.NamedTemporaryFile() as file:
+        file.write(os.urandom(args.size))
+        file.flush()
+        async with AsyncClient(app=build_app(file.name), base_url='http://bench') as client:
+            for scenario in ('seek', 'repeat'):
+                for url in ('/plain', '/ranged'):
+                    print(json.dumps(await run(client, url, scenario, args.size, args.requests)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=1024 * 1024 * 10)
+    parser.add_argument('--requests', type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,65 @@
+"""Repeated downloads of the same small files: no cache vs the in-process hot file tier.
+
+    python src/benchmarks/hotfiles.py --files 20 --size 16384 --requests 5000 --concurrency 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+
+sys.path.append('src')
+
+from httpx import AsyncClient
+
+from benchmarks.suite import auth_headers, counted_queries, drive, throwaway_user
+from main import app
+from services.hotfiles import hot_files
+
+SCENARIOS = {
+    'uncached': {'files': 0, 'budget': 0},
+    'cached': {'files': 10000, 'budget': 1024 * 1024 * 64},
+}
+
+
+async def run(client: AsyncClient, name: str, ids: list[str], args) -> dict:
+    hot_files.clear()
+    hot_files.files.maxsize = SCENARIOS[name]['files']
+    hot_files.blobs.maxsize = SCENARIOS[name]['budget']
+
+    async def send(_):
+        response = await client.get('/v1/files/download', params={'id_': random.choice(ids)})
+        response.raise_for_status()
+
+    before = hot_files.stats()['blobs']
+    with counted_queries() as queries:
+        elapsed, _ = await drive(send, args.requests, args.concurrency)
+    return {
+        'scenario': name,
+        'requests': args.requests,
+        'requests_per_sec': round(args.requests / elapsed, 1),
+        'queries_per_request': round(queries.total() / args.requests, 3),
+    } | {f'cache_{key}': hot_files.stats()['blobs'][key] - before[key] for key in ('hits', 'misses')}
+
+
+async def main(args) -> None:
+    async with AsyncClient(app=app, base_url='http://bench') as client, throwaway_user(client) as credentials:
+        client.headers.update(await auth_headers(client, credentials))
+        ids = []
+        for n in range(args.files):
+            response = await client.post(
+                '/v1/files/upload', params={'path': 'hot'}, files={'file': (f'{n}.bin', os.urandom(args.size))}
+            )
+            ids.append(response.json()['id'])
+        for name in SCENARIOS:
+            print(json.dumps(await run(client, name, ids, args)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--size', type=int, default=16384)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
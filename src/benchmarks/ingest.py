@@ -0,0 +1,123 @@
+"""Concurrent multipart uploads: spooled UploadFile with an inline copy loop vs the streaming ingestion pipeline.
+
+The server runs in a subprocess under uvicorn and samples its own event loop lag.
+
+    python src/benchmarks/ingest.py --uploads 200 --concurrency 16 --size 4194304
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append('src')
+
+import aiofiles
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request, UploadFile
+
+from api.multipart import MultipartFile
+from benchmarks.suite import drive, wait_for_server
+from services.blobs import BlobStore
+from services.storage import LocalStorage
+
+PORT = 8765
+app = FastAPI()
+lags: list[float] = []
+
+
+@app.on_event('startup')
+async def probe_lag() -> None:
+    async def probe():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - start - 0.005)
+
+    app.state.probe = asyncio.create_task(probe())
+
+
+@app.post('/before')
+async def before(file: UploadFile) -> dict:
+    # the previous handler: the form parser has spooled the body already, then it is copied again
+    digest = hashlib.sha256()
+    async with aiofiles.open(os.path.join(app.state.root, f'{time.monotonic_ns()}.part'), 'wb') as out_file:
+        while content := await file.read(2 ** 16):
+            digest.update(content)
+            await out_file.write(content)
+    return {'hash': digest.hexdigest()}
+
+
+@app.post('/after')
+async def after(request: Request) -> dict:
+    upload = MultipartFile(request.stream(), request.headers['content-type'])
+    await upload.open()
+    staged = await app.state.store.stage(upload.chunks(), max_size=2 ** 40)
+    return {'hash': staged.hash}
+
+
+@app.get('/lag')
+async def lag() -> dict:
+    result = {
+        'max_loop_lag_ms': round(max(lags, default=0) * 1000, 2),
+        'mean_loop_lag_ms': round(sum(lags) / max(len(lags), 1) * 1000, 3),
+    }
+    lags.clear()
+    return result
+
+
+async def run(scenario: str, payload: bytes, uploads: int, concurrency: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{PORT}', limits=limits, timeout=300) as client:
+        await client.get('/lag')
+
+        async def upload(_):
+            response = await client.post(f'/{scenario}', files={'file': ('payload.bin', payload)})
+            response.raise_for_status()
+
+        elapsed, _ = await drive(upload, uploads, concurrency)
+        return {
+            'scenario': scenario,
+            'uploads': uploads,
+            'concurrency': concurrency,
+            'uploads_per_sec': round(uploads / elapsed, 1),
+            'mb_per_sec': round(len(payload) * uploads / elapsed / 1024 ** 2, 1),
+        } | (await client.get('/lag')).json()
+
+
+async def main(args) -> None:
+    payload = os.urandom(args.size)
+    server = subprocess.Popen([sys.executable, __file__, '--serve'])
+    try:
+        async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{PORT}') as client:
+            await wait_for_server(client, '/lag')
+        for scenario in ('before', 'after'):
+            print(json.dumps(await run(scenario, payload, args.uploads, args.concurrency)))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def serve() -> None:
+    with tempfile.TemporaryDirectory() as root:
+        app.state.root = root
+        app.state.store = BlobStore(root, LocalStorage(root))
+        uvicorn.run(app, host='127.0.0.1', port=PORT, log_level='warning')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uploads', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--size', type=int, default=1024 * 1024 * 4)
+    parser.add_argument('--serve', action='store_true')
+    arguments = parser.parse_args()
+    if arguments.serve:
+        serve()
+    else:
+        asyncio.run(main(arguments))
@@ -0,0 +1,93 @@
+"""Upload latency with follow-up work inline vs queued, and job queue throughput with several workers.
+
+`inline` verifies every new blob before the upload returns, `queued` only enqueues the
+verification. Then `--jobs` no-op jobs are drained by `--workers` competing workers.
+
+    python src/benchmarks/jobs.py --uploads 200 --size 1048576 --jobs 5000 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from contextlib import nullcontext
+
+sys.path.append('src')
+
+from httpx import AsyncClient
+from sqlalchemy import delete
+
+from benchmarks.suite import auth_headers, patched, percentile, throwaway_user
+from core.config import settings
+from db.db import async_session
+from main import app
+from models.models import Job
+from services import files, jobs, tasks
+from services.jobs import JobWorker, job_crud
+
+
+async def uploads(client: AsyncClient, name: str, headers: dict, args) -> dict:
+    latencies = []
+
+    async def inline(self, db, hashes, *, user_id):
+        # the verification in the request, as it would be without a queue
+        for hash_ in hashes:
+            async with async_session() as session:
+                await tasks.verify_blob(session, {'hash': hash_})
+
+    in_request = patched(files.RepositoryFile, enqueue_upload_jobs=inline) if name == 'inline' else nullcontext()
+    with patched(settings, UPLOAD_JOBS=['verify_blob']), in_request:
+        for _ in range(args.uploads):
+            start = time.perf_counter()
+            response = await client.post(
+                '/v1/files/upload', params={'path': f'/bench/{name}'}, headers=headers,
+                files={'file': (f'{uuid.uuid4()}.bin', os.urandom(args.size))}
+            )
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+    return {
+        'scenario': name,
+        'uploads': args.uploads,
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+    }
+
+
+async def throughput(args) -> dict:
+    async def noop(db, payload):
+        pass
+
+    jobs.job_types['noop'] = jobs.JobType('noop', noop, concurrency=args.concurrency, max_attempts=1)
+    async with async_session() as db:
+        await job_crud.enqueue_many(db, 'noop', [{'n': n} for n in range(args.jobs)])
+        await db.commit()
+    workers = [JobWorker(poll_interval=0.05, lease=60) for _ in range(args.workers)]
+    start = time.perf_counter()
+    await asyncio.gather(*(worker.drain(['noop']) for worker in workers))
+    elapsed = time.perf_counter() - start
+    async with async_session() as db:
+        await db.execute(delete(Job).where(Job.kind == 'noop'))
+        await db.commit()
+    return {
+        'scenario': 'queue', 'jobs': args.jobs, 'workers': args.workers, 'jobs_per_sec': round(args.jobs / elapsed)
+    }
+
+
+async def main(args) -> None:
+    async with AsyncClient(app=app, base_url='http://bench') as client, throwaway_user(client) as credentials:
+        headers = await auth_headers(client, credentials)
+        for name in ('inline', 'queued'):
+            print(json.dumps(await uploads(client, name, headers, args)))
+        print(json.dumps(await throughput(args)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uploads', type=int, default=200)
+    parser.add_argument('--size', type=int, default=1024 * 1024)
+    parser.add_argument('--jobs', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=8, help='jobs per claim and worker')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,61 @@
+"""Downloads of one small file: logged-in download vs signed link streamed by the app vs signed link offloaded.
+
+The offloaded scenario only measures the app's part; nginx sends the bytes.
+
+    python src/benchmarks/links.py --size 16384 --requests 5000 --concurrency 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.append('src')
+
+from httpx import AsyncClient
+
+from benchmarks.suite import auth_headers, counted_queries, drive, patched, throwaway_user
+from core.config import settings
+from main import app
+
+
+async def run(client: AsyncClient, name: str, url: str, params: dict, headers: dict, args) -> dict:
+    async def send(_):
+        response = await client.get(url, params=params, headers=headers)
+        response.raise_for_status()
+
+    accel_redirect = '/protected' if name == 'link_offloaded' else None
+    with patched(settings, ACCEL_REDIRECT=accel_redirect), counted_queries() as queries:
+        elapsed, _ = await drive(send, args.requests, args.concurrency)
+    return {
+        'scenario': name,
+        'requests': args.requests,
+        'requests_per_sec': round(args.requests / elapsed, 1),
+        'queries_per_request': round(queries.total() / args.requests, 3),
+    }
+
+
+async def main(args) -> None:
+    async with AsyncClient(app=app, base_url='http://bench') as client, throwaway_user(client) as credentials:
+        auth = await auth_headers(client, credentials)
+        response = await client.post(
+            '/v1/files/upload', params={'path': '/bench/links'}, headers=auth,
+            files={'file': ('file.bin', os.urandom(args.size))}
+        )
+        file_id = response.json()['id']
+        link = (await client.post('/v1/files/links', params={'id_': file_id}, headers=auth)).json()['url']
+        scenarios = [
+            ('login', '/v1/files/download', {'id_': file_id}, auth),
+            ('link', link, {}, {}),
+            ('link_offloaded', link, {}, {}),
+        ]
+        for scenario in scenarios:
+            print(json.dumps(await run(client, *scenario, args)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=16384)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
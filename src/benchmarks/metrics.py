@@ -0,0 +1,55 @@
+"""Per-request cost of the metrics middleware, measured on a route that does nothing.
+
+    python src/benchmarks/metrics.py --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+sys.path.append('src')
+
+from fastapi import FastAPI
+from httpx import AsyncClient
+
+from api.metrics import MetricsMiddleware
+
+
+def make_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get('/noop')
+    async def noop():
+        return {}
+
+    if instrumented:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+async def run(instrumented: bool, requests: int) -> float:
+    async with AsyncClient(app=make_app(instrumented), base_url='http://bench') as client:
+        for _ in range(100):
+            await client.get('/noop')
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.get('/noop')
+        return (time.perf_counter() - start) / requests
+
+
+async def main(args) -> None:
+    plain = await run(False, args.requests)
+    instrumented = await run(True, args.requests)
+    print(json.dumps({
+        'requests': args.requests,
+        'plain_us': round(plain * 1e6, 1),
+        'instrumented_us': round(instrumented * 1e6, 1),
+        'overhead_us': round((instrumented - plain) * 1e6, 1),
+    }))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=20000)
+    asyncio.run(main(parser.parse_args()))
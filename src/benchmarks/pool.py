@@ -0,0 +1,82 @@
+"""Load test at N concurrent clients: default pool with a user lookup per request vs tuned pool with lazy sessions.
+
+Each scenario starts the app under uvicorn in a subprocess against the configured database.
+
+    python src/benchmarks/pool.py --clients 1000 --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+sys.path.append('src')
+
+import httpx
+
+from benchmarks.suite import auth_headers, drive, percentile, throwaway_user, wait_for_server
+
+PORT = 8766
+SCENARIOS = {
+    'default': {'DB_POOL_SIZE': '5', 'DB_MAX_OVERFLOW': '10', 'DB_STATEMENT_CACHE_SIZE': '100', 'USER_CACHE_TTL': '0'},
+    'tuned': {'DB_POOL_SIZE': '20', 'DB_MAX_OVERFLOW': '10', 'DB_STATEMENT_CACHE_SIZE': '500', 'USER_CACHE_TTL': '30'},
+}
+ROUTES = ('/v1/users/me', '/v1/user/status')
+
+
+async def load(client: httpx.AsyncClient, headers: dict, clients: int, requests: int) -> dict:
+    errors = 0
+
+    async def send(n):
+        nonlocal errors
+        try:
+            response = await client.get(ROUTES[n % len(ROUTES)], headers=headers)
+            errors += response.status_code != 200
+        except httpx.HTTPError:
+            errors += 1
+
+    elapsed, latencies = await drive(send, requests, clients)
+    return {
+        'requests_per_sec': round(requests / elapsed, 1),
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'errors': errors,
+    }
+
+
+async def run(name: str, args) -> dict:
+    env = os.environ | SCENARIOS[name] | {'PYTHONPATH': 'src'}
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(PORT), '--log-level', 'warning'],
+        env=env, cwd='src'
+    )
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    try:
+        async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{PORT}', limits=limits, timeout=120) as client:
+            await wait_for_server(client)
+            async with throwaway_user(client) as credentials:
+                headers = await auth_headers(client, credentials)
+                result = await load(client, headers, args.clients, args.requests)
+                pool = (await client.get('/v1/ping')).json()['pool']
+    finally:
+        server.terminate()
+        server.wait()
+    return {'scenario': name, 'clients': args.clients} | result | {
+        'pool_checkouts_per_request': round(pool['checkouts'] / args.requests, 3),
+        'pool_waits': pool['waits'],
+        'pool_max_wait_ms': round(pool['max_wait'] * 1000, 1),
+        'pool_mean_wait_ms': round(pool['wait_time'] / max(pool['waits'], 1) * 1000, 2),
+    }
+
+
+async def main(args) -> None:
+    for name in SCENARIOS:
+        print(json.dumps(await run(name, args)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=20000)
+    asyncio.run(main(parser.parse_args()))
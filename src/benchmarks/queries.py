@@ -0,0 +1,133 @@
+"""CPU time and memory per call of the file queries: ORM statements built per call vs cached lambda statements.
+
+Each query runs against the configured database as the ORM version it replaced and as the
+current RepositoryFile method. CPU time is the process' own (statement building, compiling,
+row processing), not time spent waiting on Postgres; memory is what tracemalloc still counts
+after one call while its result is held: the rows or ORM objects and everything they keep alive.
+
+    python src/benchmarks/queries.py --files 1000 --repeat 500
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.append('src')
+
+from sqlalchemy import insert, select
+
+from benchmarks.suite import seeded_user
+from db.db import async_session, dispose_engine
+from models.models import File
+from schemas.files import FileCreate, FileInDBBase
+from services.files import file_crud
+
+
+async def seed(user_id: uuid.UUID, count: int) -> None:
+    async with async_session() as db:
+        await db.execute(insert(File.__table__), [
+            {'id': uuid.uuid4(), 'user_id': user_id, 'name': f'{index:06d}.log', 'size': index,
+             'path': f'logs/{index:06d}.log', 'directory': 'logs'}
+            for index in range(count)
+        ])
+        await db.commit()
+
+
+def new_file(user_id: uuid.UUID) -> FileCreate:
+    id_ = uuid.uuid4()
+    return FileCreate(id=id_, name=f'{id_}.bin', path=f'new/{id_}.bin', size=1, stored_size=1, encoding=None,
+                      xxh3=None, user_id=user_id, is_downloadable=True, blob_hash=None)
+
+
+class Orm:
+    """The queries as they were: a fresh ORM statement per call, ORM objects validated by from_orm."""
+
+    async def page(self, db, user_id, paths):
+        statement = select(File).where(File.user_id == user_id, File.path.startswith('logs/', autoescape=True))
+        statement = statement.order_by(File.created_at.desc(), File.id.desc()).limit(100)
+        files = (await db.execute(statement)).scalars().all()
+        return [FileInDBBase.from_orm(file) for file in files]
+
+    async def by_id(self, db, user_id, paths):
+        return (await db.execute(select(File).where(File.id == paths[1]))).scalar_one_or_none()
+
+    async def by_path(self, db, user_id, paths):
+        statement = select(File).where(File.user_id == user_id, File.path == paths[0])
+        return (await db.execute(statement)).scalar_one_or_none()
+
+    async def create(self, db, user_id, paths):
+        file = File(**new_file(user_id).dict())
+        db.add(file)
+        await db.commit()
+        await db.refresh(file)
+        return file
+
+
+class Cached:
+
+    async def page(self, db, user_id, paths):
+        rows = await file_crud.get_page(db, limit=100, user_id=user_id, path='logs/')
+        return [FileInDBBase.construct(**row._mapping) for row in rows]
+
+    async def by_id(self, db, user_id, paths):
+        return await file_crud.get(db, paths[1])
+
+    async def by_path(self, db, user_id, paths):
+        return await file_crud.get_by_path(db, user_id=user_id, path=paths[0])
+
+    async def create(self, db, user_id, paths):
+        return await file_crud.create(db, obj_in=new_file(user_id))
+
+
+QUERIES = ('page', 'by_id', 'by_path', 'create')
+
+
+async def measure(variant, name: str, user_id: uuid.UUID, paths: tuple, repeat: int) -> dict:
+    query = getattr(variant, name)
+    cpu, held = [], []
+    async with async_session() as db:
+        # warm up the connection, prepared statements and compiled caches
+        for _ in range(10):
+            await query(db, user_id, paths)
+        for _ in range(repeat):
+            tracemalloc.start()
+            start = time.process_time()
+            result = await query(db, user_id, paths)
+            cpu.append(time.process_time() - start)
+            held.append(tracemalloc.get_traced_memory()[0])
+            tracemalloc.stop()
+            del result
+            db.expunge_all()
+            await db.commit()
+    return {
+        'query': name,
+        'variant': type(variant).__name__.lower(),
+        'cpu_us': round(statistics.mean(cpu) * 1e6, 1),
+        'held_kb': round(statistics.median(held) / 1024, 1),
+    }
+
+
+async def main(args) -> None:
+    try:
+        async with seeded_user() as user_id:
+            await seed(user_id, args.files)
+            async with async_session() as db:
+                id_ = (await db.execute(select(File.id).where(File.user_id == user_id).limit(1))).scalar_one()
+            paths = ('logs/000000.log', id_)
+            for name in QUERIES:
+                for variant in (Orm(), Cached()):
+                    result = await measure(variant, name, user_id, paths, args.repeat)
+                    print(json.dumps({'files': args.files} | result))
+    finally:
+        await dispose_engine()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
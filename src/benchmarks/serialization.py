@@ -0,0 +1,92 @@
+"""Serializing a files listing: response model through FastAPI vs orjson from the rows (FAST_JSON).
+
+Loads one page of N files from the configured database, then times only the work between
+the rows and the response body, as the list handler does it: building `Files`, FastAPI's
+validation against the response model, jsonable_encoder and json, against TrustedJSONResponse.
+Memory is the tracemalloc peak of one more, untimed serialization.
+
+    python src/benchmarks/serialization.py --files 10000 --repeat 20
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.append('src')
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from sqlalchemy import insert
+
+from api.responses import TrustedJSONResponse
+from benchmarks.suite import seeded_user
+from db.db import async_session, dispose_engine
+from main import app
+from models.models import File
+from schemas.files import FileInDBBase, Files
+from services.files import file_crud
+
+
+async def seed(user_id: uuid.UUID, count: int) -> None:
+    async with async_session() as db:
+        await db.execute(insert(File.__table__), [
+            {'id': uuid.uuid4(), 'user_id': user_id, 'name': f'{index:06d}.log', 'size': index, 'stored_size': index,
+             'path': f'logs/{index:06d}.log', 'directory': 'logs', 'xxh3': uuid.uuid4().hex[:16]}
+            for index in range(count)
+        ])
+        await db.commit()
+
+
+async def model(rows, account_id: str) -> bytes:
+    route = next(route for route in app.routes if getattr(route, 'name', None) == 'files_list_handler')
+    files = Files(files=[FileInDBBase.construct(**row._mapping) for row in rows], account_id=account_id)
+    content = await serialize_response(field=route.secure_cloned_response_field, response_content=files)
+    return JSONResponse(content).body
+
+
+async def fast(rows, account_id: str) -> bytes:
+    content = {'account_id': account_id, 'files': [row._asdict() for row in rows], 'next_cursor': None}
+    return TrustedJSONResponse(content).body
+
+
+async def measure(name: str, serialize, rows, account_id: str, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = await serialize(rows, account_id)
+        samples.append(time.perf_counter() - start)
+    # traced separately: tracing every allocation would skew the timings
+    tracemalloc.start()
+    await serialize(rows, account_id)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'scenario': name,
+        'files': len(rows),
+        'median_ms': round(statistics.median(samples) * 1000, 2),
+        'peak_mb': round(peak / 1024 ** 2, 2),
+        'body_kb': round(len(body) / 1024, 1),
+    }
+
+
+async def main(args) -> None:
+    try:
+        async with seeded_user() as user_id:
+            await seed(user_id, args.files)
+            async with async_session() as db:
+                rows = await file_crud.get_page(db, limit=args.files, user_id=user_id)
+            for name, serialize in (('model', model), ('fast_json', fast)):
+                print(json.dumps(await measure(name, serialize, rows, str(user_id), args.repeat)))
+    finally:
+        await dispose_engine()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,386 @@
+"""Load test of the whole service: login, status, listing, upload and download.
+
+Starts the production launcher against the configured database, registers a throwaway
+user, seeds files for the read scenarios and removes the user afterwards. With --url it
+targets a running server instead and leaves the user in place. Prints one JSON line per
+scenario; --output writes the whole report and --compare judges it against an earlier
+one, exiting with 1 on a regression.
+
+    python src/benchmarks/suite.py --concurrency 50 --requests 2000 --sizes 4k:5,64k:3,1m:1 --output base.json
+    python src/benchmarks/suite.py --env DB_POOL_SIZE=5 --compare base.json
+    python src/benchmarks/suite.py --current new.json --compare base.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Iterator
+
+sys.path.append('src')
+
+import httpx
+
+SCENARIOS = ('login', 'status', 'list', 'upload', 'download')
+UNITS = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+PORT = 8770
+
+
+def parse_size(value: str) -> int:
+    value = value.strip().lower()
+    if value[-1] in UNITS:
+        return int(float(value[:-1]) * UNITS[value[-1]])
+    return int(value)
+
+
+def parse_sizes(value: str) -> tuple[list[int], list[float]]:
+    """`4k:5,64k:3,1m:1` -> sizes and their weights."""
+    sizes, weights = [], []
+    for item in value.split(','):
+        size, _, weight = item.partition(':')
+        sizes.append(parse_size(size))
+        weights.append(float(weight or 1))
+    return sizes, weights
+
+
+def rss(pid: int) -> tuple[int, int]:
+    """Current and peak resident memory of a process and its children, in bytes (Linux only)."""
+    current = peak = 0
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as file:
+            children = [int(child) for child in file.read().split()]
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    current += int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    peak += int(line.split()[1]) * 1024
+    except (FileNotFoundError, ProcessLookupError):
+        return 0, 0
+    for child in children:
+        child_current, child_peak = rss(child)
+        current += child_current
+        peak += child_peak
+    return current, peak
+
+
+class Context:
+
+    def __init__(self, args):
+        self.args = args
+        self.sizes, self.weights = parse_sizes(args.sizes)
+        self.credentials = {'username': f'{uuid.uuid4()}@bench.com', 'password': 'benchmark'}
+        self.headers = {}
+        self.paths = []
+        self.blocks = {size: os.urandom(size) for size in self.sizes}
+
+    def content(self) -> bytes:
+        # a unique prefix keeps deduplication from turning uploads into metadata-only writes
+        size = random.choices(self.sizes, self.weights)[0]
+        return uuid.uuid4().bytes + self.blocks[size][16:]
+
+
+async def login(client: httpx.AsyncClient, ctx: Context) -> tuple[int, int]:
+    response = await client.post('/v1/auth/jwt/login', data=ctx.credentials)
+    return response.status_code, 0
+
+
+async def status(client: httpx.AsyncClient, ctx: Context) -> tuple[int, int]:
+    response = await client.get('/v1/user/status', headers=ctx.headers)
+    return response.status_code, 0
+
+
+async def listing(client: httpx.AsyncClient, ctx: Context) -> tuple[int, int]:
+    response = await client.post('/v1/files/', params={'limit': 100}, headers=ctx.headers)
+    return response.status_code, 0
+
+
+async def upload(client: httpx.AsyncClient, ctx: Context) -> tuple[int, int]:
+    content = ctx.content()
+    response = await client.post(
+        '/v1/files/upload', params={'path': '/bench/upload'}, headers=ctx.headers,
+        files={'file': (f'{uuid.uuid4()}.bin', content)}
+    )
+    return response.status_code, len(content)
+
+
+async def download(client: httpx.AsyncClient, ctx: Context) -> tuple[int, int]:
+    received = 0
+    params = {'path': random.choice(ctx.paths)}
+    async with client.stream('GET', '/v1/files/download/path', params=params, headers=ctx.headers) as response:
+        async for chunk in response.aiter_raw():
+            received += len(chunk)
+    return response.status_code, received
+
+
+HANDLERS = {'login': login, 'status': status, 'list': listing, 'upload': upload, 'download': download}
+
+
+def percentile(samples: list[float], q: int) -> float:
+    if len(samples) < 2:
+        return round(samples[0] * 1000, 2) if samples else 0
+    return round(statistics.quantiles(samples, n=100)[q - 1] * 1000, 2)
+
+
+async def drive(send: Callable[[int], Awaitable[None]], requests: int, concurrency: int) -> tuple[float, list[float]]:
+    """Await `send(n)` for n in range(requests) from `concurrency` workers; returns the elapsed time and latencies."""
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for n in remaining:
+            start = time.perf_counter()
+            await send(n)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+
+async def run(client: httpx.AsyncClient, ctx: Context, name: str, server_pid: int | None) -> dict:
+    handler = HANDLERS[name]
+    errors = transferred = 0
+
+    async def send(_):
+        nonlocal errors, transferred
+        try:
+            code, size = await handler(client, ctx)
+            errors += code != 200
+            transferred += size
+        except httpx.HTTPError:
+            errors += 1
+
+    elapsed, latencies = await drive(send, ctx.args.requests, ctx.args.concurrency)
+    current, peak = rss(server_pid) if server_pid else (0, 0)
+    return {
+        'scenario': name,
+        'requests': ctx.args.requests,
+        'concurrency': ctx.args.concurrency,
+        'errors': errors,
+        'requests_per_sec': round(ctx.args.requests / elapsed, 1),
+        'mb_per_sec': round(transferred / elapsed / 1024 ** 2, 2),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'rss_mb': round(current / 1024 ** 2, 1),
+        'peak_rss_mb': round(peak / 1024 ** 2, 1),
+    }
+
+
+async def wait_for_server(client: httpx.AsyncClient, path: str = '/v1/ping') -> None:
+    for _ in range(100):
+        try:
+            await client.get(path)
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError('Server did not start')
+
+
+async def prepare(client: httpx.AsyncClient, ctx: Context) -> None:
+    response = await client.post(
+        '/v1/auth/register', json={'email': ctx.credentials['username'], 'password': ctx.credentials['password']}
+    )
+    response.raise_for_status()
+    ctx.headers = await auth_headers(client, ctx.credentials)
+    for n in range(ctx.args.seed_files):
+        response = await client.post(
+            '/v1/files/upload', params={'path': '/bench/seed'}, headers=ctx.headers,
+            files={'file': (f'{n}.bin', ctx.content())}
+        )
+        response.raise_for_status()
+        ctx.paths.append(f'/bench/seed/{n}.bin')
+
+
+async def remove_user(email: str) -> None:
+    from sqlalchemy import delete
+
+    from db.db import async_session
+    from models.models import User
+
+    async with async_session() as db:
+        await db.execute(delete(User).where(User.email == email))
+        await db.commit()
+
+
+async def cleanup(credentials: dict) -> None:
+    from db.db import dispose_engine
+
+    await remove_user(credentials['username'])
+    await dispose_engine()
+
+
+async def auth_headers(client: httpx.AsyncClient, credentials: dict) -> dict:
+    response = await client.post('/v1/auth/jwt/login', data=credentials)
+    response.raise_for_status()
+    return {'Authorization': f'Bearer {response.json()["access_token"]}'}
+
+
+@asynccontextmanager
+async def throwaway_user(client: httpx.AsyncClient) -> AsyncIterator[dict]:
+    """Register a user through `client`, yield its credentials and delete it from the configured database."""
+    credentials = {'username': f'{uuid.uuid4()}@bench.com', 'password': 'benchmark'}
+    response = await client.post(
+        '/v1/auth/register', json={'email': credentials['username'], 'password': credentials['password']}
+    )
+    response.raise_for_status()
+    try:
+        yield credentials
+    finally:
+        await remove_user(credentials['username'])
+
+
+@asynccontextmanager
+async def seeded_user() -> AsyncIterator[uuid.UUID]:
+    """Insert a user straight into the configured database, yield its id and delete it with everything it owns."""
+    from sqlalchemy import insert
+
+    from db.db import async_session
+    from models.models import User
+
+    user_id = uuid.uuid4()
+    async with async_session() as db:
+        await db.execute(insert(User).values(id=user_id, email=f'{user_id}@bench', hashed_password='-'))
+        await db.commit()
+    try:
+        yield user_id
+    finally:
+        await remove_user(f'{user_id}@bench')
+
+
+@contextmanager
+def counted_queries() -> Iterator[Counter]:
+    """Statements the app's engine executes meanwhile, counted by their SQL."""
+    from sqlalchemy import event
+
+    from db.db import init_engine
+
+    queries = Counter()
+
+    def count(conn, cursor, statement, *args):
+        queries[statement] += 1
+
+    engine = init_engine().sync_engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        yield queries
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+
+@contextmanager
+def patched(target, **values) -> Iterator[None]:
+    """Set attributes of `target` for the duration of a scenario."""
+    original = {key: getattr(target, key) for key in values}
+    for key, value in values.items():
+        setattr(target, key, value)
+    try:
+        yield
+    finally:
+        for key, value in original.items():
+            setattr(target, key, value)
+
+
+async def benchmark(args) -> list[dict]:
+    server, url = None, args.url
+    if url is None:
+        url = f'http://127.0.0.1:{PORT}'
+        env = os.environ | dict(item.split('=', 1) for item in args.env)
+        server = subprocess.Popen(
+            [sys.executable, 'src/serve.py', '--bind', f'127.0.0.1:{PORT}', '--workers', str(args.workers)],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    ctx = Context(args)
+    # drop idle connections before the server's 5s keep-alive timeout does, or reusing one races its close
+    limits = httpx.Limits(
+        max_connections=args.concurrency, max_keepalive_connections=args.concurrency, keepalive_expiry=2
+    )
+    results = []
+    try:
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=300) as client:
+            await wait_for_server(client)
+            await prepare(client, ctx)
+            for name in args.scenarios.split(','):
+                result = await run(client, ctx, name, server and server.pid)
+                print(json.dumps(result), flush=True)
+                results.append(result)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if args.url is None:
+            await cleanup(ctx.credentials)
+    return results
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[dict]:
+    """Per-scenario change against the baseline; slower throughput or p99 beyond threshold is a regression."""
+    before = {result['scenario']: result for result in baseline['results']}
+    changes = []
+    for result in current['results']:
+        base = before.get(result['scenario'])
+        if base is None:
+            continue
+        throughput = result['requests_per_sec'] / base['requests_per_sec'] - 1
+        p99 = result['p99_ms'] / base['p99_ms'] - 1 if base['p99_ms'] else 0
+        changes.append({
+            'scenario': result['scenario'],
+            'requests_per_sec': [base['requests_per_sec'], result['requests_per_sec']],
+            'p99_ms': [base['p99_ms'], result['p99_ms']],
+            'throughput_change': round(throughput, 3),
+            'p99_change': round(p99, 3),
+            'regression': throughput < -threshold or p99 > threshold or result['errors'] > base['errors'],
+        })
+    return changes
+
+
+def main(args) -> int:
+    if args.current:
+        with open(args.current) as file:
+            report = json.load(file)
+    else:
+        report = {
+            'meta': {
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'cpus': os.cpu_count(),
+                'args': vars(args),
+            },
+            'results': asyncio.run(benchmark(args)),
+        }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if not args.compare:
+        return 0
+    with open(args.compare) as file:
+        changes = compare(json.load(file), report, args.threshold)
+    for change in changes:
+        print(json.dumps(change))
+    return int(any(change['regression'] for change in changes))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help='benchmark a running server instead of starting one')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--env', action='append', default=[], help='KEY=VALUE setting for the started server')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=1000, help='requests per scenario')
+    parser.add_argument('--sizes', default='4k:5,64k:3,1m:1', help='file sizes with relative weights')
+    parser.add_argument('--seed-files', type=int, default=20)
+    parser.add_argument('--output', help='write the report to this file')
+    parser.add_argument('--compare', help='baseline report to compare against')
+    parser.add_argument('--current', help='compare this report instead of running the benchmark')
+    parser.add_argument('--threshold', type=float, default=0.1, help='tolerated relative slowdown')
+    sys.exit(main(parser.parse_args()))
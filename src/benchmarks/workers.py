@@ -0,0 +1,90 @@
+"""Requests/sec against the production launcher with 1..N workers.
+
+Each run starts src/serve.py against the configured database and drives it from
+several client processes, so the load generator is not what saturates first.
+
+    python src/benchmarks/workers.py --max-workers 4 --clients 4 --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import subprocess
+import sys
+import time
+
+sys.path.append('src')
+
+import httpx
+
+from benchmarks.suite import drive, wait_for_server
+from core.server import cpu_count
+
+PORT = 8767
+URL = f'http://127.0.0.1:{PORT}'
+ROUTE = '/v1/ping'
+
+
+async def ready() -> None:
+    async with httpx.AsyncClient(base_url=URL) as client:
+        await wait_for_server(client, ROUTE)
+
+
+async def load(requests: int, concurrency: int) -> int:
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=URL, limits=limits, timeout=60) as client:
+
+        async def send(_):
+            nonlocal errors
+            try:
+                errors += (await client.get(ROUTE)).status_code != 200
+            except httpx.HTTPError:
+                errors += 1
+
+        await drive(send, requests, concurrency)
+    return errors
+
+
+def client_process(args: tuple) -> int:
+    return asyncio.run(load(*args))
+
+
+def run(workers: int, args) -> dict:
+    server = subprocess.Popen(
+        [sys.executable, 'src/serve.py', '--bind', f'127.0.0.1:{PORT}', '--workers', str(workers)]
+    )
+    try:
+        asyncio.run(ready())
+        share = args.requests // args.clients
+        with multiprocessing.Pool(args.clients) as pool:
+            start = time.perf_counter()
+            errors = sum(pool.map(client_process, [(share, args.concurrency)] * args.clients))
+            elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        'workers': workers,
+        'requests': share * args.clients,
+        'requests_per_sec': round(share * args.clients / elapsed, 1),
+        'errors': errors,
+    }
+
+
+def main(args) -> None:
+    baseline = None
+    for workers in range(1, args.max_workers + 1):
+        result = run(workers, args)
+        baseline = baseline or result['requests_per_sec']
+        result['speedup'] = round(result['requests_per_sec'] / baseline, 2)
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-workers', type=int, default=cpu_count())
+    parser.add_argument('--clients', type=int, default=cpu_count())
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=20000)
+    main(parser.parse_args())
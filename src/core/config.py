@@ -17,6 +17,14 @@ class AppSettings(BaseSettings):
     APP_TITLE: str
     PROJECT_HOST: str
     PROJECT_PORT: int
+    WEB_WORKERS: int | None = None
+    SHUTDOWN_TIMEOUT: int = 60
+    METRICS: bool = True
+    LOOP_LAG_INTERVAL: float = 0.5
+    PROFILER: str | None = None
+    PROFILE_SAMPLE_RATE: float = 0.01
+    PROFILE_SLOW_REQUEST: float = 1.0
+    PROFILE_DIR: str = 'profiles/'
 
     POSTGRES_DB: str
     POSTGRES_USER: str
@@ -25,12 +33,89 @@ class AppSettings(BaseSettings):
     POSTGRES_PORT: int
 
     MAX_FILE_SIZE: int = 1024 * 1024 * 10
+    UPLOAD_QUEUE_SIZE: int = 16
+    UPLOAD_BLOCK_SIZE: int = 1024 * 1024
+    INGEST_EXECUTOR: str = 'thread'
+    INGEST_WORKERS: int = os.cpu_count() or 1
+    MAX_UPLOAD_SIZE: int = 1024 * 1024 * 1024 * 10
+    MAX_UPLOAD_PART_SIZE: int = 1024 * 1024 * 64
+    MAX_UPLOAD_PARTS: int = 10000
+    UPLOAD_SESSION_TTL: int = 60 * 60 * 24
+    USER_QUOTA: int | None = None
+    MAX_ARCHIVE_IDS: int = 10000
+    MAX_BATCH_FILES: int = 1000
+    DEDUP_ACROSS_USERS: bool = False
     SECRET: str
     TOKEN_EXPIRE: int = 60 * 60
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL: int = 30
+    AUTH_TRUST_CLAIMS: int = 0
+    LINK_SECRET: str | None = None
+    LINK_TTL: int = 60 * 60
+    LINK_MAX_TTL: int = 60 * 60 * 24 * 7
+    ACCEL_REDIRECT: str | None = None
+    FAST_JSON: bool = False
+    # transfer limits per user and for the whole service (per worker without RATE_LIMIT_URL); 0 is no limit
+    RATE_LIMIT_URL: str | None = None
+    RATE_REQUESTS: float = 0
+    RATE_REQUESTS_BURST: int = 20
+    RATE_STREAMS: int = 0
+    RATE_BYTES: int = 0
+    RATE_GLOBAL_STREAMS: int = 0
+    RATE_GLOBAL_BYTES: int = 0
+    RATE_QUANTUM: int = 256 * 1024
+    HOT_CACHE_FILES: int = 10000
+    HOT_CACHE_TTL: int = 60
+    HOT_CACHE_BUDGET: int = 1024 * 1024 * 64
+    HOT_CACHE_MAX_BLOB: int = 1024 * 256
+    HOT_CACHE_CONTENT_TTL: int = 60 * 60
+    HOT_CACHE_URL: str | None = None
 
     DATABASE_URL: str = ''
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 60 * 30
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 500
+    DB_PGBOUNCER: bool = False
 
     FILE_FOLDER: str = 'files/'
+    STORAGE_BACKEND: str = 'local'
+    S3_ENDPOINT_URL: str = ''
+    S3_BUCKET: str = ''
+    S3_ACCESS_KEY: str = ''
+    S3_SECRET_KEY: str = ''
+    S3_REGION: str = 'us-east-1'
+    S3_PART_SIZE: int = 1024 * 1024 * 8
+    S3_CONCURRENCY: int = 8
+    S3_MAX_CONNECTIONS: int = 64
+    BLOB_GC_GRACE: int = 60 * 60
+    TRASH_RETENTION: int = 60 * 60 * 24 * 30
+    RECLAIM_BATCH: int = 100
+    RECLAIM_RATE: int = 200
+    JOB_WORKER: bool = True
+    JOB_POLL_INTERVAL: float = 1.0
+    JOB_LEASE: int = 60 * 15
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_BACKOFF: float = 5.0
+    JOB_BACKOFF_MAX: float = 60 * 60
+    JOB_CONCURRENCY: dict[str, int] = {}
+    UPLOAD_JOBS: list[str] = []
+    SCRUB_RATE: int = 1024 * 1024 * 16
+    SCRUB_BATCH: int = 100
+    COLD_FOLDER: str | None = None
+    COLD_AFTER: int = 60 * 60 * 24 * 30
+    PACK_SIZE: int = 1024 * 1024 * 256
+    TIER_BATCH: int = 1000
+    TIER_RATE: int = 1024 * 1024 * 64
+    ACCESS_FLUSH_INTERVAL: float = 10.0
+    COMPRESSION: str | None = 'zstd'
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_MIN_RATIO: float = 0.9
+    COMPRESSION_WORKERS: int = os.cpu_count() or 1
+    ZSTD_LEVEL: int = 3
+    GZIP_LEVEL: int = 6
 
     @validator('DATABASE_URL', pre=True, check_fields=False)
     def assemble_db_connection(cls, value: str | None, values: dict[str, Any]) -> Any:
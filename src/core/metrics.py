@@ -0,0 +1,89 @@
+"""Process metrics in the Prometheus text format.
+
+Under the multi-worker launcher every worker keeps its own values; set
+PROMETHEUS_MULTIPROC_DIR so a scrape of any worker reports all of them.
+"""
+import asyncio
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+THROUGHPUT_BUCKETS = tuple(2 ** n * 1024 * 1024 for n in range(-4, 11))
+# transfers smaller than this finish too quickly for their rate to mean anything
+THROUGHPUT_MIN_BYTES = 256 * 1024
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency.', ['method', 'route', 'status'], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests being served.', multiprocess_mode='livesum'
+)
+REQUEST_BYTES = Counter('http_request_bytes', 'Request body bytes received.', ['route'])
+RESPONSE_BYTES = Counter('http_response_bytes', 'Response body bytes sent.', ['route'])
+THROUGHPUT = Histogram(
+    'http_transfer_bytes_per_second', 'Throughput of large uploads and downloads.',
+    ['direction'], buckets=THROUGHPUT_BUCKETS
+)
+DB_QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', 'Database statement latency.', ['statement'], buckets=QUERY_BUCKETS
+)
+DB_QUERY_ERRORS = Counter('db_query_errors', 'Database statements that raised.')
+LOOP_LAG = Histogram('event_loop_lag_seconds', 'Event loop scheduling delay.', buckets=LAG_BUCKETS)
+PROFILES = Counter('profiles_saved', 'Profiles of slow requests written to disk.')
+CACHE_LOOKUPS = Counter('cache_lookups', 'Hot file cache lookups.', ['cache', 'tier', 'result'])
+
+
+def observe_transfer(direction: str, size: int, elapsed: float) -> None:
+    if size >= THROUGHPUT_MIN_BYTES and elapsed > 0:
+        THROUGHPUT.labels(direction).observe(size / elapsed)
+
+
+def statement_kind(statement: str) -> str:
+    kind = statement.lstrip()[:6].upper()
+    return kind if kind in ('SELECT', 'INSERT', 'UPDATE', 'DELETE') else 'OTHER'
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._query_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    DB_QUERY_LATENCY.labels(statement_kind(statement)).observe(time.perf_counter() - context._query_start)
+
+
+def handle_error(context) -> None:
+    DB_QUERY_ERRORS.inc()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    target = engine.sync_engine
+    if not event.contains(target, 'before_cursor_execute', before_cursor_execute):
+        event.listen(target, 'before_cursor_execute', before_cursor_execute)
+        event.listen(target, 'after_cursor_execute', after_cursor_execute)
+        event.listen(target, 'handle_error', handle_error)
+
+
+async def monitor_loop(interval: float) -> None:
+    """Measure how late the loop wakes up from a sleep; blocking code on the loop shows up here."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(loop.time() - start - interval, 0))
+
+
+def render() -> tuple[bytes, str]:
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
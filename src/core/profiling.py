@@ -0,0 +1,101 @@
+"""Sampled profiles of slow requests.
+
+A sampled request runs under a profiler; if it turns out slower than
+PROFILE_SLOW_REQUEST seconds the profile is written to PROFILE_DIR. Only one
+request per process is profiled at a time. Further profilers can be added
+with `register`.
+"""
+import cProfile
+import logging
+import os
+import random
+import time
+from typing import Callable, Protocol
+
+from core.config import settings
+from core.metrics import PROFILES
+
+logger = logging.getLogger(__name__)
+
+
+class Capture(Protocol):
+    suffix: str
+
+    def start(self) -> None:
+        ...
+
+    def stop(self) -> None:
+        ...
+
+    def save(self, path: str) -> None:
+        ...
+
+
+class CProfileCapture:
+    # cProfile sees the whole thread, so requests running concurrently end up in the same profile
+    suffix = '.prof'
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self) -> None:
+        self.profiler.enable()
+
+    def stop(self) -> None:
+        self.profiler.disable()
+
+    def save(self, path: str) -> None:
+        self.profiler.dump_stats(path)
+
+
+class PyinstrumentCapture:
+    suffix = '.html'
+
+    def __init__(self):
+        from pyinstrument import Profiler
+        self.profiler = Profiler(async_mode='enabled')
+
+    def start(self) -> None:
+        self.profiler.start()
+
+    def stop(self) -> None:
+        self.profiler.stop()
+
+    def save(self, path: str) -> None:
+        with open(path, 'w') as file:
+            file.write(self.profiler.output_html())
+
+
+profilers: dict[str, Callable[[], Capture]] = {
+    'cprofile': CProfileCapture,
+    'pyinstrument': PyinstrumentCapture,
+}
+active: Capture | None = None
+
+
+def register(name: str, factory: Callable[[], Capture]) -> None:
+    profilers[name] = factory
+
+
+def start() -> Capture | None:
+    global active
+    if not settings.PROFILER or active is not None or random.random() >= settings.PROFILE_SAMPLE_RATE:
+        return None
+    active = profilers[settings.PROFILER]()
+    active.start()
+    return active
+
+
+def finish(capture: Capture, route: str, elapsed: float) -> str | None:
+    global active
+    capture.stop()
+    active = None
+    if elapsed < settings.PROFILE_SLOW_REQUEST:
+        return None
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    name = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}{route.replace("/", "_")}{capture.suffix}'
+    path = os.path.join(settings.PROFILE_DIR, name)
+    capture.save(path)
+    PROFILES.inc()
+    logger.info(f'Slow request {route} took {elapsed:.3f}s, profile saved to {path}.')
+    return path
@@ -0,0 +1,76 @@
+import os
+import shutil
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+from core.config import settings
+
+
+def cpu_count() -> int:
+    # the cores this process may run on, which is what a container limit usually shows up as
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class Worker(UvicornWorker):
+    """Uvicorn worker with uvloop and httptools.
+
+    On SIGTERM the worker stops accepting connections and gives in-flight
+    requests, uploads included, SHUTDOWN_TIMEOUT seconds to finish.
+    """
+    CONFIG_KWARGS = {
+        'loop': 'uvloop',
+        'http': 'httptools',
+        'timeout_graceful_shutdown': settings.SHUTDOWN_TIMEOUT,
+    }
+
+
+def post_fork(server, worker) -> None:
+    server.log.info(f'Worker {worker.pid} started.')
+
+
+def on_starting(server) -> None:
+    # metric files of a previous run would otherwise be added to this one
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def child_exit(server, worker) -> None:
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def options(bind: str | None = None, workers: int | None = None) -> dict:
+    return {
+        'bind': bind or f'{settings.PROJECT_HOST}:{settings.PROJECT_PORT}',
+        'workers': workers or settings.WEB_WORKERS or cpu_count(),
+        'worker_class': 'core.server.Worker',
+        # every worker imports the app itself, so engines, pools and caches are created after fork
+        'preload_app': False,
+        # the arbiter kills workers still busy after this, so it must outlast uvicorn's own drain
+        'graceful_timeout': settings.SHUTDOWN_TIMEOUT + 5,
+        'on_starting': on_starting,
+        'post_fork': post_fork,
+        'child_exit': child_exit,
+    }
+
+
+class Application(BaseApplication):
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from main import app
+        return app
@@ -1,15 +1,120 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import time
+import uuid
+from dataclasses import asdict, dataclass
+
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from core.config import settings, logger
+from core.metrics import instrument_engine
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    waiting: int = 0
+    waits: int = 0
+    wait_time: float = 0.0
+    max_wait: float = 0.0
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that counts checkouts and the time callers spend waiting for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        self.stats.checkouts += 1
+        if self.checkedin() or self._max_overflow < 0 or self.overflow() < self._max_overflow:
+            return super()._do_get()
+        # nothing idle and no overflow left: this caller queues until a connection is returned
+        self.stats.waiting += 1
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            self.stats.waiting -= 1
+            self.stats.waits += 1
+            self.stats.wait_time += waited
+            self.stats.max_wait = max(self.stats.max_wait, waited)
+
+    def status_dict(self) -> dict:
+        return {
+            'size': self.size(),
+            'checked_out': self.checkedout(),
+            'idle': self.checkedin(),
+            'overflow': max(self.overflow(), 0),
+        } | asdict(self.stats)
+
+
+def engine_options() -> dict:
+    options = {
+        'poolclass': InstrumentedPool,
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+        'pool_pre_ping': settings.DB_POOL_PRE_PING,
+    }
+    if settings.DB_PGBOUNCER:
+        # in transaction pooling mode consecutive statements may reach different server
+        # connections, so named prepared statements must be unique and never reused
+        options['connect_args'] = {
+            'statement_cache_size': 0,
+            'prepared_statement_cache_size': 0,
+            'prepared_statement_name_func': lambda: f'__asyncpg_{uuid.uuid4()}__',
+        }
+    else:
+        options['connect_args'] = {'prepared_statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE}
+    return options
+
 
-logger.info(f'DATABASE_URL: {settings.DATABASE_URL}')
+engine: AsyncEngine | None = None
 
-engine = create_async_engine(settings.DATABASE_URL, future=True)
+session_factory = sessionmaker(class_=AsyncSession, expire_on_commit=False)
 
-async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+def init_engine() -> AsyncEngine:
+    """Create this process' engine on first use.
+
+    Nothing is created at import time, so forked workers never share pooled connections.
+    """
+    global engine
+    if engine is None:
+        logger.info(f'DATABASE_URL: {settings.DATABASE_URL}')
+        engine = create_async_engine(settings.DATABASE_URL, future=True, **engine_options())
+        if settings.METRICS:
+            instrument_engine(engine)
+        session_factory.configure(bind=engine)
+    return engine
+
+
+async def dispose_engine() -> None:
+    global engine
+    if engine is not None:
+        await engine.dispose()
+        engine = None
+
+
+def async_session() -> AsyncSession:
+    init_engine()
+    return session_factory()
 
 
 async def get_session() -> AsyncSession:
+    # sessions are lazy: a connection is checked out on the first query only
     async with async_session() as session:
         yield session
+
+
+async def release(session: AsyncSession) -> None:
+    """Give the connection back to the pool before a long response; loaded objects stay usable."""
+    await session.close()
+
+
+def pool_status() -> dict:
+    return init_engine().sync_engine.pool.status_dict()
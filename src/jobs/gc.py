@@ -0,0 +1,40 @@
+import asyncio
+import logging
+import sys
+
+sys.path.append('src')
+
+from core.config import settings
+from db.db import async_session
+from services.blobs import blob_crud, blob_store
+from services.files import file_crud
+from services.throttle import Throttle
+from services.uploads import part_store, upload_crud
+
+logger = logging.getLogger(__name__)
+
+
+async def collect_garbage() -> int:
+    """Reclaim storage in the background: files past trash retention, then unreferenced blobs.
+
+    Unlinks are rate limited to RECLAIM_RATE per second, in batches of RECLAIM_BATCH rows.
+    """
+    removed = purged = 0
+    throttle = Throttle(settings.RECLAIM_RATE)
+    async with async_session() as db:
+        await upload_crud.expire(db, part_store, ttl=settings.UPLOAD_SESSION_TTL)
+        while batch := await file_crud.purge(
+                db, retention=settings.TRASH_RETENTION, limit=settings.RECLAIM_BATCH, throttle=throttle
+        ):
+            purged += batch
+        while collected := await blob_crud.collect_garbage(
+                db, blob_store, grace=settings.BLOB_GC_GRACE, limit=settings.RECLAIM_BATCH, throttle=throttle
+        ):
+            removed += collected
+    parts = await blob_store.sweep_tmp(settings.BLOB_GC_GRACE)
+    logger.info(f'Blob gc finished: {purged} deleted files purged, {removed} blobs, {parts} stale parts removed.')
+    return removed
+
+
+if __name__ == '__main__':
+    asyncio.run(collect_garbage())
@@ -0,0 +1,30 @@
+import argparse
+import asyncio
+import logging
+import sys
+
+sys.path.append('src')
+
+from core.config import settings
+from db.db import async_session
+from services.blobs import blob_store
+from services.scrubber import ScrubStats, Scrubber
+
+logger = logging.getLogger(__name__)
+
+
+async def scrub(limit: int | None = None) -> ScrubStats:
+    scrubber = Scrubber(blob_store, rate=settings.SCRUB_RATE, batch=settings.SCRUB_BATCH)
+    async with async_session() as db:
+        stats = await scrubber.run(db, limit=limit)
+    logger.info(
+        f'Scrub finished: {stats.checked} blobs, {stats.corrupt} corrupt, {stats.unreadable} unreadable, '
+        f'{stats.bytes} bytes read.'
+    )
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--limit', type=int, help='blobs to verify; default: the rest of the current pass')
+    asyncio.run(scrub(parser.parse_args().limit))
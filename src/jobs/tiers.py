@@ -0,0 +1,45 @@
+import argparse
+import asyncio
+import logging
+import sys
+
+sys.path.append('src')
+
+from core.config import settings
+from db.db import async_session
+from services.blobs import blob_store
+from services.throttle import Throttle
+from services.tiers import TieredStorage, cold_tier
+
+logger = logging.getLogger(__name__)
+
+
+async def demote(packs: int | None = None) -> int:
+    """Move blobs not downloaded for COLD_AFTER seconds into packs on the cold tier.
+
+    Each pack holds up to TIER_BATCH blobs and PACK_SIZE bytes; copying is rate limited
+    to TIER_RATE bytes per second.
+    """
+    if not isinstance(blob_store.backend, TieredStorage):
+        logger.info('No cold tier configured (COLD_FOLDER), nothing to do.')
+        return 0
+    moved = written = 0
+    throttle = Throttle(settings.TIER_RATE)
+    async with async_session() as db:
+        while packs is None or written < packs:
+            batch = await cold_tier.demote(
+                db, blob_store, cold_after=settings.COLD_AFTER, pack_size=settings.PACK_SIZE,
+                limit=settings.TIER_BATCH, throttle=throttle
+            )
+            if not batch:
+                break
+            moved += batch
+            written += 1
+    logger.info(f'Tiering finished: {moved} blobs moved to the cold tier in {written} packs.')
+    return moved
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packs', type=int, help='packs to write; default: until no cold blob is left')
+    asyncio.run(demote(parser.parse_args().packs))
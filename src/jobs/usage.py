@@ -0,0 +1,18 @@
+import asyncio
+import sys
+
+sys.path.append('src')
+
+from db.db import async_session
+from services.directories import directory_crud
+from services.usage import usage_crud
+
+
+async def reconcile_usage() -> int:
+    async with async_session() as db:
+        await directory_crud.rebuild(db)
+        return await usage_crud.reconcile(db)
+
+
+if __name__ == '__main__':
+    asyncio.run(reconcile_usage())
@@ -0,0 +1,38 @@
+"""Standalone job worker, for running background jobs apart from the web workers (JOB_WORKER=0 there).
+
+    python src/jobs/worker.py
+    python src/jobs/worker.py --drain
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import sys
+
+sys.path.append('src')
+
+from core.config import settings
+from db.db import dispose_engine
+from services import tasks  # noqa: F401 - registers the job types
+from services.jobs import job_worker
+
+logger = logging.getLogger(__name__)
+
+
+async def work(drain: bool) -> None:
+    if drain:
+        logger.info(f'Ran {await job_worker.drain()} jobs.')
+    else:
+        loop = asyncio.get_running_loop()
+        runner = asyncio.create_task(job_worker.run())
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, job_worker.stopping.set)
+        await runner
+        await job_worker.close(settings.SHUTDOWN_TIMEOUT)
+    await dispose_engine()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--drain', action='store_true', help='run the jobs that are due and exit')
+    asyncio.run(work(parser.parse_args().drain))
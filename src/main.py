@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import sys
 
@@ -6,9 +7,23 @@ sys.path.append('src')
 import uvicorn
 from fastapi import FastAPI
 
+from api.metrics import MetricsMiddleware, router as metrics_router
 from api.v1.auth import api_auth_router
+from api.v1.directories import router as directories_router
+from api.v1.jobs import router as jobs_router
+from api.v1.links import router as links_router
 from api.v1.routes import router
+from api.v1.trash import router as trash_router
+from api.v1.uploads import router as uploads_router
 from core.config import settings
+from core.metrics import monitor_loop
+from db.db import dispose_engine, init_engine
+from services import compression, ingest, tasks  # noqa: F401 - registers the job types
+from services.blobs import blob_store
+from services.hotfiles import hot_files
+from services.jobs import job_worker
+from services.limits import transfer_limits
+from services.tiers import access_log
 
 logger = logging.getLogger(__name__)
 
@@ -25,9 +40,48 @@ app = FastAPI(
         },
     ],
 )
+# tasks that live as long as the worker
+background: set[asyncio.Task] = set()
+
+
+@app.on_event('startup')
+async def startup() -> None:
+    # runs in every worker process, after fork
+    init_engine()
+    if settings.METRICS:
+        background.add(asyncio.create_task(monitor_loop(settings.LOOP_LAG_INTERVAL)))
+    if settings.JOB_WORKER:
+        background.add(asyncio.create_task(job_worker.run()))
+    if settings.ACCESS_FLUSH_INTERVAL:
+        background.add(asyncio.create_task(access_log.run(settings.ACCESS_FLUSH_INTERVAL)))
+
+
+@app.on_event('shutdown')
+async def shutdown() -> None:
+    # uvicorn has drained the in-flight requests by the time this runs
+    await job_worker.close(settings.SHUTDOWN_TIMEOUT)
+    for task in background:
+        task.cancel()
+    await access_log.close()
+    await dispose_engine()
+    await blob_store.backend.close()
+    await hot_files.close()
+    await transfer_limits.close()
+    compression.executor.shutdown()
+    ingest.executor.shutdown()
+
 
 app.include_router(router, prefix='/v1', tags=['v1'], )
+app.include_router(uploads_router, prefix='/v1', tags=['v1'], )
+app.include_router(directories_router, prefix='/v1', tags=['v1'], )
+app.include_router(trash_router, prefix='/v1', tags=['v1'], )
+app.include_router(jobs_router, prefix='/v1', tags=['v1'], )
+app.include_router(links_router, prefix='/v1', tags=['v1'], )
 app.include_router(api_auth_router, prefix='/v1', tags=['auth'], )
 
+if settings.METRICS:
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics_router)
+
 if __name__ == '__main__':
     uvicorn.run('main:app', host=settings.PROJECT_HOST, port=settings.PROJECT_PORT, reload=True)
@@ -0,0 +1,36 @@
+"""content-addressed blobs
+
+Revision ID: 3a9c1e7b4f20
+Revises: d5156f88223c
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '3a9c1e7b4f20'
+down_revision = 'd5156f88223c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('blobs',
+                    sa.Column('hash', sa.String(length=64), nullable=False),
+                    sa.Column('size', sa.BigInteger(), nullable=False),
+                    sa.Column('refcount', sa.Integer(), nullable=False),
+                    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+                    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+                    sa.PrimaryKeyConstraint('hash')
+                    )
+    op.add_column('files', sa.Column('blob_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_files_blob_hash'), 'files', ['blob_hash'], unique=False)
+    op.create_foreign_key('files_blob_hash_fkey', 'files', 'blobs', ['blob_hash'], ['hash'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('files_blob_hash_fkey', 'files', type_='foreignkey')
+    op.drop_index(op.f('ix_files_blob_hash'), table_name='files')
+    op.drop_column('files', 'blob_hash')
+    op.drop_table('blobs')
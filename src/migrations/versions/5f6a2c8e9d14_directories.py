@@ -0,0 +1,52 @@
+"""directory index
+
+Revision ID: 5f6a2c8e9d14
+Revises: e8d03b5c7f1a
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '5f6a2c8e9d14'
+down_revision = 'e8d03b5c7f1a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('files', sa.Column('directory', sa.String(length=255), server_default='', nullable=False))
+    # the parent of the normalized path: no empty or '.' segments, so '/docs/a.txt' is in 'docs'
+    op.execute(
+        "UPDATE files SET directory = array_to_string(parts[1:cardinality(parts) - 1], '/') "
+        "FROM (SELECT id, array_remove(array_remove(string_to_array(path, '/'), ''), '.') AS parts FROM files) AS f "
+        "WHERE files.id = f.id"
+    )
+    op.alter_column('files', 'directory', server_default=None)
+    op.create_index('ix_files_user_id_directory_name', 'files', ['user_id', 'directory', 'name'], unique=False)
+    op.create_table('directories',
+                    sa.Column('user_id', sa.UUID(), nullable=False),
+                    sa.Column('path', sa.String(length=255), nullable=False),
+                    sa.Column('parent', sa.String(length=255), nullable=False),
+                    sa.Column('files', sa.BigInteger(), nullable=False),
+                    sa.Column('size', sa.BigInteger(), nullable=False),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('user_id', 'path')
+                    )
+    op.create_index('ix_directories_user_id_parent', 'directories', ['user_id', 'parent'], unique=False)
+    op.execute(
+        "INSERT INTO directories (user_id, path, parent, files, size) "
+        "SELECT user_id, array_to_string(parts[1:depth], '/'), array_to_string(parts[1:depth - 1], '/'), "
+        "count(*), sum(size) "
+        "FROM (SELECT user_id, size, string_to_array(directory, '/') AS parts FROM files WHERE directory <> '') AS f, "
+        "generate_series(1, cardinality(parts)) AS depth "
+        "GROUP BY 1, 2, 3"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_directories_user_id_parent', table_name='directories')
+    op.drop_table('directories')
+    op.drop_index('ix_files_user_id_directory_name', table_name='files')
+    op.drop_column('files', 'directory')
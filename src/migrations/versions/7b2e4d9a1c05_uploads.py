@@ -0,0 +1,33 @@
+"""resumable uploads
+
+Revision ID: 7b2e4d9a1c05
+Revises: 3a9c1e7b4f20
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '7b2e4d9a1c05'
+down_revision = '3a9c1e7b4f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('uploads',
+                    sa.Column('id', sa.UUID(), nullable=False),
+                    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+                    sa.Column('name', sa.String(length=100), nullable=False),
+                    sa.Column('path', sa.String(length=255), nullable=False),
+                    sa.Column('user_id', sa.UUID(), nullable=False),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.alter_column('files', 'size', existing_type=sa.Integer(), type_=sa.BigInteger(), existing_nullable=False)
+
+
+def downgrade() -> None:
+    op.alter_column('files', 'size', existing_type=sa.BigInteger(), type_=sa.Integer(), existing_nullable=False)
+    op.drop_table('uploads')
@@ -0,0 +1,30 @@
+"""stored size and encoding of compressed content
+
+Revision ID: 9d4b7e1f3a62
+Revises: 5f6a2c8e9d14
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '9d4b7e1f3a62'
+down_revision = '5f6a2c8e9d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for table in ('blobs', 'files'):
+        op.add_column(table, sa.Column('stored_size', sa.BigInteger(), nullable=True))
+        op.add_column(table, sa.Column('encoding', sa.String(length=16), nullable=True))
+        # everything stored so far is uncompressed
+        op.execute(f'UPDATE {table} SET stored_size = size')
+        op.alter_column(table, 'stored_size', nullable=False)
+
+
+def downgrade() -> None:
+    for table in ('files', 'blobs'):
+        op.drop_column(table, 'encoding')
+        op.drop_column(table, 'stored_size')
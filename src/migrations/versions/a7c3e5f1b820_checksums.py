@@ -0,0 +1,37 @@
+"""xxh3 checksums, blob verification state and job checkpoints
+
+Revision ID: a7c3e5f1b820
+Revises: 9d4b7e1f3a62
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e5f1b820'
+down_revision = '9d4b7e1f3a62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # existing rows get their xxh3 from the scrubber's first pass
+    op.add_column('blobs', sa.Column('xxh3', sa.String(length=16), nullable=True))
+    op.add_column('blobs', sa.Column('verified_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('blobs', sa.Column('corrupt', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.add_column('files', sa.Column('xxh3', sa.String(length=16), nullable=True))
+    op.create_table('checkpoints',
+                    sa.Column('name', sa.String(length=64), nullable=False),
+                    sa.Column('cursor', sa.String(length=255), nullable=True),
+                    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+                    sa.PrimaryKeyConstraint('name')
+                    )
+
+
+def downgrade() -> None:
+    op.drop_table('checkpoints')
+    op.drop_column('files', 'xxh3')
+    op.drop_column('blobs', 'corrupt')
+    op.drop_column('blobs', 'verified_at')
+    op.drop_column('blobs', 'xxh3')
@@ -0,0 +1,44 @@
+"""trash of soft-deleted files
+
+Revision ID: b2d8f4a6c913
+Revises: a7c3e5f1b820
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b2d8f4a6c913'
+down_revision = 'a7c3e5f1b820'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('deleted_files',
+                    sa.Column('id', sa.UUID(), nullable=False),
+                    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+                    sa.Column('name', sa.String(length=100), nullable=False),
+                    sa.Column('path', sa.String(length=255), nullable=False),
+                    sa.Column('directory', sa.String(length=255), nullable=False),
+                    sa.Column('size', sa.BigInteger(), nullable=False),
+                    sa.Column('stored_size', sa.BigInteger(), nullable=False),
+                    sa.Column('encoding', sa.String(length=16), nullable=True),
+                    sa.Column('is_downloadable', sa.Boolean(), nullable=False),
+                    sa.Column('blob_hash', sa.String(length=64), nullable=True),
+                    sa.Column('xxh3', sa.String(length=16), nullable=True),
+                    sa.Column('user_id', sa.UUID(), nullable=False),
+                    sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+                    sa.ForeignKeyConstraint(['blob_hash'], ['blobs.hash'], ),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_deleted_files_deleted_at', 'deleted_files', ['deleted_at'], unique=False)
+    op.create_index('ix_deleted_files_user_id_deleted_at', 'deleted_files', ['user_id', 'deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_deleted_files_user_id_deleted_at', table_name='deleted_files')
+    op.drop_index('ix_deleted_files_deleted_at', table_name='deleted_files')
+    op.drop_table('deleted_files')
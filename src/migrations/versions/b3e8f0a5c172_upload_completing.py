@@ -0,0 +1,23 @@
+"""completing flag on resumable uploads
+
+Revision ID: b3e8f0a5c172
+Revises: f2a7d4c9e316
+Create Date: 2026-10-21 10:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8f0a5c172'
+down_revision = 'f2a7d4c9e316'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('uploads', sa.Column('completing', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('uploads', 'completing')
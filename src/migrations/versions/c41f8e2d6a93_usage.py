@@ -0,0 +1,34 @@
+"""per-user usage counters
+
+Revision ID: c41f8e2d6a93
+Revises: 7b2e4d9a1c05
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c41f8e2d6a93'
+down_revision = '7b2e4d9a1c05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('usage',
+                    sa.Column('user_id', sa.UUID(), nullable=False),
+                    sa.Column('files', sa.BigInteger(), nullable=False),
+                    sa.Column('used', sa.BigInteger(), nullable=False),
+                    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('user_id')
+                    )
+    op.execute(
+        'INSERT INTO usage (user_id, files, used) '
+        'SELECT user_id, count(id), coalesce(sum(size), 0) FROM files GROUP BY user_id'
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('usage')
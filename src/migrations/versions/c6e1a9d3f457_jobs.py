@@ -0,0 +1,44 @@
+"""background job queue
+
+Revision ID: c6e1a9d3f457
+Revises: b2d8f4a6c913
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'c6e1a9d3f457'
+down_revision = 'b2d8f4a6c913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('jobs',
+                    sa.Column('id', sa.UUID(), nullable=False),
+                    sa.Column('kind', sa.String(length=64), nullable=False),
+                    sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+                    sa.Column('status', sa.String(length=16), nullable=False),
+                    sa.Column('attempts', sa.Integer(), nullable=False),
+                    sa.Column('max_attempts', sa.Integer(), nullable=False),
+                    sa.Column('run_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+                    sa.Column('locked_at', sa.DateTime(timezone=True), nullable=True),
+                    sa.Column('last_error', sa.Text(), nullable=True),
+                    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+                    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+                    sa.Column('user_id', sa.UUID(), nullable=True),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_jobs_kind_run_at', 'jobs', ['kind', 'run_at'], unique=False,
+                    postgresql_where=sa.text("status IN ('queued', 'running')"))
+    op.create_index('ix_jobs_user_id_created_at', 'jobs', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_jobs_user_id_created_at', table_name='jobs')
+    op.drop_index('ix_jobs_kind_run_at', table_name='jobs', postgresql_where=sa.text("status IN ('queued', 'running')"))
+    op.drop_table('jobs')
@@ -0,0 +1,29 @@
+"""files listing indexes
+
+Revision ID: e8d03b5c7f1a
+Revises: c41f8e2d6a93
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e8d03b5c7f1a'
+down_revision = 'c41f8e2d6a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_files_user_id_created_at_id', 'files', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index(
+        'ix_files_user_id_path', 'files', ['user_id', 'path'], unique=False,
+        postgresql_ops={'path': 'varchar_pattern_ops'}
+    )
+    op.create_index('ix_files_user_id_name', 'files', ['user_id', 'name'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_files_user_id_name', table_name='files')
+    op.drop_index('ix_files_user_id_path', table_name='files')
+    op.drop_index('ix_files_user_id_created_at_id', table_name='files')
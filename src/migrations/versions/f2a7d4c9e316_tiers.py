@@ -0,0 +1,44 @@
+"""storage tiers and access tracking
+
+Revision ID: f2a7d4c9e316
+Revises: c6e1a9d3f457
+Create Date: 2026-10-20 12:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'f2a7d4c9e316'
+down_revision = 'c6e1a9d3f457'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('packs',
+                    sa.Column('id', sa.UUID(), nullable=False),
+                    sa.Column('size', sa.BigInteger(), nullable=False),
+                    sa.Column('blobs', sa.Integer(), nullable=False),
+                    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.add_column('blobs', sa.Column('downloads', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('blobs', sa.Column('last_access_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('blobs', sa.Column('pack_id', sa.UUID(), nullable=True))
+    op.add_column('blobs', sa.Column('pack_offset', sa.BigInteger(), nullable=True))
+    op.create_foreign_key('blobs_pack_id_fkey', 'blobs', 'packs', ['pack_id'], ['id'])
+    op.create_index(op.f('ix_blobs_pack_id'), 'blobs', ['pack_id'], unique=False)
+    op.create_index('ix_blobs_last_access', 'blobs', [sa.text('coalesce(last_access_at, created_at)')], unique=False,
+                    postgresql_where=sa.text('pack_id IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_blobs_last_access', table_name='blobs', postgresql_where=sa.text('pack_id IS NULL'))
+    op.drop_index(op.f('ix_blobs_pack_id'), table_name='blobs')
+    op.drop_constraint('blobs_pack_id_fkey', 'blobs', type_='foreignkey')
+    op.drop_column('blobs', 'pack_offset')
+    op.drop_column('blobs', 'pack_id')
+    op.drop_column('blobs', 'last_access_at')
+    op.drop_column('blobs', 'downloads')
+    op.drop_table('packs')
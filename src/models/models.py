@@ -2,8 +2,10 @@ import uuid
 
 from fastapi import Depends
 from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, func, DateTime
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (
+    BigInteger, Boolean, Column, ForeignKey, Index, Integer, String, Text, false, func, text, DateTime
+)
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import declarative_base, relationship  # type: ignore
 
@@ -12,18 +14,167 @@ from db.db import get_session
 Base = declarative_base()
 
 
+def parent_directory(context) -> str:
+    return context.get_current_parameters()['path'].rpartition('/')[0]
+
+
+def logical_size(context) -> int:
+    return context.get_current_parameters()['size']
+
+
 class File(Base):
     __tablename__ = "files"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     name = Column(String(100), nullable=False)
     path = Column(String(255), nullable=False, unique=True)
-    size = Column(Integer(), nullable=False)
+    directory = Column(String(255), default=parent_directory, nullable=False)
+    size = Column(BigInteger(), nullable=False)
+    stored_size = Column(BigInteger(), default=logical_size, nullable=False)
+    encoding = Column(String(16), nullable=True)
     is_downloadable = Column(Boolean(), default=True, nullable=False)
+    blob_hash = Column(String(64), ForeignKey('blobs.hash'), nullable=True, index=True)
+    xxh3 = Column(String(16), nullable=True)
 
     user_id = Column(UUID(as_uuid=True), ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     user = relationship('User', backref='files')
 
+    __table_args__ = (
+        Index('ix_files_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_files_user_id_path', 'user_id', 'path', postgresql_ops={'path': 'varchar_pattern_ops'}),
+        Index('ix_files_user_id_name', 'user_id', 'name'),
+        Index('ix_files_user_id_directory_name', 'user_id', 'directory', 'name'),
+    )
+
+    @property
+    def sha256(self) -> str | None:
+        # content-addressed: the blob key is the sha256 of the raw content
+        return self.blob_hash
+
+
+class DeletedFile(Base):
+    """A soft-deleted file: the row moved out of `files` with the blob reference it holds."""
+    __tablename__ = "deleted_files"
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    created_at = Column(DateTime(timezone=True))
+    name = Column(String(100), nullable=False)
+    path = Column(String(255), nullable=False)
+    directory = Column(String(255), nullable=False)
+    size = Column(BigInteger(), nullable=False)
+    stored_size = Column(BigInteger(), nullable=False)
+    encoding = Column(String(16), nullable=True)
+    is_downloadable = Column(Boolean(), nullable=False)
+    blob_hash = Column(String(64), ForeignKey('blobs.hash'), nullable=True)
+    xxh3 = Column(String(16), nullable=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+    __table_args__ = (
+        Index('ix_deleted_files_user_id_deleted_at', 'user_id', 'deleted_at'),
+    )
+
+
+class Directory(Base):
+    __tablename__ = "directories"
+    user_id = Column(UUID(as_uuid=True), ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    path = Column(String(255), primary_key=True)
+    parent = Column(String(255), nullable=False)
+    files = Column(BigInteger(), default=0, nullable=False)
+    size = Column(BigInteger(), default=0, nullable=False)
+
+    __table_args__ = (
+        Index('ix_directories_user_id_parent', 'user_id', 'parent'),
+    )
+
+
+class Blob(Base):
+    __tablename__ = "blobs"
+    hash = Column(String(64), primary_key=True)
+    size = Column(BigInteger(), nullable=False)
+    stored_size = Column(BigInteger(), default=logical_size, nullable=False)
+    encoding = Column(String(16), nullable=True)
+    refcount = Column(Integer(), default=1, nullable=False)
+    xxh3 = Column(String(16), nullable=True)
+    verified_at = Column(DateTime(timezone=True), nullable=True)
+    corrupt = Column(Boolean(), default=False, server_default=false(), nullable=False)
+    downloads = Column(BigInteger(), default=0, server_default='0', nullable=False)
+    last_access_at = Column(DateTime(timezone=True), nullable=True)
+    # set while the content lives in a pack on the cold tier instead of the hot one
+    pack_id = Column(UUID(as_uuid=True), ForeignKey('packs.id'), nullable=True, index=True)
+    pack_offset = Column(BigInteger(), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # demotion candidates, least recently used first
+        Index(
+            'ix_blobs_last_access', text('coalesce(last_access_at, created_at)'),
+            postgresql_where=text('pack_id IS NULL')
+        ),
+    )
+
+
+class Pack(Base):
+    """A container file on the cold tier holding many blobs back to back."""
+    __tablename__ = "packs"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    size = Column(BigInteger(), nullable=False)
+    # blobs still packed here; the pack is deleted when none are left
+    blobs = Column(Integer(), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class Checkpoint(Base):
+    """Where a resumable background job stopped."""
+    __tablename__ = "checkpoints"
+    name = Column(String(64), primary_key=True)
+    cursor = Column(String(255), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class Usage(Base):
+    __tablename__ = "usage"
+    user_id = Column(UUID(as_uuid=True), ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    files = Column(BigInteger(), default=0, nullable=False)
+    used = Column(BigInteger(), default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class Upload(Base):
+    __tablename__ = "uploads"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    name = Column(String(100), nullable=False)
+    path = Column(String(255), nullable=False)
+    # set while the parts are assembled, outside of any transaction
+    completing = Column(Boolean(), default=False, server_default=false(), nullable=False)
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+
+
+class Job(Base):
+    """A unit of background work; claimed by workers with SELECT ... FOR UPDATE SKIP LOCKED."""
+    __tablename__ = "jobs"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    kind = Column(String(64), nullable=False)
+    payload = Column(JSONB(), nullable=False, default=dict)
+    status = Column(String(16), nullable=False, default='queued')
+    attempts = Column(Integer(), nullable=False, default=0)
+    max_attempts = Column(Integer(), nullable=False)
+    run_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text(), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey('user.id', ondelete='CASCADE'), nullable=True)
+
+    __table_args__ = (
+        # only claimable rows are indexed, so finished jobs don't slow down polling
+        Index('ix_jobs_kind_run_at', 'kind', 'run_at', postgresql_where=text("status IN ('queued', 'running')")),
+        Index('ix_jobs_user_id_created_at', 'user_id', 'created_at'),
+    )
+
 
 class User(Base):
     __tablename__ = "user"
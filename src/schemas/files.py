@@ -1,6 +1,7 @@
 import datetime
+from typing import Literal
 
-from pydantic import BaseModel
+from pydantic import BaseModel, conint, constr
 from pydantic.types import UUID
 
 
@@ -14,6 +15,10 @@ class FileBase(BaseModel):
 
 class FileCreate(FileBase):
     user_id: UUID
+    blob_hash: str | None
+    stored_size: int | None
+    encoding: str | None
+    xxh3: str | None
 
 
 class FileUpdate(FileBase):
@@ -22,22 +27,117 @@ class FileUpdate(FileBase):
 
 class FileInDBBase(FileBase):
     created_at: datetime.datetime | None
+    stored_size: int | None
+    sha256: str | None
+    xxh3: str | None
 
     class Config:
         orm_mode = True
 
 
+class PoolStatus(BaseModel):
+    size: int
+    checked_out: int
+    idle: int
+    overflow: int
+    checkouts: int
+    waiting: int
+    waits: int
+    wait_time: float
+    max_wait: float
+
+
 class Ping(BaseModel):
     api: str
     python: list
     db: datetime.timedelta
+    pool: PoolStatus | None = None
 
 
 class Files(BaseModel):
     account_id: str
     files: list[FileInDBBase]
+    next_cursor: str | None = None
 
 
 class MemoryUsage(BaseModel):
     files: int
     used: int
+
+
+class UploadInDB(BaseModel):
+    id: UUID
+    name: str
+    path: str
+    created_at: datetime.datetime | None
+
+    class Config:
+        orm_mode = True
+
+
+class UploadPart(BaseModel):
+    number: int
+    size: int
+
+
+class UploadStatus(UploadInDB):
+    parts: list[UploadPart]
+
+
+class DirectoryInDB(BaseModel):
+    path: str
+    files: int
+    size: int
+
+    class Config:
+        orm_mode = True
+
+
+class DirectoryListing(DirectoryInDB):
+    directories: list[DirectoryInDB]
+    entries: list[FileInDBBase]
+    next_cursor: str | None = None
+
+
+class DeletedFileInDB(FileBase):
+    deleted_at: datetime.datetime
+
+    class Config:
+        orm_mode = True
+
+
+class DeleteRequest(BaseModel):
+    ids: list[UUID]
+
+
+class HashUpload(BaseModel):
+    path: str
+    name: str
+    sha256: constr(regex=r'^[0-9a-f]{64}$')  # noqa: F722
+    size: conint(ge=0)
+
+
+class SharedLink(BaseModel):
+    url: str
+    expires_at: datetime.datetime
+
+
+class JobStatus(BaseModel):
+    id: UUID
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    run_at: datetime.datetime
+    last_error: str | None
+    created_at: datetime.datetime | None
+    updated_at: datetime.datetime | None
+
+    class Config:
+        orm_mode = True
+
+
+class ArchiveRequest(BaseModel):
+    ids: list[UUID] = []
+    directory: str | None = None
+    format: Literal['zip', 'tar'] = 'zip'
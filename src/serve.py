@@ -0,0 +1,17 @@
+"""Production server: gunicorn with one uvicorn worker per available core.
+
+    python src/serve.py --bind 0.0.0.0:8000 --workers 4
+"""
+import argparse
+import sys
+
+sys.path.append('src')
+
+from core.server import Application, options
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bind')
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+    Application(options(args.bind, args.workers)).run()
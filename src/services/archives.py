@@ -0,0 +1,167 @@
+import datetime
+import tarfile
+import zipfile
+import zlib
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator
+
+from services.compression import decompress
+from services.storage import StorageBackend
+
+TAR_BLOCK = tarfile.BLOCKSIZE
+
+
+@dataclass
+class ArchiveEntry:
+    name: str
+    key: str
+    size: int
+    modified: datetime.datetime
+    encoding: str | None = None
+
+
+class Sink:
+    """Write-only buffer that zipfile writes into and the response generator drains."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+async def zip_stream(entries: AsyncIterable[ArchiveEntry], backend: StorageBackend) -> AsyncIterator[bytes]:
+    # the sink is not seekable, so zipfile writes data descriptors after every member
+    # and never needs to go back: memory stays at about one chunk per request
+    sink = Sink()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        async for entry in entries:
+            info = zipfile.ZipInfo(entry.name, date_time=entry.modified.timetuple()[:6])
+            # a known size lets zipfile pick zip64 headers up front for large members
+            info.file_size = entry.size
+            with archive.open(info, mode='w') as member:
+                async for chunk in decompress(backend.read(entry.key), entry.encoding):
+                    member.write(chunk)
+                    yield sink.drain()
+            if data := sink.drain():
+                yield data
+    yield sink.drain()
+
+
+async def tar_stream(entries: AsyncIterable[ArchiveEntry], backend: StorageBackend) -> AsyncIterator[bytes]:
+    async for entry in entries:
+        info = tarfile.TarInfo(entry.name)
+        info.size = entry.size
+        info.mtime = int(entry.modified.timestamp())
+        yield info.tobuf(format=tarfile.PAX_FORMAT)
+        async for chunk in decompress(backend.read(entry.key), entry.encoding):
+            yield chunk
+        if remainder := entry.size % TAR_BLOCK:
+            yield b'\0' * (TAR_BLOCK - remainder)
+    yield b'\0' * TAR_BLOCK * 2
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+async def gunzip(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    decompressor = zlib.decompressobj(wbits=47)
+    async for chunk in chunks:
+        try:
+            # bounded output keeps a small, highly compressed chunk from expanding all at once
+            data = decompressor.decompress(chunk, TAR_BLOCK * 128)
+            while data:
+                yield data
+                data = decompressor.decompress(decompressor.unconsumed_tail, TAR_BLOCK * 128)
+        except zlib.error as err:
+            raise ArchiveError(str(err)) from err
+
+
+class TarReader:
+    """Regular files of a tar stream, read as it arrives; nothing is spooled to disk."""
+
+    def __init__(self, chunks: AsyncIterable[bytes]):
+        self.chunks = aiter(chunks)
+        self.buffer = bytearray()
+        self.remaining = 0
+
+    async def fill(self) -> None:
+        chunk = await anext(self.chunks, None)
+        if chunk is None:
+            raise ArchiveError('Unexpected end of archive')
+        self.buffer += chunk
+
+    async def read(self, size: int) -> bytes:
+        while len(self.buffer) < size:
+            await self.fill()
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    async def skip(self, size: int) -> None:
+        while size:
+            if not self.buffer:
+                await self.fill()
+            skipped = min(size, len(self.buffer))
+            del self.buffer[:skipped]
+            size -= skipped
+
+    async def content(self) -> AsyncIterator[bytes]:
+        while self.remaining:
+            if not self.buffer:
+                await self.fill()
+            data = bytes(self.buffer[:self.remaining])
+            del self.buffer[:len(data)]
+            self.remaining -= len(data)
+            yield data
+
+    async def entries(self) -> AsyncIterator[tuple[str, AsyncIterator[bytes]]]:
+        """(name, chunks) of every regular file; each one must be read before the next is produced."""
+        pax, long_name = {}, None
+        while (header := await self.read(TAR_BLOCK)) != tarfile.NUL * TAR_BLOCK:
+            try:
+                info = tarfile.TarInfo.frombuf(header, 'utf-8', 'surrogateescape')
+            except tarfile.HeaderError as err:
+                raise ArchiveError(str(err)) from err
+            if info.type in (tarfile.XHDTYPE, tarfile.GNUTYPE_LONGNAME):
+                data = (await self.read(-(-info.size // TAR_BLOCK) * TAR_BLOCK))[:info.size]
+                if info.type == tarfile.XHDTYPE:
+                    pax = parse_pax(data)
+                else:
+                    long_name = data.rstrip(tarfile.NUL).decode('utf-8', 'surrogateescape')
+                continue
+            name = pax.get('path') or long_name or info.name
+            size = int(pax.get('size', info.size))
+            pax, long_name = {}, None
+            padding = -size % TAR_BLOCK
+            if info.type in tarfile.REGULAR_TYPES:
+                self.remaining = size
+                yield name, self.content()
+                # whatever the consumer left unread
+                await self.skip(self.remaining + padding)
+            else:
+                await self.skip(size + padding)
+
+
+def parse_pax(data: bytes) -> dict[str, str]:
+    """Records of a pax extended header, each `<length> <key>=<value>` and a newline."""
+    records, position = {}, 0
+    while position < len(data):
+        length = data[position:position + 20].partition(b' ')[0]
+        end = position + int(length) if length.isdigit() else position
+        if end <= position + len(length):
+            raise ArchiveError('Invalid pax header')
+        key, _, value = data[position + len(length) + 1:end - 1].partition(b'=')
+        records[key.decode('utf-8', 'surrogateescape')] = value.decode('utf-8', 'surrogateescape')
+        position = end
+    return records
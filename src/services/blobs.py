@@ -0,0 +1,269 @@
+import asyncio
+import datetime
+import logging
+import os
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from typing import AsyncIterable
+
+import aiofiles
+import aiofiles.os
+from sqlalchemy import bindparam, delete, func, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from models.models import Blob
+from services import compression
+from services.ingest import Checksums, Hasher, ingest
+from services.throttle import Throttle
+from services.storage import StorageBackend, storage
+from services.tiers import cold_tier, tiered
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StagedBlob:
+    hash: str
+    size: int
+    tmp_path: str
+    stored_size: int | None = None
+    encoding: str | None = None
+    xxh3: str | None = None
+
+    def __post_init__(self):
+        if self.stored_size is None:
+            self.stored_size = self.size
+
+
+def copy_range(src: int, dst: int, length: int, offset: int) -> None:
+    copied = 0
+    while copied < length:
+        if hasattr(os, 'copy_file_range'):
+            sent = os.copy_file_range(src, dst, length - copied, copied, offset + copied)
+        else:
+            os.lseek(dst, offset + copied, os.SEEK_SET)
+            sent = os.sendfile(dst, src, copied, length - copied)
+        if not sent:
+            raise OSError(f'Unexpected end of file after {copied} of {length} bytes.')
+        copied += sent
+
+
+class BlobStore:
+    """Content-addressed storage: every unique content is kept once under its sha256.
+
+    Uploads are staged and hashed on local disk, then handed to the storage backend.
+    """
+
+    def __init__(self, root: str, backend: StorageBackend):
+        self.backend = backend
+        self.tmp_folder = os.path.join(root, 'tmp')
+
+    @staticmethod
+    def key(hash_: str) -> str:
+        # two levels of sharding keep directories small: blobs/ab/cd/abcd...
+        return f'blobs/{hash_[:2]}/{hash_[2:4]}/{hash_}'
+
+    def path(self, hash_: str) -> str | None:
+        return self.backend.local_path(self.key(hash_))
+
+    async def stage(self, chunks: AsyncIterable[bytes], max_size: int) -> StagedBlob:
+        await aiofiles.os.makedirs(self.tmp_folder, exist_ok=True)
+        tmp_path = os.path.join(self.tmp_folder, f'{uuid.uuid4()}.part')
+        try:
+            checksums, size = await ingest(chunks, tmp_path, max_size)
+        except BaseException:
+            await self.discard(tmp_path)
+            raise
+        return StagedBlob(hash=checksums.sha256, size=size, tmp_path=tmp_path, xxh3=checksums.xxh3)
+
+    async def assemble(self, part_paths: list[str]) -> StagedBlob:
+        """Concatenate already stored parts into a staged blob without copying through userspace."""
+        await aiofiles.os.makedirs(self.tmp_folder, exist_ok=True)
+        tmp_path = os.path.join(self.tmp_folder, f'{uuid.uuid4()}.part')
+        try:
+            checksums, size = await asyncio.to_thread(self._assemble, part_paths, tmp_path)
+        except BaseException:
+            await self.discard(tmp_path)
+            raise
+        return StagedBlob(hash=checksums.sha256, size=size, tmp_path=tmp_path, xxh3=checksums.xxh3)
+
+    @staticmethod
+    def _assemble(part_paths: list[str], tmp_path: str) -> tuple[Checksums, int]:
+        hasher = Hasher()
+        buffer = bytearray(2 ** 20)
+        size = 0
+        with open(tmp_path, 'wb') as out_file:
+            for part_path in part_paths:
+                with open(part_path, 'rb') as part:
+                    length = os.fstat(part.fileno()).st_size
+                    copy_range(part.fileno(), out_file.fileno(), length, size)
+                    # the hash still needs one read pass, served from the page cache
+                    while read := part.readinto(buffer):
+                        hasher.update(memoryview(buffer)[:read])
+                size += length
+        return hasher.checksums(), size
+
+    async def encode(self, staged: StagedBlob) -> StagedBlob:
+        """Compress a staged blob when its content is worth it; the hash stays the one of the raw content."""
+        encoding = await compression.sniff(staged.tmp_path, staged.size)
+        if encoding is None:
+            return staged
+        try:
+            tmp_path, stored_size = await compression.compress(staged.tmp_path, encoding)
+        finally:
+            await self.discard(staged.tmp_path)
+        return StagedBlob(
+            hash=staged.hash, size=staged.size, tmp_path=tmp_path, stored_size=stored_size, encoding=encoding,
+            xxh3=staged.xxh3
+        )
+
+    async def encode_many(self, blobs: list[StagedBlob]) -> list[StagedBlob]:
+        """`encode` for a batch, run concurrently; on failure nothing of the batch is left staged."""
+        results = await asyncio.gather(*(self.encode(staged) for staged in blobs), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            await asyncio.gather(*(
+                self.discard(result.tmp_path) for result in results if isinstance(result, StagedBlob)
+            ))
+            raise errors[0]
+        return results
+
+    async def publish(self, staged: StagedBlob) -> bool:
+        """Move a staged blob into place. Returns False when the content is already stored."""
+        key = self.key(staged.hash)
+        if await self.backend.exists(key):
+            await self.discard(staged.tmp_path)
+            return False
+        await self.backend.put_file(key, staged.tmp_path)
+        return True
+
+    async def remove(self, hash_: str) -> None:
+        await self.backend.delete(self.key(hash_))
+
+    async def discard(self, path: str) -> None:
+        try:
+            await aiofiles.os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    async def sweep_tmp(self, older_than: int) -> int:
+        """Remove staged parts left behind by interrupted uploads."""
+        if not await aiofiles.os.path.exists(self.tmp_folder):
+            return 0
+        deadline = time.time() - older_than
+        removed = 0
+        for entry in await aiofiles.os.scandir(self.tmp_folder):
+            if entry.is_file() and entry.stat().st_mtime < deadline:
+                await self.discard(entry.path)
+                removed += 1
+        return removed
+
+
+class RepositoryBlob:
+
+    async def get(self, db: AsyncSession, *, hash_: str) -> Blob | None:
+        return await db.get(Blob, hash_)
+
+    async def acquire(self, db: AsyncSession, staged: StagedBlob):
+        """Take a reference; returns the stored encoding, size and xxh3 and whether this call created the blob."""
+        # the row lock taken here is held until commit, so gc can't drop the blob under us
+        statement = insert(Blob.__table__).values(
+            hash=staged.hash, size=staged.size, stored_size=staged.stored_size, encoding=staged.encoding,
+            xxh3=staged.xxh3, refcount=1
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[Blob.hash],
+            set_={
+                'refcount': Blob.refcount + 1,
+                'xxh3': func.coalesce(Blob.xxh3, statement.excluded.xxh3),
+                'updated_at': func.now(),
+            }
+        ).returning(Blob.encoding, Blob.stored_size, Blob.xxh3, literal_column('xmax = 0').label('created'))
+        return (await db.execute(statement)).one()
+
+    async def reference(self, db: AsyncSession, *, hash_: str, size: int):
+        """Take a reference on stored content by its hash alone; None when it isn't stored intact."""
+        # refcount > 0 keeps gc's victims out, and the row lock keeps gc away until commit
+        statement = update(Blob).where(
+            Blob.hash == hash_, Blob.size == size, Blob.refcount > 0, Blob.corrupt.is_(False)
+        ).values(refcount=Blob.refcount + 1, updated_at=func.now()).returning(
+            Blob.encoding, Blob.stored_size, Blob.xxh3
+        )
+        return (await db.execute(statement)).one_or_none()
+
+    async def known(self, db: AsyncSession, hashes: set[str]) -> set[str]:
+        if not hashes:
+            return set()
+        return set((await db.execute(select(Blob.hash).where(Blob.hash.in_(hashes)))).scalars())
+
+    async def acquire_many(self, db: AsyncSession, blobs: list[StagedBlob], counts: dict[str, int]) -> dict:
+        """`acquire` for distinct contents in one statement, taking counts[hash] references each."""
+        statement = insert(Blob.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Blob.hash],
+            set_={
+                'refcount': Blob.refcount + statement.excluded.refcount,
+                'xxh3': func.coalesce(Blob.xxh3, statement.excluded.xxh3),
+                'updated_at': func.now(),
+            }
+        ).returning(Blob.hash, Blob.encoding, Blob.stored_size, Blob.xxh3, literal_column('xmax = 0').label('created'))
+        # rows are locked in hash order, like release_many, so concurrent batches can't deadlock
+        rows = await db.execute(statement.values([
+            {
+                'hash': staged.hash, 'size': staged.size, 'stored_size': staged.stored_size,
+                'encoding': staged.encoding, 'xxh3': staged.xxh3, 'refcount': counts[staged.hash],
+            }
+            for staged in sorted(blobs, key=lambda staged: staged.hash)
+        ]))
+        return {row.hash: row for row in rows}
+
+    async def release_many(self, db: AsyncSession, counts: dict[str, int]) -> None:
+        if not counts:
+            return
+        statement = update(Blob.__table__).where(Blob.hash == bindparam('b_hash')).values(
+            refcount=Blob.refcount - bindparam('b_count'), updated_at=func.now()
+        )
+        # one executemany round trip for the whole batch
+        connection = await db.connection()
+        await connection.execute(
+            statement, [{'b_hash': hash_, 'b_count': count} for hash_, count in sorted(counts.items())]
+        )
+
+    async def collect_garbage(
+            self,
+            db: AsyncSession,
+            store: BlobStore,
+            *,
+            grace: int,
+            limit: int = 1000,
+            throttle: Throttle | None = None
+    ) -> int:
+        statement = select(Blob.hash, Blob.pack_id).where(
+            Blob.refcount <= 0,
+            Blob.updated_at < func.now() - datetime.timedelta(seconds=grace)
+        ).limit(limit).with_for_update(skip_locked=True)
+        rows = (await db.execute(statement)).all()
+        if not rows:
+            return 0
+        hashes = [row.hash for row in rows]
+        # unlink while the rows are locked: a concurrent upload of the same content
+        # waits on the lock and then re-inserts the row and republishes the blob
+        for hash_ in hashes:
+            await store.remove(hash_)
+            if throttle is not None:
+                await throttle.consume()
+        await db.execute(delete(Blob).where(Blob.hash.in_(hashes)))
+        # packed blobs only give their space back once their whole pack is unused
+        emptied = await cold_tier.release_packs(db, Counter(row.pack_id for row in rows if row.pack_id is not None))
+        await db.commit()
+        await cold_tier.drop_packs(store.backend, emptied)
+        logger.info(f'Collected {len(hashes)} unreferenced blobs.')
+        return len(hashes)
+
+
+blob_store = BlobStore(settings.FILE_FOLDER, tiered(storage))
+blob_crud = RepositoryBlob()
@@ -0,0 +1,166 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, TypeVar
+from urllib.parse import urlsplit
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class TTLCache(Generic[K, V]):
+    """In-process LRU cache whose entries also expire `ttl` seconds after they were stored.
+
+    `maxsize` bounds the total weight of the entries; by default every entry weighs 1.
+    """
+
+    def __init__(
+            self,
+            maxsize: int,
+            ttl: float,
+            clock: Callable[[], float] = time.monotonic,
+            weigh: Callable[[V], int] = lambda value: 1
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.weigh = weigh
+        self.entries: OrderedDict[K, tuple[float, V, int]] = OrderedDict()
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: K) -> V | None:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= self.clock():
+            if entry is not None:
+                self.pop(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: K, value: V) -> None:
+        weight = self.weigh(value)
+        if self.maxsize <= 0 or self.ttl <= 0 or weight > self.maxsize:
+            return
+        self.pop(key)
+        self.entries[key] = (self.clock() + self.ttl, value, weight)
+        self.weight += weight
+        while self.weight > self.maxsize:
+            _, (_, _, evicted) = self.entries.popitem(last=False)
+            self.weight -= evicted
+            self.evictions += 1
+
+    def pop(self, key: K) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.weight = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'entries': len(self.entries),
+            'weight': self.weight,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisClient:
+    """Just enough of the Redis protocol (RESP2) for a shared cache: GET, SET with expiry and DEL.
+
+    Works with Redis, Valkey, KeyDB, Dragonfly and other servers speaking the protocol.
+    """
+
+    def __init__(self, url: str, max_connections: int = 16, timeout: float = 1.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or 'localhost'
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.database = int(parts.path.strip('/') or 0)
+        self.timeout = timeout
+        self.slots = asyncio.Semaphore(max_connections)
+        self.idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+
+    @staticmethod
+    def encode(*args: str | bytes | int) -> bytes:
+        command = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            command.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        return b''.join(command)
+
+    @classmethod
+    async def reply(cls, reader: asyncio.StreamReader) -> Any:
+        line = await reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('Connection closed by server')
+        kind, value = line[:1], line[1:-2]
+        if kind == b'+':
+            return value.decode()
+        if kind == b'-':
+            return RedisError(value.decode())
+        if kind == b':':
+            return int(value)
+        if kind == b'$':
+            return None if value == b'-1' else (await reader.readexactly(int(value) + 2))[:-2]
+        if kind == b'*':
+            return None if value == b'-1' else [await cls.reply(reader) for _ in range(int(value))]
+        raise RedisError(f'Unexpected reply {line!r}')
+
+    async def connect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.password))
+        if self.database:
+            setup.append(('SELECT', self.database))
+        for command in setup:
+            writer.write(self.encode(*command))
+            if isinstance(reply := await self.reply(reader), RedisError):
+                writer.close()
+                raise reply
+        return reader, writer
+
+    async def execute(self, *args: str | bytes | int) -> Any:
+        async with self.slots:
+            reader, writer = self.idle.pop() if self.idle else await asyncio.wait_for(self.connect(), self.timeout)
+            try:
+                writer.write(self.encode(*args))
+                reply = await asyncio.wait_for(self.reply(reader), self.timeout)
+            except BaseException:
+                # the connection may be half way through a reply, it can't be reused
+                writer.close()
+                raise
+            self.idle.append((reader, writer))
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.execute('GET', key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.execute('SET', key, value, 'PX', int(ttl * 1000))
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self.execute('DEL', *keys)
+
+    async def close(self) -> None:
+        while self.idle:
+            self.idle.pop()[1].close()
@@ -0,0 +1,21 @@
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.models import Checkpoint
+
+
+class RepositoryCheckpoint:
+
+    async def get(self, db: AsyncSession, *, name: str) -> str | None:
+        return await db.scalar(select(Checkpoint.cursor).where(Checkpoint.name == name))
+
+    async def save(self, db: AsyncSession, *, name: str, cursor: str | None) -> None:
+        """Record progress; it is kept with the caller's transaction, so work and cursor commit together."""
+        statement = insert(Checkpoint.__table__).values(name=name, cursor=cursor).on_conflict_do_update(
+            index_elements=[Checkpoint.name], set_={'cursor': cursor, 'updated_at': func.now()}
+        )
+        await db.execute(statement)
+
+
+checkpoint_crud = RepositoryCheckpoint()
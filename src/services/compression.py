@@ -0,0 +1,191 @@
+import asyncio
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from typing import AsyncIterable, AsyncIterator
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+from core.config import settings
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+CHUNK_SIZE = 2 ** 20
+SAMPLE_SIZE = 2 ** 16
+
+# magic numbers of formats that are already compressed (offset, signature)
+COMPRESSED_SIGNATURES = (
+    (0, b'\x1f\x8b'),  # gzip
+    (0, b'\x28\xb5\x2f\xfd'),  # zstd
+    (0, b'BZh'),  # bzip2
+    (0, b'\xfd7zXZ\x00'),  # xz
+    (0, b'\x04\x22\x4d\x18'),  # lz4
+    (0, b'PK\x03\x04'),  # zip, docx, jar, apk
+    (0, b'7z\xbc\xaf\x27\x1c'),  # 7z
+    (0, b'Rar!'),  # rar
+    (0, b'\x89PNG'),  # png
+    (0, b'\xff\xd8\xff'),  # jpeg
+    (0, b'GIF8'),  # gif
+    (8, b'WEBP'),  # webp
+    (4, b'ftyp'),  # mp4, mov, heic
+    (0, b'\x1a\x45\xdf\xa3'),  # mkv, webm
+    (0, b'OggS'),  # ogg
+    (0, b'fLaC'),  # flac
+    (0, b'ID3'),  # mp3
+)
+
+# what a damaged stream raises while it is decoded
+DECODE_ERRORS = (zlib.error,) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+# compression runs in threads: zlib and zstandard release the GIL while they work
+executor = ThreadPoolExecutor(max_workers=settings.COMPRESSION_WORKERS, thread_name_prefix='compression')
+
+
+def is_compressed(head: bytes) -> bool:
+    return any(head[offset:offset + len(signature)] == signature for offset, signature in COMPRESSED_SIGNATURES)
+
+
+def choose_encoding(head: bytes, size: int) -> str | None:
+    """Pick the codec for content starting with `head`, or None to store it as is."""
+    if not settings.COMPRESSION or size < settings.COMPRESSION_MIN_SIZE or is_compressed(head):
+        return None
+    # a cheap trial on the sample tells text and structured data from random-looking bytes
+    sample = head[:SAMPLE_SIZE]
+    if len(zlib.compress(sample, 1)) > len(sample) * settings.COMPRESSION_MIN_RATIO:
+        return None
+    if settings.COMPRESSION == ZSTD and zstandard is not None:
+        return ZSTD
+    return GZIP
+
+
+def compressor(encoding: str):
+    if encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=settings.ZSTD_LEVEL).compressobj()
+    # wbits=31 writes the gzip container, so stored blobs can be sent as `content-encoding: gzip`
+    return zlib.compressobj(settings.GZIP_LEVEL, zlib.DEFLATED, 31)
+
+
+def decompressor(encoding: str):
+    if encoding == ZSTD:
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)
+
+
+def compress_file(src_path: str, dst_path: str, encoding: str) -> int:
+    compress = compressor(encoding)
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        while chunk := src.read(CHUNK_SIZE):
+            dst.write(compress.compress(chunk))
+        dst.write(compress.flush())
+        return dst.tell()
+
+
+def sniff_file(path: str, size: int) -> str | None:
+    with open(path, 'rb') as file:
+        return choose_encoding(file.read(SAMPLE_SIZE), size)
+
+
+async def sniff(path: str, size: int) -> str | None:
+    return await asyncio.get_running_loop().run_in_executor(executor, sniff_file, path, size)
+
+
+async def compress(src_path: str, encoding: str) -> tuple[str, int]:
+    """Compress a local file next to itself; returns the new path and its size."""
+    dst_path = f'{src_path}.{encoding}'
+    try:
+        size = await asyncio.get_running_loop().run_in_executor(executor, compress_file, src_path, dst_path, encoding)
+    except BaseException:
+        if os.path.exists(dst_path):
+            os.remove(dst_path)
+        raise
+    return dst_path, size
+
+
+class ChunkSource:
+    """A file-like view of async chunks, for the decoders reading from a thread in `executor`."""
+
+    def __init__(self, chunks: AsyncIterable[bytes], loop: asyncio.AbstractEventLoop):
+        self.chunks = aiter(chunks)
+        self.loop = loop
+        self.pending = b''
+
+    async def next_chunk(self) -> bytes:
+        while (chunk := await anext(self.chunks, None)) is not None:
+            if chunk:
+                return chunk
+        return b''
+
+    async def prefetch(self) -> None:
+        if not self.pending:
+            self.pending = await self.next_chunk()
+
+    def read(self, size: int = -1) -> bytes:
+        if not self.pending:
+            # the decoder needs more than was prefetched: the loop is free while the thread waits
+            self.pending = asyncio.run_coroutine_threadsafe(self.next_chunk(), self.loop).result()
+        data = self.pending if size < 0 else self.pending[:size]
+        self.pending = self.pending[len(data):]
+        return data
+
+
+class GzipReader:
+    """Inflates `source` with at most `size` bytes of output per read."""
+
+    def __init__(self, source: ChunkSource):
+        self.source = source
+        self.inflate = zlib.decompressobj(31)
+        self.full = False
+
+    def read(self, size: int) -> bytes:
+        while not self.inflate.eof:
+            if self.inflate.unconsumed_tail or self.full:
+                data = self.inflate.unconsumed_tail
+            elif not (data := self.source.read(CHUNK_SIZE)):
+                return self.inflate.flush(size)
+            output = self.inflate.decompress(data, size)
+            # a full read may leave output inside zlib even with no input left
+            self.full = len(output) == size
+            if output:
+                return output
+        return b''
+
+
+def decoder(source: ChunkSource, encoding: str):
+    if encoding == ZSTD:
+        return zstandard.ZstdDecompressor().stream_reader(source, read_size=CHUNK_SIZE)
+    return GzipReader(source)
+
+
+async def decompress(chunks: AsyncIterable[bytes], encoding: str | None) -> AsyncIterator[bytes]:
+    if encoding is None:
+        async for chunk in chunks:
+            yield chunk
+        return
+    loop = asyncio.get_running_loop()
+    source = ChunkSource(chunks, loop)
+    decoded = decoder(source, encoding)
+    # output is taken a CHUNK_SIZE at a time: a few KB of a highly compressible blob decode to gigabytes
+    while True:
+        await source.prefetch()
+        if not (data := await loop.run_in_executor(executor, decoded.read, CHUNK_SIZE)):
+            return
+        yield data
+
+
+async def decompress_range(
+        chunks: AsyncIterable[bytes], encoding: str | None, first: int, last: int
+) -> AsyncIterator[bytes]:
+    """Bytes [first, last] of the decoded content; everything before `first` is decoded and dropped."""
+    position = 0
+    async with aclosing(decompress(chunks, encoding)) as decoded:
+        async for chunk in decoded:
+            start, end = max(first - position, 0), min(last - position + 1, len(chunk))
+            position += len(chunk)
+            if start < end:
+                yield chunk[start:end]
+            if position > last:
+                break
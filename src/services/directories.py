@@ -0,0 +1,178 @@
+import logging
+import uuid
+
+from sqlalchemy import case, delete, func, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.models import Directory, File
+from services.hotfiles import hot_files
+from services.trash import trash_crud
+from services.usage import usage_crud
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidPath(ValueError):
+    pass
+
+
+class PathTooLong(ValueError):
+    pass
+
+
+class DirectoryNotFound(Exception):
+    pass
+
+
+class DirectoryExists(Exception):
+    pass
+
+
+def normalize_path(path: str) -> str:
+    parts = [part for part in path.split('/') if part and part != '.']
+    if '..' in parts:
+        raise InvalidPath(path)
+    return '/'.join(parts)
+
+
+def join_path(directory: str, name: str) -> str:
+    return f'{directory}/{name}' if directory else name
+
+
+def parent_of(path: str) -> str:
+    return path.rpartition('/')[0]
+
+
+def ancestors(directory: str) -> list[str]:
+    """'a/b/c' -> ['a', 'a/b', 'a/b/c']; the root has no row of its own."""
+    if not directory:
+        return []
+    parts = directory.split('/')
+    return ['/'.join(parts[:depth]) for depth in range(1, len(parts) + 1)]
+
+
+def in_subtree(column, path: str):
+    return or_(column == path, column.startswith(f'{path}/', autoescape=True))
+
+
+class RepositoryDirectory:
+
+    async def get(self, db: AsyncSession, *, user_id: uuid.UUID, path: str, lock=False) -> Directory | None:
+        statement = select(Directory).where(Directory.user_id == user_id, Directory.path == path)
+        if lock:
+            statement = statement.with_for_update()
+        return (await db.execute(statement)).scalar_one_or_none()
+
+    async def children(self, db: AsyncSession, *, user_id: uuid.UUID, path: str) -> list[Directory]:
+        statement = select(Directory).where(
+            Directory.user_id == user_id, Directory.parent == path
+        ).order_by(Directory.path)
+        return (await db.execute(statement)).scalars().all()
+
+    async def files(
+            self, db: AsyncSession, *, user_id: uuid.UUID, path: str, limit: int, after: str | None = None
+    ) -> list[File]:
+        statement = select(File).where(File.user_id == user_id, File.directory == path)
+        if after is not None:
+            statement = statement.where(File.name > after)
+        statement = statement.order_by(File.name).limit(limit)
+        return (await db.execute(statement)).scalars().all()
+
+    async def add(self, db: AsyncSession, *, user_id: uuid.UUID, directory: str, files: int, size: int) -> None:
+        """Adjust the aggregates of a directory and all its ancestors in one statement."""
+        paths = ancestors(directory)
+        if not paths:
+            return
+        # rows are always locked from the top down, so concurrent writers can't deadlock
+        statement = insert(Directory).values([
+            {'user_id': user_id, 'path': path, 'parent': parent_of(path), 'files': files, 'size': size}
+            for path in paths
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=[Directory.user_id, Directory.path],
+            set_={
+                'files': Directory.files + statement.excluded.files,
+                'size': Directory.size + statement.excluded.size,
+            }
+        )
+        await db.execute(statement)
+
+    async def prune(self, db: AsyncSession, *, user_id: uuid.UUID) -> None:
+        await db.execute(delete(Directory).where(Directory.user_id == user_id, Directory.files <= 0))
+
+    async def move(self, db: AsyncSession, *, user_id: uuid.UUID, path: str, destination: str) -> Directory:
+        if not path or not destination or destination == path or destination.startswith(f'{path}/'):
+            raise InvalidPath(destination)
+        source = await self.get(db, user_id=user_id, path=path, lock=True)
+        if source is None:
+            raise DirectoryNotFound(path)
+        if await self.get(db, user_id=user_id, path=destination) is not None:
+            raise DirectoryExists(destination)
+        files, size, tail = source.files, source.size, len(path) + 1
+        longest = (await db.execute(
+            select(func.max(func.length(File.path))).where(File.user_id == user_id, in_subtree(File.directory, path))
+        )).scalar_one() or 0
+        if longest - len(path) + len(destination) > File.path.type.length:
+            raise PathTooLong(destination)
+
+        moved = (await db.execute(
+            update(File).where(File.user_id == user_id, in_subtree(File.directory, path)).values(
+                path=func.concat(destination, func.substr(File.path, tail)),
+                directory=func.concat(destination, func.substr(File.directory, tail)),
+            ).returning(File.id).execution_options(synchronize_session=False)
+        )).scalars().all()
+        await db.execute(
+            update(Directory).where(Directory.user_id == user_id, in_subtree(Directory.path, path)).values(
+                path=func.concat(destination, func.substr(Directory.path, tail)),
+                parent=case(
+                    (Directory.path == path, parent_of(destination)),
+                    else_=func.concat(destination, func.substr(Directory.parent, tail))
+                ),
+            ).execution_options(synchronize_session=False)
+        )
+        await self.add(db, user_id=user_id, directory=parent_of(path), files=-files, size=-size)
+        await self.add(db, user_id=user_id, directory=parent_of(destination), files=files, size=size)
+        await self.prune(db, user_id=user_id)
+        await db.commit()
+        await hot_files.invalidate(moved)
+        logger.info(f'Moved directory {path} to {destination} ({files} files).')
+        return Directory(user_id=user_id, path=destination, parent=parent_of(destination), files=files, size=size)
+
+    async def delete(self, db: AsyncSession, *, user_id: uuid.UUID, path: str) -> Directory:
+        directory = await self.get(db, user_id=user_id, path=path, lock=True)
+        if directory is None:
+            raise DirectoryNotFound(path)
+        # the files go to the trash with their blob references, restorable one by one
+        deleted = await trash_crud.move(db, user_id=user_id, condition=in_subtree(File.directory, path))
+        await usage_crud.charge(db, user_id=user_id, files=-len(deleted), used=-sum(row.size for row in deleted))
+        await db.execute(delete(Directory).where(Directory.user_id == user_id, in_subtree(Directory.path, path)))
+        await self.add(db, user_id=user_id, directory=parent_of(path), files=-directory.files, size=-directory.size)
+        await self.prune(db, user_id=user_id)
+        await db.commit()
+        await hot_files.invalidate([row.id for row in deleted])
+        logger.info(f'Deleted directory {path} ({len(deleted)} files).')
+        return directory
+
+    async def rebuild(self, db: AsyncSession) -> None:
+        """Recompute every directory aggregate from the files table."""
+        await db.execute(text('LOCK TABLE files IN SHARE MODE'))
+        await db.execute(delete(Directory))
+        await db.execute(text(REBUILD_DIRECTORIES))
+        await db.commit()
+
+
+# every file contributes to each prefix of its directory: a/b/c -> a, a/b, a/b/c
+REBUILD_DIRECTORIES = '''
+INSERT INTO directories (user_id, path, parent, files, size)
+SELECT user_id,
+       array_to_string(parts[1:depth], '/'),
+       array_to_string(parts[1:depth - 1], '/'),
+       count(*),
+       sum(size)
+FROM (SELECT user_id, size, string_to_array(directory, '/') AS parts FROM files WHERE directory <> '') AS f,
+     generate_series(1, cardinality(parts)) AS depth
+GROUP BY 1, 2, 3
+'''
+
+directory_crud = RepositoryDirectory()
@@ -1,47 +1,337 @@
-from fastapi.encoders import jsonable_encoder
-from sqlalchemy import and_, select, func
+import asyncio
+import base64
+import datetime
+import json
+import logging
+import uuid
+from collections import Counter
+from typing import AsyncIterator
+
+from sqlalchemy import insert, lambda_stmt, select, tuple_
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.lambdas import StatementLambdaElement
 
+from core.config import settings
 from models.models import File
+from schemas.files import FileCreate
+from services.blobs import StagedBlob, blob_crud, blob_store
+from services.directories import directory_crud, in_subtree, parent_of
+from services.hotfiles import detached_file, hot_files
+from services.jobs import job_crud
+from services.throttle import Throttle
+from services.trash import FILE_COLUMNS, trash_crud
+from services.usage import QuotaExceeded, usage_crud
+
+logger = logging.getLogger(__name__)
+
+# a listing entry, named as in FileInDBBase
+LISTING_COLUMNS = (
+    File.id, File.name, File.path, File.size, File.is_downloadable, File.created_at, File.stored_size,
+    File.blob_hash.label('sha256'), File.xxh3,
+)
+
+
+def escape_like(value: str) -> str:
+    return value.replace('/', '//').replace('%', '/%').replace('_', '/_')
+
+
+def encode_cursor(file: File | Row) -> str:
+    value = json.dumps([file.created_at.isoformat(), str(file.id)])
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, uuid.UUID]:
+    """Raises ValueError for anything that isn't a cursor produced by encode_cursor."""
+    try:
+        created_at, id_ = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.datetime.fromisoformat(created_at), uuid.UUID(id_)
+    except (TypeError, ValueError, UnicodeError) as err:
+        raise ValueError(f'Invalid cursor {cursor!r}') from err
+
+
+def storage_key(file: File) -> str:
+    if file.blob_hash:
+        return blob_store.key(file.blob_hash)
+    # files uploaded before the blob store are kept as <id>.<ext>
+    return f'{file.id}.{file.name.split(".")[-1]}'
 
 
 class RepositoryFile:
+    """Reads go through cached lambda statements and come back as rows, not ORM objects.
 
-    async def get(self, db: AsyncSession, id_: int) -> File | None:
-        statement = select(File).where(File.id == id_)  # type: ignore
-        results = await db.execute(statement=statement)
-        return results.scalar_one_or_none()
+    A lambda statement is built and compiled once per call site; later calls only pull
+    the new parameter values out of the closure. Rows skip the identity map and attribute
+    instrumentation, and map directly onto the pydantic schemas.
+    """
 
-    async def get_multi(
-            self, db: AsyncSession, *, skip=0, limit=100, **kwargs
-    ) -> list[File]:
-        statement = select(File)  # type: ignore
-        if filters := await self.apply_filters(kwargs):
-            statement = statement.where(and_(*filters))
-        statement = statement.offset(skip).limit(limit)
-        results = await db.execute(statement=statement)
-        return results.scalars().all()
-
-    async def usage_memory(
-            self, db: AsyncSession, **kwargs
+    async def get(self, db: AsyncSession, id_: uuid.UUID) -> Row | None:
+        statement = lambda_stmt(lambda: select(File.__table__).where(File.id == id_))
+        return (await db.execute(statement)).one_or_none()
+
+    async def get_by_path(self, db: AsyncSession, *, user_id: uuid.UUID, path: str) -> Row | None:
+        statement = lambda_stmt(lambda: select(File.__table__).where(File.user_id == user_id, File.path == path))
+        return (await db.execute(statement)).one_or_none()
+
+    def list_statement(
+            self,
+            *,
+            user_id: uuid.UUID,
+            path: str | None = None,
+            name: str | None = None,
+            after: tuple[datetime.datetime, uuid.UUID] | None = None
+    ) -> StatementLambdaElement:
+        # newest first; (created_at, id) is a total order, so the keyset never skips or repeats rows.
+        # Each optional criterion is its own cache key, so every combination is compiled once.
+        statement = lambda_stmt(lambda: select(*LISTING_COLUMNS).where(File.user_id == user_id))
+        if path:
+            pattern = escape_like(path) + '%'
+            statement += lambda s: s.where(File.path.like(pattern, escape='/'))
+        if name:
+            statement += lambda s: s.where(File.name == name)
+        if after:
+            created_at, id_ = after
+            statement += lambda s: s.where(tuple_(File.created_at, File.id) < tuple_(created_at, id_))
+        statement += lambda s: s.order_by(File.created_at.desc(), File.id.desc())
+        return statement
+
+    async def get_page(self, db: AsyncSession, *, limit: int, **kwargs) -> list[Row]:
+        statement = self.list_statement(**kwargs)
+        statement += lambda s: s.limit(limit)
+        return (await db.execute(statement)).all()
+
+    async def stream(self, db: AsyncSession, *, yield_per: int = 500, **kwargs) -> AsyncIterator[Row]:
+        results = await db.stream(self.list_statement(**kwargs), execution_options={'yield_per': yield_per})
+        async for row in results:
+            yield row
+
+    async def stream_selection(
+            self,
+            db: AsyncSession,
+            *,
+            user_id: uuid.UUID,
+            ids: list[uuid.UUID] | None = None,
+            directory: str | None = None,
+            yield_per: int = 500
+    ) -> AsyncIterator[File]:
+        statement = select(File).where(File.user_id == user_id, File.is_downloadable.is_(True))
+        if ids:
+            statement = statement.where(File.id.in_(ids))
+        if directory:
+            statement = statement.where(in_subtree(File.directory, directory))
+        statement = statement.order_by(File.path).execution_options(yield_per=yield_per)
+        results = await db.stream_scalars(statement)
+        async for file in results:
+            yield file
+
+    async def create(self, db: AsyncSession, *, obj_in: FileCreate) -> File:
+        """Insert and commit; the row comes back with RETURNING instead of a refresh round trip."""
+        statement = insert(File.__table__).values(obj_in.dict(exclude_none=True)).returning(*File.__table__.columns)
+        row = (await db.execute(statement)).one()
+        await db.commit()
+        return detached_file(row._asdict())
+
+    async def enqueue_upload_jobs(self, db: AsyncSession, hashes: list[str], *, user_id: uuid.UUID) -> None:
+        # committed with the files: the work is off the request path, but never lost or done for nothing
+        for kind in settings.UPLOAD_JOBS:
+            await job_crud.enqueue_many(db, kind, [{'hash': hash_} for hash_ in hashes], user_id=user_id)
+
+    async def unpublish(self, db: AsyncSession, hashes: list[str]) -> None:
+        """Remove the objects of blobs created in a transaction that failed, then roll it back."""
+        # still under the new rows' locks: a concurrent upload of the same content waits,
+        # then creates the row again and publishes its own copy
+        for hash_ in hashes:
+            await blob_store.remove(hash_)
+        await db.rollback()
+
+    async def create_from_blob(
+            self, db: AsyncSession, staged: StagedBlob, *, id_: uuid.UUID, name: str, path: str, user_id: uuid.UUID
+    ) -> File:
+        # compress before any row is locked; known content is not compressed again
+        if await blob_crud.get(db, hash_=staged.hash) is None:
+            staged = await blob_store.encode(staged)
+        try:
+            await usage_crud.charge(db, user_id=user_id, files=1, used=staged.size, quota=settings.USER_QUOTA)
+        except QuotaExceeded:
+            await blob_store.discard(staged.tmp_path)
+            raise
+        await directory_crud.add(db, user_id=user_id, directory=parent_of(path), files=1, size=staged.size)
+        blob = await blob_crud.acquire(db, staged)
+        if blob.created:
+            await blob_store.publish(staged)
+            await self.enqueue_upload_jobs(db, [staged.hash], user_id=user_id)
+        else:
+            await blob_store.discard(staged.tmp_path)
+            logger.info(f'File {id_} is a duplicate of blob {staged.hash}.')
+        obj_in = FileCreate(
+            id=id_,
+            path=path,
+            name=name,
+            size=staged.size,
+            stored_size=blob.stored_size,
+            encoding=blob.encoding,
+            xxh3=blob.xxh3,
+            user_id=user_id,
+            is_downloadable=True,
+            blob_hash=staged.hash
+        )
+        try:
+            return await self.create(db=db, obj_in=obj_in)
+        except BaseException:
+            if blob.created:
+                await self.unpublish(db, [staged.hash])
+            raise
+
+    async def create_from_existing(
+            self,
+            db: AsyncSession,
+            *,
+            sha256: str,
+            size: int,
+            id_: uuid.UUID,
+            name: str,
+            path: str,
+            user_id: uuid.UUID
+    ) -> File | None:
+        """Store a file whose content is already on the server; None when it isn't, and nothing is written."""
+        if not settings.DEDUP_ACROSS_USERS:
+            # knowing a hash is no proof of having the content: only the user's own content is reused
+            statement = select(File.id).where(File.user_id == user_id, File.blob_hash == sha256).limit(1)
+            if (await db.execute(statement)).first() is None:
+                return None
+        await usage_crud.charge(db, user_id=user_id, files=1, used=size, quota=settings.USER_QUOTA)
+        await directory_crud.add(db, user_id=user_id, directory=parent_of(path), files=1, size=size)
+        blob = await blob_crud.reference(db, hash_=sha256, size=size)
+        if blob is None:
+            await db.rollback()
+            return None
+        obj_in = FileCreate(
+            id=id_,
+            path=path,
+            name=name,
+            size=size,
+            stored_size=blob.stored_size,
+            encoding=blob.encoding,
+            xxh3=blob.xxh3,
+            user_id=user_id,
+            is_downloadable=True,
+            blob_hash=sha256
+        )
+        return await self.create(db=db, obj_in=obj_in)
+
+    async def create_many(self, db: AsyncSession, *, objs_in: list[FileCreate]) -> list[File]:
+        """Insert a batch with a single INSERT ... RETURNING and commit it."""
+        if not objs_in:
+            return []
+        statement = insert(File).returning(File, sort_by_parameter_order=True)
+        files = (await db.scalars(statement, [obj_in.dict() for obj_in in objs_in])).all()
+        await db.commit()
+        return files
+
+    async def create_many_from_blobs(
+            self, db: AsyncSession, staged: list[tuple[str, StagedBlob]], *, user_id: uuid.UUID
     ) -> list[File]:
-        statement = select(func.sum(File.size))  # type: ignore
-        if filters := await self.apply_filters(kwargs):
-            statement = statement.where(and_(*filters))
-        results = await db.execute(statement=statement)
-        return results.scalars().one()
-
-    async def apply_filters(self, kwargs):
-        filters = [getattr(File, key) == value for key, value in kwargs.items()]
-        return filters
-
-    async def create(self, db: AsyncSession, *, obj_in) -> File:
-        obj_in_data = jsonable_encoder(obj_in)
-        db_obj = File(**obj_in_data)
-        db.add(db_obj)
+        """Store a batch of (path, staged blob) in one transaction."""
+        blobs: dict[str, StagedBlob] = {}
+        for _, blob in staged:
+            if blob.hash in blobs:
+                await blob_store.discard(blob.tmp_path)
+            else:
+                blobs[blob.hash] = blob
+        known = await blob_crud.known(db, set(blobs))
+        new = [blob for blob in blobs.values() if blob.hash not in known]
+        # new contents are compressed concurrently, before any row is locked
+        blobs.update((blob.hash, blob) for blob in await blob_store.encode_many(new))
+
+        total = sum(blob.size for _, blob in staged)
+        try:
+            await usage_crud.charge(db, user_id=user_id, files=len(staged), used=total, quota=settings.USER_QUOTA)
+        except QuotaExceeded:
+            await asyncio.gather(*(blob_store.discard(blob.tmp_path) for blob in blobs.values()))
+            raise
+        files, sizes = Counter(), Counter()
+        for path, blob in staged:
+            files[parent_of(path)] += 1
+            sizes[parent_of(path)] += blob.size
+        for directory in sorted(files):
+            await directory_crud.add(db, user_id=user_id, directory=directory, files=files[directory],
+                                     size=sizes[directory])
+        rows = await blob_crud.acquire_many(db, list(blobs.values()), Counter(blob.hash for _, blob in staged))
+        await asyncio.gather(*(
+            blob_store.publish(blob) if rows[hash_].created else blob_store.discard(blob.tmp_path)
+            for hash_, blob in blobs.items()
+        ))
+        created = [hash_ for hash_, row in rows.items() if row.created]
+        await self.enqueue_upload_jobs(db, created, user_id=user_id)
+        objs_in = [
+            FileCreate(
+                id=uuid.uuid4(),
+                path=path,
+                name=path.rpartition('/')[2],
+                size=blob.size,
+                stored_size=rows[blob.hash].stored_size,
+                encoding=rows[blob.hash].encoding,
+                xxh3=rows[blob.hash].xxh3,
+                user_id=user_id,
+                is_downloadable=True,
+                blob_hash=blob.hash
+            )
+            for path, blob in staged
+        ]
+        try:
+            return await self.create_many(db=db, objs_in=objs_in)
+        except BaseException:
+            await self.unpublish(db, created)
+            raise
+
+    async def delete_many(self, db: AsyncSession, *, user_id: uuid.UUID, ids: list[uuid.UUID]) -> list:
+        """Soft-delete: the rows move to the trash and usage is released; nothing touches storage."""
+        moved = await trash_crud.move(db, user_id=user_id, condition=File.id.in_(ids))
+        if not moved:
+            return []
+        await usage_crud.charge(db, user_id=user_id, files=-len(moved), used=-sum(row.size for row in moved))
+        files, sizes = Counter(), Counter()
+        for row in moved:
+            files[row.directory] += 1
+            sizes[row.directory] += row.size
+        for directory in sorted(files):
+            await directory_crud.add(db, user_id=user_id, directory=directory, files=-files[directory],
+                                     size=-sizes[directory])
+        await directory_crud.prune(db, user_id=user_id)
+        await db.commit()
+        await hot_files.invalidate([row.id for row in moved])
+        logger.info(f'Deleted {len(moved)} files of user {user_id}.')
+        return moved
+
+    async def restore(self, db: AsyncSession, *, user_id: uuid.UUID, id_: uuid.UUID, retention: int) -> File | None:
+        """Undelete a file within retention; raises QuotaExceeded, and IntegrityError when its path is taken."""
+        deleted = await trash_crud.take(db, user_id=user_id, id_=id_, retention=retention)
+        if deleted is None:
+            return None
+        await usage_crud.charge(db, user_id=user_id, files=1, used=deleted.size, quota=settings.USER_QUOTA)
+        await directory_crud.add(db, user_id=user_id, directory=deleted.directory, files=1, size=deleted.size)
+        file = File(**{key: getattr(deleted, key) for key in FILE_COLUMNS})
+        db.add(file)
+        await db.commit()
+        logger.info(f'Restored file {id_}.')
+        return file
+
+    async def purge(self, db: AsyncSession, *, retention: int, limit: int, throttle: Throttle | None = None) -> int:
+        """Drop a batch of files past retention and their blob references; gc reclaims the blobs."""
+        expired = await trash_crud.expire(db, retention=retention, limit=limit)
+        if not expired:
+            return 0
+        await blob_crud.release_many(db, Counter(row.blob_hash for row in expired if row.blob_hash))
         await db.commit()
-        await db.refresh(db_obj)
-        return db_obj
+        # files from before the blob store own their object; deleted only once the rows are
+        # gone for good, since an orphaned object is harmless and a restorable file without one isn't
+        for row in expired:
+            if not row.blob_hash:
+                await blob_store.backend.delete(storage_key(row))
+                if throttle is not None:
+                    await throttle.consume()
+        logger.info(f'Purged {len(expired)} deleted files.')
+        return len(expired)
 
 
 file_crud = RepositoryFile()
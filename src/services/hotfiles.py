@@ -0,0 +1,151 @@
+import datetime
+import json
+import logging
+import uuid
+from typing import Any, AsyncIterator, Callable
+
+from sqlalchemy import lambda_stmt, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from core.config import settings
+from core.metrics import CACHE_LOOKUPS
+from models.models import File
+from services.cache import RedisClient, RedisError, TTLCache
+from services.storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+SHARED_ERRORS = (OSError, TimeoutError, RedisError)
+
+
+def dump_file(values: dict[str, Any]) -> bytes:
+    return json.dumps(values, default=str).encode()
+
+
+def load_file(data: bytes) -> dict[str, Any]:
+    values = json.loads(data)
+    values['id'], values['user_id'] = uuid.UUID(values['id']), uuid.UUID(values['user_id'])
+    if values['created_at'] is not None:
+        values['created_at'] = datetime.datetime.fromisoformat(values['created_at'])
+    return values
+
+
+def detached_file(values: dict[str, Any]) -> File:
+    file = File(**values)
+    make_transient_to_detached(file)
+    return file
+
+
+async def memory_chunks(data: bytes, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+    """Same contract as StorageBackend.read: [start, end], end inclusive."""
+    yield data[start:None if end is None else end + 1]
+
+
+class HotFiles:
+    """Read-through cache for downloads: file rows by id and the stored bytes of small blobs.
+
+    The in-process tier is bounded by entry count for rows and by a byte budget for
+    content. With a shared Redis-protocol server a file read by one worker is a hit
+    for every other worker too. Blobs are content-addressed and never change, so only
+    rows need invalidation; other workers' in-process copies of a row expire after
+    HOT_CACHE_TTL seconds.
+    """
+
+    def __init__(
+            self,
+            *,
+            files: int,
+            ttl: float,
+            budget: int,
+            max_blob: int,
+            content_ttl: float,
+            shared: RedisClient | None = None
+    ):
+        self.files: TTLCache[uuid.UUID, dict[str, Any]] = TTLCache(files, ttl)
+        self.blobs: TTLCache[str, bytes] = TTLCache(budget, content_ttl, weigh=len)
+        self.max_blob = max_blob
+        self.shared = shared
+
+    async def shared_get(self, key: str) -> bytes | None:
+        try:
+            return await self.shared.get(key)
+        except SHARED_ERRORS as err:
+            # the shared tier is an optimisation, downloads must not fail with it
+            logger.warning(f'Shared cache unavailable: {err!r}')
+            return None
+
+    async def shared_set(self, key: str, value: bytes, ttl: float) -> None:
+        try:
+            await self.shared.set(key, value, ttl)
+        except SHARED_ERRORS as err:
+            logger.warning(f'Shared cache unavailable: {err!r}')
+
+    async def lookup(self, cache: str, local: TTLCache, key: Any, shared_key: str, decode: Callable) -> Any:
+        if (value := local.get(key)) is not None:
+            CACHE_LOOKUPS.labels(cache, 'local', 'hit').inc()
+            return value
+        CACHE_LOOKUPS.labels(cache, 'local', 'miss').inc()
+        if self.shared is None:
+            return None
+        data = await self.shared_get(shared_key)
+        CACHE_LOOKUPS.labels(cache, 'shared', 'miss' if data is None else 'hit').inc()
+        if data is None:
+            return None
+        value = decode(data)
+        local.set(key, value)
+        return value
+
+    async def file(self, db: AsyncSession, id_: uuid.UUID) -> File | None:
+        if (values := await self.lookup('file', self.files, id_, f'file:{id_}', load_file)) is not None:
+            return detached_file(values)
+        row = (await db.execute(lambda_stmt(lambda: select(File.__table__).where(File.id == id_)))).one_or_none()
+        if row is None:
+            return None
+        values = row._asdict()
+        self.files.set(id_, values)
+        if self.shared is not None:
+            await self.shared_set(f'file:{id_}', dump_file(values), self.files.ttl)
+        return detached_file(values)
+
+    async def content(self, key: str) -> bytes | None:
+        """Cached stored bytes of a blob, without touching storage."""
+        return await self.lookup('blob', self.blobs, key, f'blob:{key}', bytes)
+
+    async def load(self, key: str, backend: StorageBackend) -> bytes:
+        """Read a small blob from storage into the cache."""
+        data = b''.join([chunk async for chunk in backend.read(key)])
+        self.blobs.set(key, data)
+        if self.shared is not None:
+            await self.shared_set(f'blob:{key}', data, self.blobs.ttl)
+        return data
+
+    async def invalidate(self, ids: list[uuid.UUID]) -> None:
+        for id_ in ids:
+            self.files.pop(id_)
+        if self.shared is not None and ids:
+            try:
+                await self.shared.delete(*(f'file:{id_}' for id_ in ids))
+            except SHARED_ERRORS as err:
+                logger.warning(f'Shared cache unavailable: {err!r}')
+
+    def clear(self) -> None:
+        self.files.clear()
+        self.blobs.clear()
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {'files': self.files.stats(), 'blobs': self.blobs.stats()}
+
+    async def close(self) -> None:
+        if self.shared is not None:
+            await self.shared.close()
+
+
+hot_files = HotFiles(
+    files=settings.HOT_CACHE_FILES,
+    ttl=settings.HOT_CACHE_TTL,
+    budget=settings.HOT_CACHE_BUDGET,
+    max_blob=settings.HOT_CACHE_MAX_BLOB,
+    content_ttl=settings.HOT_CACHE_CONTENT_TTL,
+    shared=RedisClient(settings.HOT_CACHE_URL) if settings.HOT_CACHE_URL else None,
+)
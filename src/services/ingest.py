@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator
+
+import xxhash
+
+from core.config import settings
+
+HASH_BLOCK = 2 ** 20
+
+
+class BlobTooLarge(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Checksums:
+    sha256: str
+    # fast non-cryptographic check, cheap enough for clients and the scrubber to recompute
+    xxh3: str
+
+
+class Hasher:
+    """All checksums of the same bytes, updated together."""
+
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.xxh3 = xxhash.xxh3_64()
+
+    def update(self, block: bytes) -> None:
+        self.sha256.update(block)
+        self.xxh3.update(block)
+
+    def checksums(self) -> Checksums:
+        return Checksums(sha256=self.sha256.hexdigest(), xxh3=self.xxh3.hexdigest())
+
+
+def make_executor(kind: str, workers: int) -> Executor:
+    if kind == 'process':
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest')
+
+
+# checksums run here; hashlib and xxhash release the GIL for large updates, so threads are the default
+executor = make_executor(settings.INGEST_EXECUTOR, settings.INGEST_WORKERS)
+
+
+def write_block(fd: int, hasher: Hasher | None, block: bytes) -> None:
+    view = memoryview(block)
+    while view:
+        view = view[os.write(fd, view):]
+    if hasher is not None:
+        hasher.update(block)
+
+
+def hash_file(path: str) -> Checksums:
+    hasher = Hasher()
+    with open(path, 'rb') as file:
+        while block := file.read(HASH_BLOCK):
+            hasher.update(block)
+    return hasher.checksums()
+
+
+async def coalesce(chunks: AsyncIterable[bytes], block_size: int) -> AsyncIterator[bytes]:
+    """Merge small network chunks, so each executor round trip carries a useful amount of work."""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= block_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def ingest(
+        chunks: AsyncIterable[bytes],
+        path: str,
+        max_size: int,
+        *,
+        queue_size: int | None = None,
+        block_size: int | None = None
+) -> tuple[Checksums, int]:
+    """Write a body to `path` and return its checksums and size.
+
+    The body is read ahead into a bounded queue while earlier blocks are written
+    and hashed in worker threads, so the network and the disk are busy at the same time.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=queue_size or settings.UPLOAD_QUEUE_SIZE)
+    in_process = isinstance(executor, ProcessPoolExecutor)
+    # hash objects can't cross process boundaries: a process pool hashes the finished file instead
+    hasher = None if in_process else Hasher()
+
+    async def read() -> int:
+        size = 0
+        try:
+            async for block in coalesce(chunks, block_size or settings.UPLOAD_BLOCK_SIZE):
+                size += len(block)
+                if size > max_size:
+                    raise BlobTooLarge(size)
+                await queue.put(block)
+        except Exception:
+            # wake the writer up; it then picks the error up from this task
+            await queue.put(None)
+            raise
+        await queue.put(None)
+        return size
+
+    reader = asyncio.create_task(read())
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while (block := await queue.get()) is not None:
+            await loop.run_in_executor(None if in_process else executor, write_block, fd, hasher, block)
+        size = await reader
+    finally:
+        reader.cancel()
+        os.close(fd)
+    if hasher is None:
+        return await loop.run_in_executor(executor, hash_file, path), size
+    return hasher.checksums(), size
@@ -0,0 +1,222 @@
+"""Background jobs with persistent rows in Postgres.
+
+Jobs are enqueued in the caller's transaction, so they exist exactly when the work
+that produced them is committed. Workers in any number of processes claim them with
+`FOR UPDATE SKIP LOCKED`; a failed job is retried with exponential backoff until
+its attempts run out, and a job whose worker died is claimed again once its lease
+has expired. Job types are added with `register`.
+"""
+import asyncio
+import datetime
+import logging
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import and_, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from db.db import async_session
+from models.models import Job
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+Handler = Callable[[AsyncSession, dict[str, Any]], Awaitable[None]]
+
+
+@dataclass
+class JobType:
+    name: str
+    handler: Handler
+    concurrency: int
+    max_attempts: int
+
+
+job_types: dict[str, JobType] = {}
+
+
+def register(name: str, *, concurrency: int = 1, max_attempts: int | None = None) -> Callable[[Handler], Handler]:
+    """Decorator for `async def handler(db, payload)`; JOB_CONCURRENCY overrides the concurrency per type."""
+
+    def decorator(handler: Handler) -> Handler:
+        job_types[name] = JobType(
+            name=name,
+            handler=handler,
+            concurrency=settings.JOB_CONCURRENCY.get(name, concurrency),
+            max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        )
+        return handler
+
+    return decorator
+
+
+def backoff(attempts: int) -> float:
+    return min(settings.JOB_BACKOFF * 2 ** (attempts - 1), settings.JOB_BACKOFF_MAX)
+
+
+class RepositoryJob:
+
+    async def enqueue_many(
+            self, db: AsyncSession, kind: str, payloads: list[dict[str, Any]], *, user_id: uuid.UUID | None = None
+    ) -> list[uuid.UUID]:
+        """Add jobs in the caller's transaction, with one statement."""
+        if not payloads:
+            return []
+        max_attempts = job_types[kind].max_attempts if kind in job_types else settings.JOB_MAX_ATTEMPTS
+        statement = insert(Job).returning(Job.id)
+        rows = await db.execute(statement, [
+            {
+                'id': uuid.uuid4(), 'kind': kind, 'payload': payload, 'status': QUEUED, 'attempts': 0,
+                'max_attempts': max_attempts, 'user_id': user_id,
+            }
+            for payload in payloads
+        ])
+        return rows.scalars().all()
+
+    async def enqueue(
+            self, db: AsyncSession, kind: str, payload: dict[str, Any], *, user_id: uuid.UUID | None = None
+    ) -> uuid.UUID:
+        return (await self.enqueue_many(db, kind, [payload], user_id=user_id))[0]
+
+    async def get(self, db: AsyncSession, *, id_: uuid.UUID, user_id: uuid.UUID) -> Job | None:
+        return (await db.execute(select(Job).where(Job.id == id_, Job.user_id == user_id))).scalar_one_or_none()
+
+    async def get_multi(
+            self, db: AsyncSession, *, user_id: uuid.UUID, status: str | None = None, limit: int = 100
+    ) -> list[Job]:
+        statement = select(Job).where(Job.user_id == user_id)
+        if status is not None:
+            statement = statement.where(Job.status == status)
+        statement = statement.order_by(Job.created_at.desc(), Job.id).limit(limit)
+        return (await db.execute(statement)).scalars().all()
+
+    async def claim(self, db: AsyncSession, *, kind: str, limit: int, lease: int) -> list[Job]:
+        """Take up to `limit` due jobs, and running ones whose lease expired, and commit.
+
+        A job whose lease expired on its last attempt, e.g. because it took its worker
+        down, is failed instead of run again.
+        """
+        expired = Job.locked_at < func.now() - datetime.timedelta(seconds=lease)
+        await db.execute(
+            update(Job).where(
+                Job.kind == kind, Job.status == RUNNING, expired, Job.attempts >= Job.max_attempts
+            ).values(status=FAILED, locked_at=None, last_error='Lease expired on the last attempt')
+        )
+        claimable = select(Job.id).where(
+            Job.kind == kind,
+            Job.status.in_((QUEUED, RUNNING)),
+            or_(
+                and_(Job.status == QUEUED, Job.run_at <= func.now()),
+                and_(expired, Job.attempts < Job.max_attempts),
+            )
+        ).order_by(Job.run_at).limit(limit).with_for_update(skip_locked=True)
+        statement = update(Job).where(Job.id.in_(claimable.scalar_subquery())).values(
+            status=RUNNING, attempts=Job.attempts + 1, locked_at=func.now()
+        ).returning(Job).execution_options(synchronize_session=False)
+        jobs = (await db.execute(statement)).scalars().all()
+        await db.commit()
+        return jobs
+
+    async def finish(self, db: AsyncSession, job: Job, **values) -> bool:
+        # only while this claim holds the job: after its lease expired it may have been claimed again
+        result = await db.execute(
+            update(Job).where(Job.id == job.id, Job.status == RUNNING, Job.locked_at == job.locked_at).values(**values)
+        )
+        await db.commit()
+        if not result.rowcount:
+            logger.warning(f'Job {job.id} ({job.kind}) was claimed again meanwhile, its result is dropped.')
+        return bool(result.rowcount)
+
+    async def complete(self, db: AsyncSession, *, job: Job) -> bool:
+        return await self.finish(db, job, status=DONE, locked_at=None, last_error=None)
+
+    async def fail(self, db: AsyncSession, *, job: Job, error: str) -> bool:
+        """Retry later with backoff, or give up when the attempts are used up."""
+        values = {'locked_at': None, 'last_error': error[:2000]}
+        if job.attempts >= job.max_attempts:
+            values['status'] = FAILED
+        else:
+            values['status'] = QUEUED
+            values['run_at'] = func.now() + datetime.timedelta(seconds=backoff(job.attempts))
+        return await self.finish(db, job, **values)
+
+
+class JobWorker:
+    """Runs registered job types inside a process, each with its own concurrency limit."""
+
+    def __init__(self, *, poll_interval: float, lease: int):
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.running: set[asyncio.Task] = set()
+        self.stopping = asyncio.Event()
+
+    async def execute(self, job_type: JobType, job: Job) -> bool:
+        try:
+            async with async_session() as db:
+                await job_type.handler(db, job.payload)
+        except Exception as err:
+            logger.exception(f'Job {job.id} ({job.kind}) failed, attempt {job.attempts}.')
+            async with async_session() as db:
+                await job_crud.fail(db, job=job, error=repr(err))
+            return False
+        async with async_session() as db:
+            await job_crud.complete(db, job=job)
+        return True
+
+    async def claim(self, job_type: JobType, limit: int) -> list[Job]:
+        async with async_session() as db:
+            return await job_crud.claim(db, kind=job_type.name, limit=limit, lease=self.lease)
+
+    async def consume(self, job_type: JobType) -> None:
+        running: set[asyncio.Task] = set()
+        while not self.stopping.is_set():
+            if len(running) >= job_type.concurrency:
+                await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            free = job_type.concurrency - len(running)
+            try:
+                jobs = await self.claim(job_type, free)
+            except Exception:
+                # the database may be restarting; jobs stay queued meanwhile
+                logger.exception(f'Claiming {job_type.name} jobs failed.')
+                jobs = []
+            for job in jobs:
+                task = asyncio.create_task(self.execute(job_type, job))
+                for tasks in (running, self.running):
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if len(jobs) < free:
+                # nothing else is due: wait for the next poll, or for shutdown
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def run(self) -> None:
+        await asyncio.gather(*(self.consume(job_type) for job_type in job_types.values()))
+
+    async def drain(self, kinds: list[str] | None = None) -> int:
+        """Run every due job of `kinds` (all by default) to completion; returns how many ran."""
+        done = 0
+        for job_type in job_types.values():
+            if kinds is not None and job_type.name not in kinds:
+                continue
+            while jobs := await self.claim(job_type, job_type.concurrency):
+                await asyncio.gather(*(self.execute(job_type, job) for job in jobs))
+                done += len(jobs)
+        return done
+
+    async def close(self, timeout: float) -> None:
+        """Stop claiming and give running jobs `timeout` seconds; jobs cut short are claimed again after the lease."""
+        self.stopping.set()
+        if self.running:
+            await asyncio.wait(self.running, timeout=timeout)
+        for task in self.running:
+            task.cancel()
+
+
+job_crud = RepositoryJob()
+job_worker = JobWorker(poll_interval=settings.JOB_POLL_INTERVAL, lease=settings.JOB_LEASE)
@@ -0,0 +1,265 @@
+"""Per-user and global limits on transfers: requests/sec, concurrent streams and bytes/sec.
+
+Requests over their rate and streams over their count are rejected with a retry time.
+Bytes are never rejected: a stream that is over its rate sleeps in its chunk loop, which
+backs the client off through TCP flow control instead of failing a transfer half way.
+
+The state lives in this process (`LocalLimiter`), so limits hold per worker, or in a
+Redis-protocol server shared by all workers (`SharedLimiter`).
+"""
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Callable
+
+from core.config import settings
+from services.cache import RedisClient, RedisError
+
+logger = logging.getLogger(__name__)
+
+SHARED_ERRORS = (OSError, TimeoutError, RedisError)
+
+
+class RateLimited(Exception):
+
+    def __init__(self, limit: str, retry_after: float):
+        super().__init__(f'{limit} limit exceeded, retry after {retry_after:.1f}s')
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """`burst` tokens at most, refilled at `rate` per second."""
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: float, now: float, *, wait: bool) -> float:
+        """Seconds until `amount` tokens are covered.
+
+        With `wait` the tokens are taken anyway and the bucket goes into debt, so callers
+        queue up behind each other; without it nothing is taken unless it's available now.
+        """
+        self.refill(now)
+        if self.tokens >= amount or wait:
+            self.tokens -= amount
+            return max(-self.tokens / self.rate, 0.0)
+        return (amount - self.tokens) / self.rate
+
+
+class LocalLimiter:
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.buckets: dict[str, TokenBucket] = {}
+        self.streams: dict[str, int] = {}
+        self.prune_at = 1024
+
+    async def take(self, key: str, amount: float, *, rate: float, burst: float, wait: bool) -> float:
+        now = self.clock()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.prune_at:
+                self.prune(now)
+            bucket = self.buckets[key] = TokenBucket(rate, burst, now)
+        return bucket.take(amount, now, wait=wait)
+
+    def prune(self, now: float) -> None:
+        # a bucket that has refilled completely is the same as a new one
+        for key, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self.buckets[key]
+        self.prune_at = max(len(self.buckets) * 2, 1024)
+
+    async def acquire(self, key: str, limit: int) -> bool:
+        if self.streams.get(key, 0) >= limit:
+            return False
+        self.streams[key] = self.streams.get(key, 0) + 1
+        return True
+
+    async def release(self, key: str) -> None:
+        if (count := self.streams.pop(key, 0) - 1) > 0:
+            self.streams[key] = count
+
+    async def close(self) -> None:
+        pass
+
+
+class SharedLimiter:
+    """Limits shared by every process, kept with atomic counters on a Redis-protocol server.
+
+    Rates are sliding-window counters rather than buckets: INCRBY alone keeps them exact
+    under concurrency, without scripting, which not every server speaking the protocol
+    allows. The window is `burst / rate` seconds, so a window admits `burst`. When the
+    server is unavailable the limits are not applied: they protect latency, they must
+    not take the service down.
+    """
+
+    def __init__(self, client: RedisClient, clock: Callable[[], float] = time.time, lease: int = 60 * 60):
+        self.client = client
+        self.clock = clock
+        # a stream counter outlives a crashed worker's slots by at most this long
+        self.lease = lease
+
+    async def take(self, key: str, amount: float, *, rate: float, burst: float, wait: bool) -> float:
+        window = burst / rate
+        position = self.clock() / window
+        index = int(position)
+        current = f'rate:{key}:{index}'
+        amount = round(amount)
+        try:
+            count = await self.client.execute('INCRBY', current, amount)
+            if count == amount:
+                await self.client.execute('PEXPIRE', current, int(window * 2000) + 1000)
+            previous = int(await self.client.get(f'rate:{key}:{index - 1}') or 0)
+            # the previous window's count, weighted by how much of it the sliding window still covers
+            excess = previous * (1 - (position - index)) + count - burst
+            if excess > 0 and not wait:
+                await self.client.execute('DECRBY', current, amount)
+        except SHARED_ERRORS as err:
+            logger.warning(f'Shared limiter unavailable: {err!r}')
+            return 0.0
+        return max(excess / rate, 0.0)
+
+    async def acquire(self, key: str, limit: int) -> bool:
+        try:
+            count = await self.client.execute('INCR', f'streams:{key}')
+            await self.client.execute('PEXPIRE', f'streams:{key}', self.lease * 1000)
+            if count > limit:
+                await self.client.execute('DECR', f'streams:{key}')
+                return False
+        except SHARED_ERRORS as err:
+            logger.warning(f'Shared limiter unavailable: {err!r}')
+        return True
+
+    async def release(self, key: str) -> None:
+        try:
+            await self.client.execute('DECR', f'streams:{key}')
+        except SHARED_ERRORS as err:
+            logger.warning(f'Shared limiter unavailable: {err!r}')
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+Limiter = LocalLimiter | SharedLimiter
+
+
+class Stream:
+    """A transfer holding stream slots until `close`; `consume` paces its bytes."""
+
+    def __init__(self, limits: 'TransferLimits', buckets: list[tuple[str, float]], slots: list[str]):
+        self.limits = limits
+        self.buckets = buckets
+        self.slots = slots
+        self.credit = 0
+
+    @property
+    def paced(self) -> bool:
+        return bool(self.buckets)
+
+    async def consume(self, amount: int) -> None:
+        if not self.buckets:
+            return
+        self.credit -= amount
+        if self.credit >= 0:
+            return
+        # bytes are taken from the limiter a quantum at a time, not on every chunk
+        quantum = max(-self.credit, self.limits.quantum)
+        delay = 0.0
+        for key, rate in self.buckets:
+            delay = max(delay, await self.limits.limiter.take(key, quantum, rate=rate, burst=rate, wait=True))
+        self.credit += quantum
+        if delay > 0:
+            await self.limits.sleep(delay)
+
+    async def chunks(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        async for chunk in chunks:
+            await self.consume(len(chunk))
+            yield chunk
+
+    async def close(self) -> None:
+        slots, self.slots = self.slots, []
+        for key in slots:
+            await self.limits.limiter.release(key)
+
+
+class TransferLimits:
+    """The configured limits; a limit of 0 is no limit."""
+
+    def __init__(
+            self,
+            limiter: Limiter,
+            *,
+            requests: float = 0,
+            burst: int = 1,
+            streams: int = 0,
+            bytes_rate: int = 0,
+            global_streams: int = 0,
+            global_bytes_rate: int = 0,
+            quantum: int = 256 * 1024,
+            sleep=asyncio.sleep
+    ):
+        self.limiter = limiter
+        self.requests = requests
+        self.burst = burst
+        self.streams = streams
+        self.bytes_rate = bytes_rate
+        self.global_streams = global_streams
+        self.global_bytes_rate = global_bytes_rate
+        self.quantum = quantum
+        self.sleep = sleep
+
+    @property
+    def limits_transfers(self) -> bool:
+        return bool(self.streams or self.bytes_rate or self.global_streams or self.global_bytes_rate)
+
+    async def check_request(self, user_id: object) -> None:
+        """Raises RateLimited when the user is over the request rate; counts the request otherwise."""
+        if not self.requests:
+            return
+        retry_after = await self.limiter.take(
+            f'requests:{user_id}', 1, rate=self.requests, burst=max(self.burst, 1), wait=False
+        )
+        if retry_after > 0:
+            raise RateLimited('request', retry_after)
+
+    async def open(self, user_id: object) -> Stream:
+        """Takes a stream slot of the user and a global one; raises RateLimited when either is full."""
+        held = []
+        for key, limit in ((f'{user_id}', self.streams), ('*', self.global_streams)):
+            if not limit:
+                continue
+            if not await self.limiter.acquire(key, limit):
+                for slot in held:
+                    await self.limiter.release(slot)
+                raise RateLimited('stream', 1.0)
+            held.append(key)
+        buckets = [
+            (key, rate) for key, rate in ((f'bytes:{user_id}', self.bytes_rate), ('bytes:*', self.global_bytes_rate))
+            if rate
+        ]
+        return Stream(self, buckets, held)
+
+    async def close(self) -> None:
+        await self.limiter.close()
+
+
+transfer_limits = TransferLimits(
+    SharedLimiter(RedisClient(settings.RATE_LIMIT_URL)) if settings.RATE_LIMIT_URL else LocalLimiter(),
+    requests=settings.RATE_REQUESTS,
+    burst=settings.RATE_REQUESTS_BURST,
+    streams=settings.RATE_STREAMS,
+    bytes_rate=settings.RATE_BYTES,
+    global_streams=settings.RATE_GLOBAL_STREAMS,
+    global_bytes_rate=settings.RATE_GLOBAL_BYTES,
+    quantum=settings.RATE_QUANTUM,
+)
@@ -0,0 +1,130 @@
+import logging
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.models import Blob, File
+from services.blobs import BlobStore
+from services.checkpoints import checkpoint_crud
+from services.compression import DECODE_ERRORS, decompress
+from services.ingest import Checksums, Hasher
+from services.storage import StorageError
+from services.throttle import Throttle
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ScrubStats:
+    checked: int = 0
+    corrupt: int = 0
+    unreadable: int = 0
+    bytes: int = 0
+
+
+class Scrubber:
+    """Re-reads stored blobs and compares their decoded content with the recorded checksums.
+
+    Blobs are walked in hash order from a checkpoint that is saved with every batch, so an
+    interrupted run resumes where it stopped; after the last blob the next run starts over.
+    Reads are throttled to `rate` bytes per second to leave the disks to the service.
+    """
+
+    def __init__(self, store: BlobStore, *, rate: int, batch: int, name: str = 'scrub'):
+        self.store = store
+        self.throttle = Throttle(rate)
+        self.batch = batch
+        self.name = name
+        self.stats = ScrubStats()
+
+    async def read(self, hash_: str) -> AsyncIterator[bytes]:
+        async with aclosing(self.store.backend.read(self.store.key(hash_))) as chunks:
+            async for chunk in chunks:
+                self.stats.bytes += len(chunk)
+                await self.throttle.consume(len(chunk))
+                yield chunk
+
+    async def checksums(self, hash_: str, encoding: str | None) -> tuple[Checksums, int] | None:
+        """Checksums and size of the decoded content; None when it doesn't decode.
+
+        Read errors are raised: they may be transient and say nothing about the content.
+        """
+        hasher, size = Hasher(), 0
+        try:
+            async with aclosing(decompress(self.read(hash_), encoding)) as chunks:
+                async for chunk in chunks:
+                    hasher.update(chunk)
+                    size += len(chunk)
+        except DECODE_ERRORS as err:
+            logger.error(f'Blob {hash_} does not decode: {err!r}')
+            return None
+        return hasher.checksums(), size
+
+    async def is_missing(self, hash_: str) -> bool:
+        try:
+            return not await self.store.backend.exists(self.store.key(hash_))
+        except (OSError, StorageError):
+            return False
+
+    async def verify(self, blob) -> dict | None:
+        """The result to record; None when the blob couldn't be read, so it is tried again later."""
+        try:
+            result = await self.checksums(blob.hash, blob.encoding)
+        except (OSError, StorageError) as err:
+            if not await self.is_missing(blob.hash):
+                logger.error(f'Blob {blob.hash} could not be read: {err!r}')
+                return None
+            result = None
+        if result is not None:
+            checksums, size = result
+            if size == blob.size and checksums.sha256 == blob.hash and blob.xxh3 in (None, checksums.xxh3):
+                return {'b_hash': blob.hash, 'b_corrupt': False, 'b_xxh3': checksums.xxh3}
+        logger.error(f'Blob {blob.hash} is corrupt.')
+        return {'b_hash': blob.hash, 'b_corrupt': True, 'b_xxh3': None}
+
+    async def record(self, db: AsyncSession, results: list[dict]) -> None:
+        connection = await db.connection()
+        await connection.execute(
+            update(Blob.__table__).where(Blob.hash == bindparam('b_hash')).values(
+                verified_at=func.now(), corrupt=bindparam('b_corrupt'),
+                xxh3=func.coalesce(Blob.xxh3, bindparam('b_xxh3'))
+            ),
+            results
+        )
+        # files stored before checksums were recorded get theirs from the verified content
+        if verified := [result for result in results if not result['b_corrupt']]:
+            await connection.execute(
+                update(File.__table__).where(File.blob_hash == bindparam('b_hash'), File.xxh3.is_(None)).values(
+                    xxh3=bindparam('b_xxh3')
+                ),
+                verified
+            )
+
+    async def run(self, db: AsyncSession, *, limit: int | None = None) -> ScrubStats:
+        """Verify up to `limit` blobs, or the rest of the current pass."""
+        cursor = await checkpoint_crud.get(db, name=self.name) or ''
+        while limit is None or self.stats.checked < limit:
+            size = self.batch if limit is None else min(self.batch, limit - self.stats.checked)
+            statement = select(Blob.hash, Blob.size, Blob.encoding, Blob.xxh3).where(
+                Blob.hash > cursor, Blob.refcount > 0
+            ).order_by(Blob.hash).limit(size)
+            blobs = (await db.execute(statement)).all()
+            # no connection is held while the contents are read
+            await db.rollback()
+            if not blobs:
+                await checkpoint_crud.save(db, name=self.name, cursor=None)
+                await db.commit()
+                break
+            results = [result for blob in blobs if (result := await self.verify(blob)) is not None]
+            if results:
+                await self.record(db, results)
+            cursor = blobs[-1].hash
+            await checkpoint_crud.save(db, name=self.name, cursor=cursor)
+            await db.commit()
+            self.stats.checked += len(blobs)
+            self.stats.corrupt += sum(result['b_corrupt'] for result in results)
+            self.stats.unreadable += len(blobs) - len(results)
+        return self.stats
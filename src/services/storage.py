@@ -0,0 +1,333 @@
+import abc
+import asyncio
+import datetime
+import hashlib
+import hmac
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterable, AsyncIterator
+from urllib.parse import quote
+from xml.etree import ElementTree
+
+import aiofiles
+import aiofiles.os
+import httpx
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 2 ** 16
+
+
+class StorageError(Exception):
+    pass
+
+
+@dataclass
+class ObjectStat:
+    size: int
+    modified: float
+
+
+async def read_file(path: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+    """Read [start, end] (inclusive) of a local file in chunks."""
+    async with aiofiles.open(path, 'rb') as file:
+        await file.seek(start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            chunk = await file.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+class StorageBackend(abc.ABC):
+    """Object storage addressed by slash-separated keys."""
+
+    @abc.abstractmethod
+    async def write(self, key: str, chunks: AsyncIterable[bytes]) -> int:
+        ...
+
+    @abc.abstractmethod
+    def read(self, key: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def stat(self, key: str) -> ObjectStat | None:
+        ...
+
+    async def exists(self, key: str) -> bool:
+        return await self.stat(key) is not None
+
+    async def put_file(self, key: str, path: str) -> None:
+        """Store a local file under key, consuming it."""
+        await self.write(key, read_file(path))
+        await aiofiles.os.remove(path)
+
+    def local_path(self, key: str) -> str | None:
+        """Filesystem path of the object when it can be served with sendfile."""
+        return None
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalStorage(StorageBackend):
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    async def write(self, key: str, chunks: AsyncIterable[bytes]) -> int:
+        path = self.local_path(key)
+        await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4()}.tmp'
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as out_file:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    await out_file.write(chunk)
+            await aiofiles.os.replace(tmp_path, path)
+        except BaseException:
+            await self._remove(tmp_path)
+            raise
+        return size
+
+    async def put_file(self, key: str, path: str) -> None:
+        target = self.local_path(key)
+        await aiofiles.os.makedirs(os.path.dirname(target), exist_ok=True)
+        await aiofiles.os.replace(path, target)
+
+    def read(self, key: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        return read_file(self.local_path(key), start, end)
+
+    async def delete(self, key: str) -> None:
+        await self._remove(self.local_path(key))
+
+    async def stat(self, key: str) -> ObjectStat | None:
+        try:
+            stat_result = await aiofiles.os.stat(self.local_path(key))
+        except FileNotFoundError:
+            return None
+        return ObjectStat(size=stat_result.st_size, modified=stat_result.st_mtime)
+
+    @staticmethod
+    async def _remove(path: str) -> None:
+        try:
+            await aiofiles.os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class S3Storage(StorageBackend):
+    """S3-compatible driver: SigV4 over a pooled httpx client, concurrent multipart uploads."""
+
+    def __init__(
+            self,
+            *,
+            endpoint_url: str,
+            bucket: str,
+            access_key: str,
+            secret_key: str,
+            region: str = 'us-east-1',
+            part_size: int = 1024 * 1024 * 8,
+            concurrency: int = 8,
+            max_connections: int = 64,
+    ):
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self.client = httpx.AsyncClient(
+            base_url=endpoint_url,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+
+    def sign(self, method: str, path: str, params: dict[str, str], headers: dict[str, str]) -> dict[str, str]:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        amz_date, date = now.strftime('%Y%m%dT%H%M%SZ'), now.strftime('%Y%m%d')
+        headers = headers | {
+            'host': self.client.base_url.netloc.decode(),
+            'x-amz-date': amz_date,
+            'x-amz-content-sha256': 'UNSIGNED-PAYLOAD',
+        }
+        signed = sorted(headers)
+        query = '&'.join(
+            f'{quote(name, safe="-_.~")}={quote(value, safe="-_.~")}' for name, value in sorted(params.items())
+        )
+        canonical_request = '\n'.join([
+            method,
+            path,
+            query,
+            ''.join(f'{name}:{headers[name].strip()}\n' for name in signed),
+            ';'.join(signed),
+            'UNSIGNED-PAYLOAD',
+        ])
+        scope = f'{date}/{self.region}/s3/aws4_request'
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+        key = f'AWS4{self.secret_key}'.encode()
+        for part in (date, self.region, 's3', 'aws4_request'):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers['authorization'] = (
+            f'AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, '
+            f'SignedHeaders={";".join(signed)}, Signature={signature}'
+        )
+        return headers
+
+    def build_request(
+            self, method: str, key: str = '', *, params: dict[str, str] | None = None,
+            headers: dict[str, str] | None = None, content: bytes | None = None
+    ) -> httpx.Request:
+        path = f'/{self.bucket}/{quote(key, safe="/-_.~")}' if key else f'/{self.bucket}'
+        params = params or {}
+        return self.client.build_request(
+            method, path, params=params, content=content, headers=self.sign(method, path, params, headers or {})
+        )
+
+    async def request(self, method: str, key: str = '', *, expected=(200,), **kwargs) -> httpx.Response:
+        response = await self.client.send(self.build_request(method, key, **kwargs))
+        if response.status_code not in expected:
+            raise StorageError(f'{method} {key}: {response.status_code} {response.text[:200]}')
+        return response
+
+    async def create_bucket(self) -> None:
+        await self.request('PUT', expected=(200, 409))
+
+    async def write(self, key: str, chunks: AsyncIterable[bytes]) -> int:
+        buffer = bytearray()
+        size = 0
+        upload = None
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                size += len(chunk)
+                while len(buffer) >= self.part_size:
+                    upload = upload or await MultipartUpload.start(self, key)
+                    await upload.add(bytes(buffer[:self.part_size]))
+                    del buffer[:self.part_size]
+            if upload is None:
+                await self.request('PUT', key, content=bytes(buffer))
+                return size
+            if buffer:
+                await upload.add(bytes(buffer))
+            await upload.complete()
+        except BaseException:
+            if upload is not None:
+                await upload.abort()
+            raise
+        return size
+
+    async def read(self, key: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        headers = {}
+        if start or end is not None:
+            headers['range'] = f'bytes={start}-{"" if end is None else end}'
+        response = await self.client.send(self.build_request('GET', key, headers=headers), stream=True)
+        try:
+            if response.status_code not in (200, 206):
+                await response.aread()
+                raise StorageError(f'GET {key}: {response.status_code}')
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                yield chunk
+        finally:
+            await response.aclose()
+
+    async def delete(self, key: str) -> None:
+        await self.request('DELETE', key, expected=(200, 204, 404))
+
+    async def stat(self, key: str) -> ObjectStat | None:
+        response = await self.request('HEAD', key, expected=(200, 404))
+        if response.status_code == 404:
+            return None
+        return ObjectStat(
+            size=int(response.headers['content-length']),
+            modified=parsedate_to_datetime(response.headers['last-modified']).timestamp()
+        )
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class MultipartUpload:
+    """Parts are sent concurrently; at most `concurrency` parts are held in memory."""
+
+    def __init__(self, storage: S3Storage, key: str, upload_id: str):
+        self.storage = storage
+        self.key = key
+        self.upload_id = upload_id
+        self.slots = asyncio.Semaphore(storage.concurrency)
+        self.tasks: list[asyncio.Task] = []
+
+    @classmethod
+    async def start(cls, storage: S3Storage, key: str) -> 'MultipartUpload':
+        response = await storage.request('POST', key, params={'uploads': ''})
+        upload_id = next(element.text for element in ElementTree.fromstring(response.content).iter()
+                         if element.tag.endswith('UploadId'))
+        return cls(storage, key, upload_id)
+
+    async def add(self, content: bytes) -> None:
+        await self.slots.acquire()
+        number = len(self.tasks) + 1
+        self.tasks.append(asyncio.create_task(self._send(number, content)))
+
+    async def _send(self, number: int, content: bytes) -> str:
+        try:
+            response = await self.storage.request(
+                'PUT', self.key, params={'partNumber': str(number), 'uploadId': self.upload_id}, content=content
+            )
+            return response.headers['etag']
+        finally:
+            self.slots.release()
+
+    async def complete(self) -> None:
+        etags = await asyncio.gather(*self.tasks)
+        body = ''.join(
+            f'<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>'
+            for number, etag in enumerate(etags, start=1)
+        )
+        await self.storage.request(
+            'POST', self.key, params={'uploadId': self.upload_id},
+            content=f'<CompleteMultipartUpload>{body}</CompleteMultipartUpload>'.encode()
+        )
+
+    async def abort(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.storage.request('DELETE', self.key, params={'uploadId': self.upload_id}, expected=(200, 204, 404))
+
+
+def get_storage() -> StorageBackend:
+    if settings.STORAGE_BACKEND == 's3':
+        return S3Storage(
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            bucket=settings.S3_BUCKET,
+            access_key=settings.S3_ACCESS_KEY,
+            secret_key=settings.S3_SECRET_KEY,
+            region=settings.S3_REGION,
+            part_size=settings.S3_PART_SIZE,
+            concurrency=settings.S3_CONCURRENCY,
+            max_connections=settings.S3_MAX_CONNECTIONS,
+        )
+    return LocalStorage(settings.FILE_FOLDER)
+
+
+storage = get_storage()
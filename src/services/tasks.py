@@ -0,0 +1,43 @@
+"""Job types run after uploads. Importing this module registers them.
+
+UPLOAD_JOBS lists the types enqueued for every newly stored blob, with payload
+{'hash': <sha256>}. `promote_blob` is enqueued by the access log for downloaded
+blobs that are on the cold tier.
+"""
+import logging
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from models.models import Blob
+from services.blobs import blob_store
+from services.jobs import register
+from services.scrubber import Scrubber
+from services.storage import StorageError
+from services.tiers import cold_tier
+
+logger = logging.getLogger(__name__)
+
+
+@register('verify_blob', concurrency=2)
+async def verify_blob(db: AsyncSession, payload: dict[str, Any]) -> None:
+    """Read a new blob back from storage and check it against the checksums taken during the upload."""
+    statement = select(Blob.hash, Blob.size, Blob.encoding, Blob.xxh3).where(Blob.hash == payload['hash'])
+    if (blob := (await db.execute(statement)).one_or_none()) is None:
+        # collected in the meantime
+        return
+    await db.rollback()
+    scrubber = Scrubber(blob_store, rate=settings.SCRUB_RATE, batch=1)
+    if (result := await scrubber.verify(blob)) is None:
+        # failed, so the job is retried with backoff
+        raise StorageError(f'Blob {blob.hash} could not be read')
+    await scrubber.record(db, [result])
+    await db.commit()
+
+
+@register('promote_blob', concurrency=2)
+async def promote_blob(db: AsyncSession, payload: dict[str, Any]) -> None:
+    """Copy a downloaded blob from its pack back to the hot tier."""
+    await cold_tier.promote(db, blob_store, hash_=payload['hash'])
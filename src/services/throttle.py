@@ -0,0 +1,22 @@
+import asyncio
+import time
+from typing import Callable
+
+
+class Throttle:
+    """Keeps the average rate of some work at or below `rate` units (bytes, unlinks) per second."""
+
+    def __init__(self, rate: float, *, clock: Callable[[], float] = time.monotonic, sleep=asyncio.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.start = clock()
+        self.total = 0
+
+    async def consume(self, amount: int = 1) -> None:
+        if not self.rate:
+            return
+        self.total += amount
+        ahead = self.total / self.rate - (self.clock() - self.start)
+        if ahead > 0:
+            await self.sleep(ahead)
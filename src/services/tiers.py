@@ -0,0 +1,299 @@
+"""Hot and cold storage tiers for blobs.
+
+New blobs land on the hot backend. Blobs nobody downloaded for COLD_AFTER seconds are
+copied back to back into large pack files on the cold backend, and their hot copies
+removed; `blobs.pack_id` and `pack_offset` say where each one is. `TieredStorage` reads
+the hot copy when there is one and the packed one otherwise, so every reader (downloads,
+archives, the scrubber) works with either. Downloads are counted in memory by `AccessLog`
+and written in batches; a cold blob that was downloaded is copied back to the hot tier
+by a `promote_blob` job.
+"""
+import asyncio
+import datetime
+import logging
+import os
+import uuid
+from collections import Counter
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable
+
+from sqlalchemy import Row, bindparam, case, delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from db.db import async_session
+from models.models import Blob, Pack
+from services.jobs import job_crud
+from services.storage import LocalStorage, ObjectStat, StorageBackend, StorageError
+from services.throttle import Throttle
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PackedObject:
+    pack_id: uuid.UUID
+    offset: int
+    size: int
+    modified: float
+
+
+def pack_key(pack_id: uuid.UUID) -> str:
+    return f'packs/{pack_id}'
+
+
+async def locate(key: str) -> PackedObject | None:
+    """Where the blob stored under `key` is packed; None when it isn't."""
+    # blob keys end with the hash, see BlobStore.key
+    statement = select(Blob.pack_id, Blob.pack_offset, Blob.stored_size, Blob.created_at).where(
+        Blob.hash == key.rpartition('/')[2], Blob.pack_id.is_not(None)
+    )
+    async with async_session() as db:
+        row = (await db.execute(statement)).one_or_none()
+    if row is None:
+        return None
+    return PackedObject(row.pack_id, row.pack_offset, row.stored_size, row.created_at.timestamp())
+
+
+class TieredStorage(StorageBackend):
+    """A hot backend in front of packed objects on a cold one.
+
+    Writes and deletes go to the hot tier. An object missing there is looked up with
+    `locate` and read from its pack. Local paths are only given for hot copies, so
+    zero-copy sends and X-Accel-Redirect never point at a file that isn't there.
+    """
+
+    def __init__(
+            self,
+            hot: StorageBackend,
+            cold: StorageBackend,
+            locate: Callable[[str], Awaitable[PackedObject | None]] = locate
+    ):
+        self.hot = hot
+        self.cold = cold
+        self.locate = locate
+
+    async def write(self, key: str, chunks: AsyncIterable[bytes]) -> int:
+        return await self.hot.write(key, chunks)
+
+    async def put_file(self, key: str, path: str) -> None:
+        await self.hot.put_file(key, path)
+
+    async def delete(self, key: str) -> None:
+        await self.hot.delete(key)
+
+    def local_path(self, key: str) -> str | None:
+        path = self.hot.local_path(key)
+        return path if path is not None and os.path.exists(path) else None
+
+    async def stat(self, key: str) -> ObjectStat | None:
+        if (stat := await self.hot.stat(key)) is not None:
+            return stat
+        if (packed := await self.locate(key)) is None:
+            return None
+        return ObjectStat(size=packed.size, modified=packed.modified)
+
+    async def read(self, key: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        chunks = self.hot.read(key, start, end)
+        try:
+            # a missing object fails on the first chunk, before anything was sent
+            first = await anext(chunks, None)
+        except (FileNotFoundError, StorageError):
+            await chunks.aclose()
+            if (packed := await self.locate(key)) is None:
+                raise
+            chunks = self.read_packed(packed, start, end)
+            first = await anext(chunks, None)
+        async with aclosing(chunks):
+            if first is None:
+                return
+            yield first
+            async for chunk in chunks:
+                yield chunk
+
+    def read_packed(self, packed: PackedObject, start: int, end: int | None) -> AsyncIterator[bytes]:
+        last = packed.size - 1 if end is None else min(end, packed.size - 1)
+        return self.cold.read(pack_key(packed.pack_id), packed.offset + start, packed.offset + last)
+
+    async def close(self) -> None:
+        await self.hot.close()
+        await self.cold.close()
+
+
+def tiered(backend: StorageBackend) -> StorageBackend:
+    if not settings.COLD_FOLDER:
+        return backend
+    return TieredStorage(backend, LocalStorage(settings.COLD_FOLDER))
+
+
+class AccessLog:
+    """Downloads per blob, counted in memory and written with one statement per flush."""
+
+    def __init__(self, clock: Callable[[], datetime.datetime] = lambda: datetime.datetime.now(datetime.timezone.utc)):
+        self.clock = clock
+        self.counts: Counter[str] = Counter()
+        self.last: dict[str, datetime.datetime] = {}
+
+    def record(self, hash_: str) -> None:
+        self.counts[hash_] += 1
+        self.last[hash_] = self.clock()
+
+    async def flush(self, db: AsyncSession) -> int:
+        """Write the counts taken since the last flush and queue cold blobs among them for promotion."""
+        if not self.counts:
+            return 0
+        counts, last = self.counts, self.last
+        self.counts, self.last = Counter(), {}
+        try:
+            connection = await db.connection()
+            # in hash order, like release_many, so concurrent flushes can't deadlock
+            await connection.execute(
+                update(Blob.__table__).where(Blob.hash == bindparam('b_hash')).values(
+                    downloads=Blob.downloads + bindparam('b_count'),
+                    last_access_at=func.greatest(Blob.last_access_at, bindparam('b_at')),
+                ),
+                [{'b_hash': hash_, 'b_count': counts[hash_], 'b_at': last[hash_]} for hash_ in sorted(counts)]
+            )
+            cold = select(Blob.hash).where(Blob.hash.in_(counts), Blob.pack_id.is_not(None))
+            hashes = (await db.execute(cold)).scalars().all()
+            await job_crud.enqueue_many(db, 'promote_blob', [{'hash': hash_} for hash_ in hashes])
+            await db.commit()
+        except BaseException:
+            # kept for the next flush, together with what was counted meanwhile
+            self.counts.update(counts)
+            for hash_, at in last.items():
+                self.last[hash_] = max(at, self.last.get(hash_, at))
+            raise
+        return len(counts)
+
+    async def run(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await self.close()
+
+    async def close(self) -> None:
+        try:
+            async with async_session() as db:
+                await self.flush(db)
+        except Exception:
+            logger.exception('Writing download counts failed.')
+
+
+class ColdTier:
+    """Moves blobs between the tiers of a TieredStorage."""
+
+    async def candidates(self, db: AsyncSession, *, cold_after: int, pack_size: int, limit: int) -> list[Row]:
+        """The least recently used cold blobs, up to `limit` and `pack_size` bytes."""
+        last_access = func.coalesce(Blob.last_access_at, Blob.created_at)
+        statement = select(Blob.hash, Blob.stored_size).where(
+            Blob.pack_id.is_(None),
+            Blob.refcount > 0,
+            Blob.corrupt.is_(False),
+            last_access < func.now() - datetime.timedelta(seconds=cold_after),
+        ).order_by(last_access).limit(limit)
+        batch, size = [], 0
+        for row in (await db.execute(statement)).all():
+            if batch and size + row.stored_size > pack_size:
+                break
+            batch.append(row)
+            size += row.stored_size
+        return batch
+
+    async def demote(
+            self,
+            db: AsyncSession,
+            store,
+            *,
+            cold_after: int,
+            pack_size: int,
+            limit: int,
+            throttle: Throttle | None = None
+    ) -> int:
+        """Pack the `candidates` into one new pack; returns how many blobs moved."""
+        backend: TieredStorage = store.backend
+        batch = await self.candidates(db, cold_after=cold_after, pack_size=pack_size, limit=limit)
+        # no connection is held while the pack is written
+        await db.rollback()
+        if not batch:
+            return 0
+        size = sum(row.stored_size for row in batch)
+        pack_id, offsets = uuid.uuid4(), {}
+
+        async def chunks() -> AsyncIterator[bytes]:
+            offset = 0
+            for row in batch:
+                offsets[row.hash] = offset
+                async with aclosing(backend.hot.read(store.key(row.hash))) as data:
+                    async for chunk in data:
+                        offset += len(chunk)
+                        if throttle is not None:
+                            await throttle.consume(len(chunk))
+                        yield chunk
+                if offset - offsets[row.hash] != row.stored_size:
+                    raise StorageError(f'Blob {row.hash} is not {row.stored_size} bytes long.')
+
+        await backend.cold.write(pack_key(pack_id), chunks())
+        await db.execute(insert(Pack.__table__).values(id=pack_id, size=size, blobs=0))
+        # blobs collected or promoted meanwhile stay out; their bytes are dead space in the pack
+        moved = (await db.execute(
+            update(Blob.__table__).where(
+                Blob.hash.in_(offsets), Blob.pack_id.is_(None), Blob.refcount > 0
+            ).values(pack_id=pack_id, pack_offset=case(offsets, value=Blob.hash)).returning(Blob.hash)
+        )).scalars().all()
+        if not moved:
+            await db.rollback()
+            await backend.cold.delete(pack_key(pack_id))
+            return 0
+        await db.execute(update(Pack.__table__).where(Pack.id == pack_id).values(blobs=len(moved)))
+        await db.commit()
+
+        # hot copies go only while the rows still point at the pack: a blob promoted
+        # in the meantime keeps its new hot copy
+        statement = select(Blob.hash).where(Blob.hash.in_(moved), Blob.pack_id == pack_id).with_for_update()
+        for hash_ in (await db.execute(statement)).scalars().all():
+            await backend.hot.delete(store.key(hash_))
+        await db.commit()
+        logger.info(f'Packed {len(moved)} blobs, {size} bytes, into pack {pack_id}.')
+        return len(moved)
+
+    async def promote(self, db: AsyncSession, store, *, hash_: str) -> bool:
+        """Copy a packed blob back to the hot tier; False when it isn't packed (anymore)."""
+        backend: TieredStorage = store.backend
+        # the row lock keeps demote from deleting the new copy and gc from dropping the blob
+        statement = select(Blob.pack_id, Blob.pack_offset, Blob.stored_size).where(
+            Blob.hash == hash_, Blob.pack_id.is_not(None)
+        ).with_for_update()
+        if (row := (await db.execute(statement)).one_or_none()) is None:
+            await db.rollback()
+            return False
+        packed = PackedObject(row.pack_id, row.pack_offset, row.stored_size, 0)
+        await backend.hot.write(store.key(hash_), backend.read_packed(packed, 0, None))
+        await db.execute(update(Blob.__table__).where(Blob.hash == hash_).values(pack_id=None, pack_offset=None))
+        emptied = await self.release_packs(db, Counter({row.pack_id: 1}))
+        await db.commit()
+        await self.drop_packs(backend, emptied)
+        logger.info(f'Promoted blob {hash_} from pack {row.pack_id}.')
+        return True
+
+    async def release_packs(self, db: AsyncSession, counts: dict[uuid.UUID, int]) -> list[uuid.UUID]:
+        """Count blobs out of their packs; returns the packs left empty, whose rows are deleted."""
+        emptied = []
+        for pack_id, count in sorted(counts.items()):
+            statement = update(Pack.__table__).where(Pack.id == pack_id).values(
+                blobs=Pack.blobs - count
+            ).returning(Pack.blobs)
+            if (await db.execute(statement)).scalar_one_or_none() == 0:
+                emptied.append(pack_id)
+        if emptied:
+            await db.execute(delete(Pack.__table__).where(Pack.id.in_(emptied)))
+        return emptied
+
+    async def drop_packs(self, backend: StorageBackend, pack_ids: list[uuid.UUID]) -> None:
+        """Delete pack files whose rows are gone; call after the commit."""
+        for pack_id in pack_ids:
+            await backend.cold.delete(pack_key(pack_id))
+
+
+access_log = AccessLog()
+cold_tier = ColdTier()
@@ -0,0 +1,59 @@
+import datetime
+import uuid
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.models import DeletedFile, File
+
+FILE_COLUMNS = [column.key for column in File.__table__.columns]
+
+
+class RepositoryTrash:
+    """Soft-deleted files. Their rows leave `files`, so no query there has to filter them out."""
+
+    async def move(self, db: AsyncSession, *, user_id: uuid.UUID, condition) -> list:
+        """Move the user's files matching `condition` to the trash in one statement."""
+        # core statements: the ORM can't nest a DML statement as a CTE
+        files, deleted = File.__table__, DeletedFile.__table__
+        removed = delete(files).where(files.c.user_id == user_id, condition).returning(*files.c).cte('removed')
+        statement = insert(deleted).from_select(
+            FILE_COLUMNS, select(*(removed.c[key] for key in FILE_COLUMNS))
+        ).returning(
+            deleted.c.id, deleted.c.name, deleted.c.path, deleted.c.directory, deleted.c.size,
+            deleted.c.is_downloadable, deleted.c.deleted_at
+        )
+        return (await db.execute(statement)).all()
+
+    async def get_multi(
+            self, db: AsyncSession, *, user_id: uuid.UUID, retention: int, limit: int
+    ) -> list[DeletedFile]:
+        statement = select(DeletedFile).where(
+            DeletedFile.user_id == user_id,
+            DeletedFile.deleted_at > func.now() - datetime.timedelta(seconds=retention)
+        ).order_by(DeletedFile.deleted_at.desc(), DeletedFile.id).limit(limit)
+        return (await db.execute(statement)).scalars().all()
+
+    async def take(
+            self, db: AsyncSession, *, user_id: uuid.UUID, id_: uuid.UUID, retention: int
+    ) -> DeletedFile | None:
+        """Remove a file still within retention from the trash, in the caller's transaction."""
+        statement = delete(DeletedFile).where(
+            DeletedFile.id == id_,
+            DeletedFile.user_id == user_id,
+            DeletedFile.deleted_at > func.now() - datetime.timedelta(seconds=retention)
+        ).returning(DeletedFile)
+        return (await db.execute(statement)).scalar_one_or_none()
+
+    async def expire(self, db: AsyncSession, *, retention: int, limit: int) -> list:
+        """Drop up to `limit` files past retention; returns id, name and blob_hash of each."""
+        expired = select(DeletedFile.id).where(
+            DeletedFile.deleted_at < func.now() - datetime.timedelta(seconds=retention)
+        ).order_by(DeletedFile.deleted_at).limit(limit).with_for_update(skip_locked=True)
+        statement = delete(DeletedFile).where(DeletedFile.id.in_(expired)).returning(
+            DeletedFile.id, DeletedFile.name, DeletedFile.blob_hash
+        )
+        return (await db.execute(statement)).all()
+
+
+trash_crud = RepositoryTrash()
@@ -0,0 +1,121 @@
+import datetime
+import logging
+import os
+import shutil
+import uuid
+from typing import AsyncIterable
+
+import aiofiles
+import aiofiles.os
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from models.models import Upload
+from services.ingest import BlobTooLarge
+
+logger = logging.getLogger(__name__)
+
+
+class PartStore:
+    """Parts of resumable uploads, one directory per upload session."""
+
+    def __init__(self, root: str):
+        self.root = os.path.join(root, 'uploads')
+
+    def folder(self, upload_id: uuid.UUID) -> str:
+        return os.path.join(self.root, str(upload_id))
+
+    def path(self, upload_id: uuid.UUID, number: int) -> str:
+        return os.path.join(self.folder(upload_id), f'{number:05d}.part')
+
+    async def stage(
+            self, upload_id: uuid.UUID, number: int, chunks: AsyncIterable[bytes], max_size: int
+    ) -> tuple[str, int]:
+        """Write a part to a temporary file; `publish` or `discard` it afterwards."""
+        folder = self.folder(upload_id)
+        await aiofiles.os.makedirs(folder, exist_ok=True)
+        tmp_path = os.path.join(folder, f'{number:05d}.{uuid.uuid4()}.tmp')
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as out_file:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_size:
+                        raise BlobTooLarge(size)
+                    await out_file.write(chunk)
+        except BaseException:
+            await self.discard(tmp_path)
+            raise
+        return tmp_path, size
+
+    async def publish(self, upload_id: uuid.UUID, number: int, tmp_path: str) -> None:
+        # parts become visible only when complete, so a retried PUT simply replaces them
+        await aiofiles.os.replace(tmp_path, self.path(upload_id, number))
+
+    async def discard(self, tmp_path: str) -> None:
+        try:
+            await aiofiles.os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+    async def parts(self, upload_id: uuid.UUID) -> dict[int, int]:
+        folder = self.folder(upload_id)
+        if not await aiofiles.os.path.exists(folder):
+            return {}
+        return {
+            int(entry.name.split('.')[0]): entry.stat().st_size
+            for entry in sorted(await aiofiles.os.scandir(folder), key=lambda entry: entry.name)
+            if entry.name.endswith('.part')
+        }
+
+    async def remove(self, upload_id: uuid.UUID) -> None:
+        await aiofiles.os.wrap(shutil.rmtree)(self.folder(upload_id), ignore_errors=True)
+
+
+class RepositoryUpload:
+
+    async def get(self, db: AsyncSession, id_: uuid.UUID, *, user_id: uuid.UUID, lock=False) -> Upload | None:
+        statement = select(Upload).where(Upload.id == id_, Upload.user_id == user_id)
+        if lock:
+            statement = statement.with_for_update()
+        results = await db.execute(statement=statement)
+        return results.scalar_one_or_none()
+
+    async def create(self, db: AsyncSession, *, name: str, path: str, user_id: uuid.UUID) -> Upload:
+        db_obj = Upload(id=uuid.uuid4(), name=name, path=path, user_id=user_id)
+        db.add(db_obj)
+        await db.commit()
+        return db_obj
+
+    async def claim(self, db: AsyncSession, id_: uuid.UUID, *, user_id: uuid.UUID) -> Upload | None:
+        """Mark an upload as completing and commit; None when it is gone or already completing."""
+        statement = update(Upload).where(
+            Upload.id == id_, Upload.user_id == user_id, Upload.completing.is_(False)
+        ).values(completing=True).returning(Upload)
+        upload = (await db.execute(statement)).scalar_one_or_none()
+        await db.commit()
+        return upload
+
+    async def unclaim(self, db: AsyncSession, *, id_: uuid.UUID) -> None:
+        await db.execute(update(Upload).where(Upload.id == id_).values(completing=False))
+        await db.commit()
+
+    async def delete(self, db: AsyncSession, *, id_: uuid.UUID) -> None:
+        await db.execute(delete(Upload).where(Upload.id == id_))
+
+    async def expire(self, db: AsyncSession, store: PartStore, *, ttl: int) -> int:
+        statement = delete(Upload).where(
+            Upload.created_at < func.now() - datetime.timedelta(seconds=ttl)
+        ).returning(Upload.id)
+        expired = (await db.execute(statement)).scalars().all()
+        await db.commit()
+        for upload_id in expired:
+            await store.remove(upload_id)
+        if expired:
+            logger.info(f'Expired {len(expired)} abandoned uploads.')
+        return len(expired)
+
+
+part_store = PartStore(settings.FILE_FOLDER)
+upload_crud = RepositoryUpload()
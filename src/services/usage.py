@@ -0,0 +1,65 @@
+import logging
+import uuid
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.models import File, Usage
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class RepositoryUsage:
+
+    async def get(self, db: AsyncSession, *, user_id: uuid.UUID) -> Usage | None:
+        return await db.get(Usage, user_id)
+
+    async def charge(
+            self, db: AsyncSession, *, user_id: uuid.UUID, files: int, used: int, quota: int | None = None
+    ) -> None:
+        """Adjust counters in the caller's transaction; negative values release usage."""
+        if quota is not None and used > quota:
+            raise QuotaExceeded(used)
+        statement = insert(Usage).values(user_id=user_id, files=files, used=used)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Usage.user_id],
+            set_={
+                'files': Usage.files + statement.excluded.files,
+                'used': Usage.used + statement.excluded.used,
+                'updated_at': func.now(),
+            },
+            # checked against the locked row, so concurrent uploads can't overshoot together
+            where=(Usage.used + statement.excluded.used <= quota) if quota is not None and used > 0 else None
+        ).returning(Usage.user_id)
+        if (await db.execute(statement)).scalar_one_or_none() is None:
+            raise QuotaExceeded(used)
+
+    async def reconcile(self, db: AsyncSession) -> int:
+        """Rebuild all counters from the files table in bulk."""
+        # writers wait while the counters are rebuilt, so no upload is lost or counted twice
+        await db.execute(text('LOCK TABLE files IN SHARE MODE'))
+        totals = select(
+            File.user_id, func.count(File.id), func.coalesce(func.sum(File.size), 0)
+        ).group_by(File.user_id)
+        statement = insert(Usage).from_select(['user_id', 'files', 'used'], totals)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Usage.user_id],
+            set_={'files': statement.excluded.files, 'used': statement.excluded.used, 'updated_at': func.now()}
+        )
+        result = await db.execute(statement)
+        await db.execute(
+            update(Usage).where(
+                Usage.files != 0, Usage.user_id.not_in(select(File.user_id).distinct())
+            ).values(files=0, used=0)
+        )
+        await db.commit()
+        logger.info(f'Reconciled usage of {result.rowcount} users.')
+        return result.rowcount
+
+
+usage_crud = RepositoryUsage()
@@ -1,11 +1,29 @@
+import time
 import uuid
+from typing import Any
 
+import jwt
 from fastapi import Depends, Request
-from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin
+from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin, exceptions
 from fastapi_users.authentication import AuthenticationBackend, BearerTransport, JWTStrategy
+from fastapi_users.jwt import decode_jwt, generate_jwt
+from sqlalchemy.orm import make_transient_to_detached
 
 from core.config import logger, settings
 from models.models import User, get_user_db
+from services.cache import TTLCache
+
+CLAIMS = ("email", "is_active", "is_verified", "is_superuser")
+
+# column values of recently resolved users, keyed by id
+user_cache: TTLCache[uuid.UUID, dict[str, Any]] = TTLCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
+
+
+def detached_user(values: dict[str, Any]) -> User:
+    # a fresh detached instance per request: the users router may attach it to its session and update it
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
 
 
 class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
@@ -15,16 +33,29 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
     async def on_after_register(self, user: User, request: Request | None = None):
         logger.info(f"User {user.id} has registered.")
 
+    async def on_after_update(self, user: User, update_dict: dict[str, Any], request: Request | None = None):
+        # covers deactivation, password and email changes
+        user_cache.pop(user.id)
+
     async def on_after_forgot_password(
             self, user: User, token: str, request: Request | None = None
     ):
         logger.info(f"User {user.id} has forgot their password. Reset token: {token}")
 
+    async def on_after_reset_password(self, user: User, request: Request | None = None):
+        user_cache.pop(user.id)
+
     async def on_after_request_verify(
             self, user: User, token: str, request: Request | None = None
     ):
         logger.info(f"Verification requested for user {user.id}. Verification token: {token}")
 
+    async def on_after_verify(self, user: User, request: Request | None = None):
+        user_cache.pop(user.id)
+
+    async def on_after_delete(self, user: User, request: Request | None = None):
+        user_cache.pop(user.id)
+
 
 async def get_user_manager(user_db=Depends(get_user_db)):
     yield UserManager(user_db)
@@ -33,8 +64,49 @@ async def get_user_manager(user_db=Depends(get_user_db)):
 bearer_transport = BearerTransport(tokenUrl="auth/jwt/login")
 
 
+class CachedJWTStrategy(JWTStrategy[User, uuid.UUID]):
+    """JWT strategy that resolves users without a query while they are cached.
+
+    Invalidation only reaches the current process: other workers see a change
+    after at most USER_CACHE_TTL seconds. With AUTH_TRUST_CLAIMS the flags signed
+    into a token are trusted for that many seconds after it was issued.
+    """
+
+    async def read_token(self, token: str | None, user_manager: BaseUserManager[User, uuid.UUID]) -> User | None:
+        if token is None:
+            return None
+        try:
+            data = decode_jwt(token, self.decode_key, self.token_audience, algorithms=[self.algorithm])
+            user_id = user_manager.parse_id(data.get("sub"))
+        except (jwt.PyJWTError, exceptions.InvalidID):
+            return None
+
+        if (values := user_cache.get(user_id)) is not None:
+            return detached_user(values)
+        if self.trusts(data):
+            return detached_user({"id": user_id} | {claim: data[claim] for claim in CLAIMS})
+        try:
+            user = await user_manager.get(user_id)
+        except exceptions.UserNotExists:
+            return None
+        user_cache.set(user_id, {column.key: getattr(user, column.key) for column in User.__table__.columns})
+        return user
+
+    @staticmethod
+    def trusts(data: dict[str, Any]) -> bool:
+        if settings.AUTH_TRUST_CLAIMS <= 0 or not all(claim in data for claim in CLAIMS):
+            return False
+        return time.time() - data.get("iat", 0) < settings.AUTH_TRUST_CLAIMS
+
+    async def write_token(self, user: User) -> str:
+        data = {"sub": str(user.id), "aud": self.token_audience}
+        if settings.AUTH_TRUST_CLAIMS > 0:
+            data |= {"iat": int(time.time())} | {claim: getattr(user, claim) for claim in CLAIMS}
+        return generate_jwt(data, self.encode_key, self.lifetime_seconds, algorithm=self.algorithm)
+
+
 def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=settings.SECRET, lifetime_seconds=settings.TOKEN_EXPIRE)
+    return CachedJWTStrategy(secret=settings.SECRET, lifetime_seconds=settings.TOKEN_EXPIRE)
 
 
 auth_backend = AuthenticationBackend(
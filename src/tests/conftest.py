@@ -2,6 +2,7 @@ import asyncio
 from typing import AsyncGenerator
 
 import pytest_asyncio
+from fastapi import status
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine
 from sqlalchemy.orm import sessionmaker
@@ -10,6 +11,11 @@ from core.config import settings
 from db.db import get_session
 from main import app
 from models.models import Base
+from services.blobs import BlobStore, blob_store
+from services.cache import RedisClient
+from services.hotfiles import hot_files
+from services.storage import LocalStorage
+from services.uploads import PartStore, part_store
 
 
 @pytest_asyncio.fixture(scope='session')
@@ -80,3 +86,68 @@ async def client_auth(async_session) -> AsyncGenerator[AsyncClient, None]:
         token = response.json().get('access_token')
         client.headers.update({'Authorization': f'Bearer {token}', 'user_id': user_id})
         yield client
+
+
+@pytest_asyncio.fixture()
+async def storage(tmp_path, monkeypatch) -> BlobStore:
+    for key, value in vars(BlobStore(str(tmp_path), LocalStorage(str(tmp_path)))).items():
+        monkeypatch.setattr(blob_store, key, value)
+    for key, value in vars(PartStore(str(tmp_path))).items():
+        monkeypatch.setattr(part_store, key, value)
+    hot_files.clear()
+    yield blob_store
+
+
+async def upload(client: AsyncClient, path: str, name: str = 'a.txt', content: bytes = b'content') -> dict:
+    """Upload one file through the API; fails the test right here when the upload does."""
+    response = await client.post(
+        app.url_path_for('upload_file_handler'), params={'path': path}, files={'file': (name, content)}
+    )
+    assert response.status_code == status.HTTP_200_OK, response.text
+    return response.json()
+
+
+class RedisStandIn:
+    """In-memory server speaking enough of the Redis protocol for the shared cache tier and limits."""
+
+    def __init__(self):
+        self.data: dict[bytes, bytes] = {}
+        self.server = None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                command = await RedisClient.reply(reader)
+                writer.write(self.execute(command[0].upper(), command[1:]))
+                await writer.drain()
+        except ConnectionError:
+            writer.close()
+
+    def execute(self, name: bytes, args: list[bytes]) -> bytes:
+        if name == b'GET':
+            value = self.data.get(args[0])
+            return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+        if name == b'SET':
+            self.data[args[0]] = args[1]
+            return b'+OK\r\n'
+        if name == b'DEL':
+            return b':%d\r\n' % sum(self.data.pop(key, None) is not None for key in args)
+        if name in (b'INCR', b'DECR', b'INCRBY', b'DECRBY'):
+            step = int(args[1]) if name.endswith(b'BY') else 1
+            value = int(self.data.get(args[0], 0)) + (-step if name.startswith(b'DECR') else step)
+            self.data[args[0]] = b'%d' % value
+            return b':%d\r\n' % value
+        if name == b'PEXPIRE':
+            return b':%d\r\n' % (args[0] in self.data)
+        return b'-ERR unknown command\r\n'
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return f'redis://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/0'
+
+
+@pytest_asyncio.fixture()
+async def redis_url():
+    stand_in = RedisStandIn()
+    yield await stand_in.start()
+    stand_in.server.close()
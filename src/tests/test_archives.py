@@ -0,0 +1,51 @@
+import io
+import tarfile
+import zipfile
+
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from main import app
+from services.blobs import BlobStore
+from tests.conftest import upload
+
+
+async def test_download_by_path(async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore):
+    await upload(client_auth, 'docs', 'a.txt', b'hello')
+
+    response = await client_auth.get(app.url_path_for('download_by_path_handler'), params={'path': '/docs/a.txt'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == b'hello'
+
+    response = await client_auth.get(app.url_path_for('download_by_path_handler'), params={'path': 'docs/b.txt'})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_archive_directory_as_zip(async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore):
+    await upload(client_auth, 'docs', 'a.txt', b'hello')
+    await upload(client_auth, 'docs/sub', 'b.bin', bytes(range(256)) * 1000)
+    await upload(client_auth, 'other', 'c.txt', b'skipped')
+
+    response = await client_auth.post(app.url_path_for('archive_handler'), json={'directory': 'docs'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'] == 'application/zip'
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == ['a.txt', 'sub/b.bin']
+        assert archive.read('sub/b.bin') == bytes(range(256)) * 1000
+
+
+async def test_archive_ids_as_tar(async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore):
+    first = await upload(client_auth, 'docs', 'a.txt', b'hello')
+    second = await upload(client_auth, 'other', 'c.txt', b'world!')
+
+    response = await client_auth.post(
+        app.url_path_for('archive_handler'), json={'ids': [first['id'], second['id']], 'format': 'tar'}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    with tarfile.open(fileobj=io.BytesIO(response.content)) as archive:
+        assert archive.getnames() == ['docs/a.txt', 'other/c.txt']
+        assert archive.extractfile('other/c.txt').read() == b'world!'
+
+    response = await client_auth.post(app.url_path_for('archive_handler'), json={})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
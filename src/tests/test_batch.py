@@ -0,0 +1,92 @@
+import gzip
+import io
+import os
+import tarfile
+
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from main import app
+from models.models import Blob, Directory, File
+from services.blobs import BlobStore
+from tests.test_users import queries
+
+
+def tar(entries: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w', format=tarfile.PAX_FORMAT) as archive:
+        for name, content in entries.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+async def test_batch_upload_multipart(async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore):
+    files = [('files', (f'{n}.txt', f'file {n % 5}'.encode())) for n in range(20)]
+
+    with queries('INSERT INTO files') as statements:
+        response = await client_auth.post(
+            app.url_path_for('upload_batch_handler'), params={'path': 'batch'}, files=files
+        )
+    assert response.status_code == status.HTTP_200_OK
+    assert [file['path'] for file in response.json()] == [f'batch/{n}.txt' for n in range(20)]
+    assert len(statements) == 1
+
+    blobs = (await async_session.execute(select(Blob.refcount))).scalars().all()
+    assert sorted(blobs) == [4] * 5
+    directory = await async_session.get(Directory, (client_auth.headers['user_id'], 'batch'))
+    assert (directory.files, directory.size) == (20, 120)
+
+    response = await client_auth.get(
+        app.url_path_for('download_by_path_handler'), params={'path': 'batch/7.txt'}
+    )
+    assert response.content == b'file 2'
+
+
+async def test_batch_upload_tar(async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore):
+    log = b'GET /v1/ping 200\n' * 1000
+    body = gzip.compress(tar({'a.txt': b'a', 'docs/b.txt': b'bb', 'docs/deep/c.log': log}))
+    response = await client_auth.post(
+        app.url_path_for('upload_batch_handler'), params={'path': 'unpacked'}, content=body,
+        headers={'content-type': 'application/gzip'}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert sorted(file['path'] for file in response.json()) == [
+        'unpacked/a.txt', 'unpacked/docs/b.txt', 'unpacked/docs/deep/c.log'
+    ]
+    assert response.json()[2]['stored_size'] < len(log)
+    directory = await async_session.get(Directory, (client_auth.headers['user_id'], 'unpacked'))
+    assert (directory.files, directory.size) == (3, 3 + len(log))
+
+    response = await client_auth.get(
+        app.url_path_for('download_by_path_handler'), params={'path': 'unpacked/docs/deep/c.log'},
+        headers={'accept-encoding': 'identity'}
+    )
+    assert response.content == log
+
+
+async def test_batch_upload_is_all_or_nothing(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore
+):
+    url = app.url_path_for('upload_batch_handler')
+    response = await client_auth.post(
+        url, params={'path': 'bad'}, content=tar({'a.txt': b'a', '../escape.txt': b'b'}),
+        headers={'content-type': 'application/x-tar'}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = await client_auth.post(
+        url, params={'path': 'bad'}, files=[('files', ('a.txt', b'1')), ('files', ('a.txt', b'2'))]
+    )
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+    response = await client_auth.post(
+        url, params={'path': 'bad'}, content=tar({'a.txt': b'a'})[:700], headers={'content-type': 'application/x-tar'}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    assert (await async_session.execute(select(func.count(File.id)))).scalar() == 0
+    assert os.listdir(storage.tmp_folder) == []
@@ -0,0 +1,44 @@
+import pytest
+
+from benchmarks.suite import compare, parse_size, parse_sizes
+
+
+def result(scenario: str, requests_per_sec: float, p99_ms: float, errors: int = 0) -> dict:
+    return {'scenario': scenario, 'requests_per_sec': requests_per_sec, 'p99_ms': p99_ms, 'errors': errors}
+
+
+@pytest.mark.parametrize('value, size', [('512', 512), ('4k', 4096), ('1.5K', 1536), (' 64m', 64 * 1024 ** 2)])
+def test_parse_size(value: str, size: int):
+    assert parse_size(value) == size
+
+
+def test_parse_sizes():
+    assert parse_sizes('4k:5,64k:3,1m') == ([4096, 65536, 1024 ** 2], [5.0, 3.0, 1.0])
+    assert parse_sizes('100:0.5') == ([100], [0.5])
+
+
+def test_compare():
+    baseline = {'results': [
+        result('status', 1000, 10), result('list', 500, 20), result('upload', 100, 50), result('download', 200, 0)
+    ]}
+    current = {'results': [
+        result('status', 950, 10.5),  # within the threshold
+        result('list', 400, 20),  # slower
+        result('upload', 100, 60),  # slower at the tail
+        result('download', 200, 5, errors=1),  # no p99 to compare, but failing now
+        result('login', 10, 1000),  # not in the baseline
+    ]}
+    changes = {change['scenario']: change for change in compare(baseline, current, threshold=0.1)}
+
+    assert list(changes) == ['status', 'list', 'upload', 'download']
+    assert changes['status'] == {
+        'scenario': 'status',
+        'requests_per_sec': [1000, 950],
+        'p99_ms': [10, 10.5],
+        'throughput_change': -0.05,
+        'p99_change': 0.05,
+        'regression': False,
+    }
+    assert (changes['list']['throughput_change'], changes['list']['regression']) == (-0.2, True)
+    assert (changes['upload']['p99_change'], changes['upload']['regression']) == (0.2, True)
+    assert (changes['download']['p99_change'], changes['download']['regression']) == (0, True)
@@ -0,0 +1,70 @@
+import datetime
+import os
+
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from main import app
+from models.models import Blob
+from services.blobs import BlobStore, blob_crud
+
+
+async def test_duplicate_upload_stores_blob_once(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore
+):
+    for path in ('first', 'second'):
+        response = await client_auth.post(
+            app.url_path_for('upload_file_handler'),
+            params={'path': path},
+            files={'file': ('report.csv', b'a,b,c\n1,2,3\n')}
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+    blob = (await async_session.execute(select(Blob))).scalar_one()
+    assert blob.refcount == 2
+    assert blob.size == 12
+    assert os.listdir(os.path.dirname(storage.path(blob.hash))) == [blob.hash]
+
+    response = await client_auth.get(app.url_path_for('download_file_handler'), params={'id_': response.json()['id']})
+    assert response.content == b'a,b,c\n1,2,3\n'
+
+
+async def test_conflicting_upload_leaves_no_object(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore
+):
+    url = app.url_path_for('upload_file_handler')
+    response = await client_auth.post(url, params={'path': 'docs'}, files={'file': ('a.txt', b'first')})
+    assert response.status_code == status.HTTP_200_OK
+    response = await client_auth.post(url, params={'path': 'docs'}, files={'file': ('a.txt', b'second')})
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+    response = await client_auth.post(
+        app.url_path_for('upload_create_handler'), params={'name': 'a.txt', 'path': 'docs'}
+    )
+    upload_id = response.json()['id']
+    await client_auth.put(app.url_path_for('upload_part_handler', upload_id=upload_id, number=1), content=b'third')
+    response = await client_auth.post(app.url_path_for('upload_complete_handler', upload_id=upload_id))
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+    hashes = (await async_session.execute(select(Blob.hash))).scalars().all()
+    assert len(hashes) == 1
+    blobs = os.path.join(os.path.dirname(storage.tmp_folder), 'blobs')
+    stored = [name for _, _, names in os.walk(blobs) for name in names]
+    assert stored == hashes
+
+
+async def test_collect_garbage_removes_unreferenced_blobs(async_session: AsyncSession, storage: BlobStore):
+    stale = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=2)
+    os.makedirs(os.path.dirname(storage.path('ab' * 32)))
+    open(storage.path('ab' * 32), 'wb').close()
+    async_session.add_all([
+        Blob(hash='ab' * 32, size=0, refcount=0, updated_at=stale),
+        Blob(hash='cd' * 32, size=0, refcount=1, updated_at=stale),
+    ])
+    await async_session.commit()
+
+    assert await blob_crud.collect_garbage(async_session, storage, grace=60) == 1
+    assert not os.path.exists(storage.path('ab' * 32))
+    assert (await async_session.execute(select(Blob.hash))).scalars().all() == ['cd' * 32]
@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import os
+
+import xxhash
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from main import app
+from models.models import Blob, Checkpoint, File
+from services.blobs import BlobStore
+from services.scrubber import Scrubber
+from services.storage import StorageError
+from services.throttle import Throttle
+from tests.conftest import upload
+
+CONTENT = b'a,b,c\n1,2,3\n' * 200
+
+
+async def test_checksums_are_listed_and_sent(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore
+):
+    sha256 = hashlib.sha256(CONTENT).hexdigest()
+    file = await upload(client_auth, 'docs', 'report.csv', CONTENT)
+    assert (file['blob_hash'], file['xxh3']) == (sha256, xxhash.xxh3_64(CONTENT).hexdigest())
+
+    response = await client_auth.post(app.url_path_for('files_list_handler'))
+    listed = response.json()['files'][0]
+    assert (listed['sha256'], listed['xxh3']) == (sha256, file['xxh3'])
+
+    # the stored blob is compressed: the digests describe the decoded content only
+    response = await client_auth.get(app.url_path_for('download_file_handler'), params={'id_': file['id']})
+    assert response.content == CONTENT
+    digest = base64.b64encode(bytes.fromhex(sha256)).decode()
+    assert response.headers['repr-digest'] == f'sha-256=:{digest}:'
+    assert response.headers['x-checksum-xxh3'] == file['xxh3']
+    response = await client_auth.get(
+        app.url_path_for('download_file_handler'), params={'id_': file['id']}, headers={'accept-encoding': 'zstd'}
+    )
+    assert response.headers['content-encoding'] == 'zstd'
+    assert 'repr-digest' not in response.headers
+
+
+async def test_upload_by_hash(async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore):
+    url = app.url_path_for('upload_by_hash_handler')
+    sha256 = hashlib.sha256(CONTENT).hexdigest()
+    body = {'path': 'copies', 'name': 'copy.csv', 'sha256': sha256, 'size': len(CONTENT)}
+    assert (await client_auth.post(url, json=body)).status_code == status.HTTP_404_NOT_FOUND
+
+    await upload(client_auth, 'docs', 'report.csv', CONTENT)
+    assert (await client_auth.post(url, json=body | {'size': 1})).status_code == status.HTTP_404_NOT_FOUND
+    response = await client_auth.post(url, json=body)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['path'] == 'copies/copy.csv'
+    assert (await async_session.execute(select(Blob.refcount))).scalar_one() == 2
+
+    response = await client_auth.get(app.url_path_for('download_file_handler'), params={'id_': response.json()['id']})
+    assert response.content == CONTENT
+    assert (await client_auth.post(url, json=body)).status_code == status.HTTP_409_CONFLICT
+    assert (await client_auth.post(url, json=body | {'name': '..'})).status_code == status.HTTP_400_BAD_REQUEST
+
+
+async def test_throttle_sleeps_to_keep_the_rate():
+    now, slept = [0.0], []
+
+    async def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    throttle = Throttle(100, clock=lambda: now[0], sleep=sleep)
+    await throttle.consume(50)
+    now[0] += 0.5
+    await throttle.consume(100)
+    assert slept == [0.5, 0.5]
+
+
+async def test_scrubber_finds_corruption_and_resumes(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore
+):
+    contents = [CONTENT, b'plain', b'other' * 300]
+    for index, content in enumerate(contents):
+        await upload(client_auth, f'dir{index}', 'report.csv', content)
+    # rows from before checksums were recorded
+    await async_session.execute(update(File).values(xxh3=None))
+    await async_session.execute(update(Blob).values(xxh3=None))
+    await async_session.commit()
+    damaged = hashlib.sha256(contents[2]).hexdigest()
+    with open(storage.path(damaged), 'r+b') as file:
+        file.write(b'\x00' * 8)
+
+    scrubber = Scrubber(storage, rate=0, batch=2)
+    assert (await scrubber.run(async_session, limit=1)).checked == 1
+    first = (await async_session.execute(select(Checkpoint.cursor))).scalar_one()
+    assert first == min(hashlib.sha256(content).hexdigest() for content in contents)
+
+    stats = await Scrubber(storage, rate=0, batch=2).run(async_session)
+    assert (stats.checked, stats.corrupt) == (2, 1)
+    assert (await async_session.execute(select(Checkpoint.cursor))).scalar_one() is None
+
+    async_session.expire_all()
+    blobs = {blob.hash: blob for blob in (await async_session.execute(select(Blob))).scalars()}
+    assert all(blob.verified_at is not None for blob in blobs.values())
+    assert [hash_ for hash_, blob in blobs.items() if blob.corrupt] == [damaged]
+    files = (await async_session.execute(select(File.blob_hash, File.xxh3))).all()
+    assert {hash_: xxh3 for hash_, xxh3 in files} == {
+        hashlib.sha256(content).hexdigest(): None if index == 2 else xxhash.xxh3_64(content).hexdigest()
+        for index, content in enumerate(contents)
+    }
+
+
+async def test_scrubber_retries_unreadable_blobs(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore, monkeypatch
+):
+    flaky, lost = hashlib.sha256(b'flaky').hexdigest(), hashlib.sha256(b'lost').hexdigest()
+    await upload(client_auth, 'flaky', 'report.csv', b'flaky')
+    await upload(client_auth, 'lost', 'report.csv', b'lost')
+    os.remove(storage.path(lost))
+    read = storage.backend.read
+
+    def failing(key: str, *args):
+        if key == storage.key(flaky):
+            raise StorageError('timed out')
+        return read(key, *args)
+
+    monkeypatch.setattr(storage.backend, 'read', failing)
+    stats = await Scrubber(storage, rate=0, batch=10).run(async_session)
+    assert (stats.checked, stats.corrupt, stats.unreadable) == (2, 1, 1)
+    # a read error says nothing about the content: the blob stays unverified and usable
+    blobs = {row.hash: row for row in (await async_session.execute(select(Blob.hash, Blob.corrupt, Blob.verified_at)))}
+    assert (blobs[flaky].corrupt, blobs[flaky].verified_at) == (False, None)
+    assert blobs[lost].corrupt
@@ -0,0 +1,95 @@
+import gzip
+import os
+
+import pytest
+import zstandard
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.responses import accepts_encoding
+from main import app
+from models.models import Blob, File
+from services.blobs import BlobStore
+from services.compression import CHUNK_SIZE, choose_encoding, decompress, decompress_range
+
+LOG = b''.join(f'2026-10-18 12:00:{n % 60:02d} INFO request {n} served in {n % 97} ms\n'.encode() for n in range(5000))
+
+
+@pytest.mark.parametrize('head, expected', [
+    (LOG[:65536], 'zstd'),
+    (os.urandom(65536), None),
+    (gzip.compress(LOG), None),
+    (b'\x89PNG\r\n\x1a\n' + LOG[:1000], None),
+    (b'short', None),
+])
+def test_choose_encoding(head, expected):
+    assert choose_encoding(head, len(head)) == expected
+
+
+async def chunked(data: bytes, size: int = 65536):
+    for offset in range(0, len(data), size):
+        yield data[offset:offset + size]
+
+
+@pytest.mark.parametrize('encoding, compress', [
+    ('zstd', lambda data: zstandard.ZstdCompressor().compress(data)),
+    ('gzip', gzip.compress),
+])
+async def test_decoding_output_is_bounded(encoding, compress):
+    # a few KB that decode to 32 MiB come out a chunk at a time, not all at once
+    encoded = compress(bytes(32 * 2 ** 20))
+    assert len(encoded) < 64 * 1024
+    sizes = [len(chunk) async for chunk in decompress(chunked(encoded), encoding)]
+    assert sum(sizes) == 32 * 2 ** 20
+    assert max(sizes) <= CHUNK_SIZE
+    start = 5 * 2 ** 20
+    part = [chunk async for chunk in decompress_range(chunked(encoded), encoding, start, start + 9)]
+    assert b''.join(part) == bytes(10)
+
+    encoded = compress(LOG)
+    assert b''.join([chunk async for chunk in decompress(chunked(encoded, 100), encoding)]) == LOG
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip, deflate, zstd', True),
+    ('zstd;q=0.5', True),
+    ('zstd;q=0', False),
+    ('gzip, *;q=0.1', True),
+    ('gzip', False),
+    ('', False),
+])
+def test_accepts_encoding(header, expected):
+    assert accepts_encoding(header, 'zstd') is expected
+
+
+async def test_compressed_upload_and_download(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore
+):
+    response = await client_auth.post(
+        app.url_path_for('upload_file_handler'), params={'path': 'logs'}, files={'file': ('app.log', LOG)}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    file = (await async_session.execute(select(File))).scalar_one()
+    blob = (await async_session.execute(select(Blob))).scalar_one()
+    assert (file.size, file.encoding) == (len(LOG), 'zstd')
+    assert file.stored_size == blob.stored_size == os.path.getsize(storage.path(blob.hash)) < len(LOG) // 5
+
+    url = app.url_path_for('download_file_handler')
+    response = await client_auth.get(url, params={'id_': str(file.id)}, headers={'accept-encoding': 'identity'})
+    assert response.headers['vary'] == 'accept-encoding'
+    assert 'content-encoding' not in response.headers
+    assert response.content == LOG
+
+    response = await client_auth.get(
+        url, params={'id_': str(file.id)}, headers={'accept-encoding': 'identity', 'range': 'bytes=100000-100099'}
+    )
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.content == LOG[100000:100100]
+
+    response = await client_auth.get(url, params={'id_': str(file.id)}, headers={'accept-encoding': 'zstd'})
+    assert response.headers['content-encoding'] == 'zstd'
+    assert response.headers['etag'] == f'"{blob.hash}-zstd"'
+    assert int(response.headers['content-length']) == file.stored_size
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(response.content) == LOG
@@ -0,0 +1,99 @@
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from main import app
+from models.models import Directory
+from services.blobs import BlobStore
+from services.directories import ancestors, directory_crud, normalize_path
+from tests.conftest import upload
+
+
+def test_paths():
+    assert normalize_path('/a//b/./c/') == 'a/b/c'
+    assert ancestors('a/b/c') == ['a', 'a/b', 'a/b/c']
+    assert ancestors('') == []
+
+
+async def test_directory_aggregates_and_listing(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore
+):
+    await upload(client_auth, 'docs', 'a.txt', b'12345')
+    await upload(client_auth, 'docs/2023', 'b.txt', b'123')
+    await upload(client_auth, 'docs/2024', 'c.txt', b'1')
+
+    response = await client_auth.get(app.url_path_for('directory_list_handler'), params={'path': 'docs'})
+    assert response.status_code == status.HTTP_200_OK
+    listing = response.json()
+    assert (listing['files'], listing['size']) == (3, 9)
+    assert [(item['path'], item['size']) for item in listing['directories']] == [('docs/2023', 3), ('docs/2024', 1)]
+    assert [entry['name'] for entry in listing['entries']] == ['a.txt']
+
+    response = await client_auth.get(app.url_path_for('directory_list_handler'))
+    assert [item['path'] for item in response.json()['directories']] == ['docs']
+
+
+async def test_directory_move_and_delete(async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore):
+    await upload(client_auth, 'docs/2023', 'a.txt', b'12345')
+    await upload(client_auth, 'docs/2023/q1', 'b.txt', b'123')
+    await upload(client_auth, 'docs', 'c.txt', b'1')
+
+    response = await client_auth.post(
+        app.url_path_for('directory_move_handler'), params={'path': 'docs/2023', 'destination': 'archive/2023'}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {'path': 'archive/2023', 'files': 2, 'size': 8}
+
+    directories = (await async_session.execute(
+        select(Directory.path, Directory.parent, Directory.files).order_by(Directory.path)
+    )).all()
+    assert directories == [
+        ('archive', '', 2), ('archive/2023', 'archive', 2), ('archive/2023/q1', 'archive/2023', 1), ('docs', '', 1)
+    ]
+    response = await client_auth.get(app.url_path_for('directory_list_handler'), params={'path': 'archive/2023/q1'})
+    assert [entry['path'] for entry in response.json()['entries']] == ['archive/2023/q1/b.txt']
+
+    response = await client_auth.delete(app.url_path_for('directory_delete_handler'), params={'path': 'archive'})
+    assert response.status_code == status.HTTP_200_OK
+    response = await client_auth.get(app.url_path_for('usage_memory'))
+    assert response.json() == {'files': 1, 'used': 1}
+    response = await client_auth.get(app.url_path_for('directory_list_handler'), params={'path': 'archive'})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_paths_longer_than_a_file_path_are_rejected(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore
+):
+    deep = '/'.join(['d' * 50] * 4)
+    await upload(client_auth, 'docs', 'x' * 60)
+    move = app.url_path_for('directory_move_handler')
+    # the destination fits, the file path under it doesn't
+    response = await client_auth.post(move, params={'path': 'docs', 'destination': deep})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response = await client_auth.post(move, params={'path': 'docs', 'destination': deep + '/' + 'd' * 60})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    response = await client_auth.post(
+        app.url_path_for('upload_file_handler'), params={'path': deep}, files={'file': ('y' * 60, b'content')}
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response = await client_auth.post(
+        app.url_path_for('upload_create_handler'), params={'name': 'y' * 60, 'path': deep}
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response = await client_auth.post(move, params={'path': 'docs', 'destination': 'd' * 150})
+    assert response.status_code == status.HTTP_200_OK
+
+
+async def test_directory_rebuild(async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore):
+    await upload(client_auth, 'docs/2023', 'a.txt', b'12345')
+    await upload(client_auth, 'docs', 'b.txt', b'123')
+    statement = select(Directory.path, Directory.parent, Directory.files, Directory.size).order_by(Directory.path)
+    incremental = (await async_session.execute(statement)).all()
+
+    await directory_crud.rebuild(async_session)
+
+    assert (await async_session.execute(statement)).all() == incremental == [
+        ('docs', '', 2, 8), ('docs/2023', 'docs', 1, 5)
+    ]
@@ -0,0 +1,67 @@
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.responses import parse_range
+from main import app
+from services.blobs import BlobStore
+from tests.conftest import upload
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', [(0, 99)]),
+    ('bytes=-100', [(924, 1023)]),
+    ('bytes=1000-', [(1000, 1023)]),
+    ('bytes=0-10,5-20,500-600', [(0, 20), (500, 600)]),
+    ('bytes=2000-3000', []),
+    ('bytes=10-5', None),
+    ('items=0-1', None),
+    ('bytes=a-b', None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1024) == expected
+
+
+async def test_download_range_and_conditional(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore
+):
+    file = await upload(client_auth, 'media', 'song.bin', CONTENT)
+    url = app.url_path_for('download_file_handler')
+
+    response = await client_auth.get(url, params={'id_': file['id']})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['etag'] == f'"{file["blob_hash"]}"'
+    assert response.headers['accept-ranges'] == 'bytes'
+    assert response.content == CONTENT
+
+    response = await client_auth.get(
+        url, params={'id_': file['id']}, headers={'if-none-match': response.headers['etag']}
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b''
+
+    response = await client_auth.get(url, params={'id_': file['id']}, headers={'range': 'bytes=100-199'})
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.headers['content-range'] == f'bytes 100-199/{len(CONTENT)}'
+    assert response.content == CONTENT[100:200]
+
+    response = await client_auth.get(url, params={'id_': file['id']}, headers={'range': 'bytes=5000-'})
+    assert response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+    assert response.headers['content-range'] == f'bytes */{len(CONTENT)}'
+
+
+async def test_download_multiple_ranges(async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore):
+    file = await upload(client_auth, 'media', 'song.bin', CONTENT)
+
+    response = await client_auth.get(
+        app.url_path_for('download_file_handler'), params={'id_': file['id']}, headers={'range': 'bytes=0-9,-10'}
+    )
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.headers['content-type'].startswith('multipart/byteranges; boundary=')
+    assert int(response.headers['content-length']) == len(response.content)
+    assert CONTENT[:10] in response.content
+    assert CONTENT[-10:] in response.content
+    assert f'content-range: bytes 1014-1023/{len(CONTENT)}'.encode() in response.content
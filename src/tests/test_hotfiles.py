@@ -0,0 +1,79 @@
+import os
+import uuid
+
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from main import app
+from models.models import File
+from services.blobs import BlobStore
+from services.cache import RedisClient, TTLCache
+from services.hotfiles import HotFiles, hot_files
+from tests.test_users import queries
+
+
+def test_cache_weight_budget():
+    cache = TTLCache(maxsize=10, ttl=60, weigh=len)
+    cache.set('a', b'1234')
+    cache.set('b', b'1234')
+    cache.set('huge', b'x' * 11)
+    assert cache.get('huge') is None
+    cache.get('a')
+    cache.set('c', b'1234')
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (b'1234', None, b'1234')
+    assert cache.stats() | {'hits': 0, 'misses': 0} == {
+        'entries': 2, 'weight': 8, 'hits': 0, 'misses': 0, 'evictions': 1
+    }
+
+
+async def test_hot_download_skips_database_and_storage(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore
+):
+    response = await client_auth.post(
+        app.url_path_for('upload_file_handler'), params={'path': 'hot'}, files={'file': ('a.bin', os.urandom(5000))}
+    )
+    file = response.json()
+    url = app.url_path_for('download_file_handler')
+    first = await client_auth.get(url, params={'id_': file['id']})
+    assert first.status_code == status.HTTP_200_OK
+
+    # the blob is served from memory from now on
+    os.remove(storage.path(first.headers['etag'].strip('"')))
+    with queries('FROM files') as statements:
+        second = await client_auth.get(url, params={'id_': file['id']}, headers={'range': 'bytes=10-19'})
+    assert statements == []
+    assert second.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert second.content == first.content[10:20]
+    assert hot_files.stats()['files']['hits'] >= 1
+
+    # deleting the directory drops the cached row
+    await client_auth.delete(app.url_path_for('directory_delete_handler'), params={'path': 'hot'})
+    response = await client_auth.get(url, params={'id_': file['id']})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_shared_tier_is_seen_by_other_workers(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore, redis_url: str
+):
+    response = await client_auth.post(
+        app.url_path_for('upload_file_handler'), params={'path': 'hot'}, files={'file': ('a.txt', b'shared')}
+    )
+    file_id = uuid.UUID(response.json()['id'])
+    key = storage.key((await async_session.get(File, file_id)).blob_hash)
+    workers = [
+        HotFiles(files=10, ttl=60, budget=1024, max_blob=1024, content_ttl=60, shared=RedisClient(redis_url))
+        for _ in range(2)
+    ]
+
+    file = await workers[0].file(async_session, file_id)
+    assert await workers[0].load(key, storage.backend) == b'shared'
+    with queries('FROM files') as statements:
+        assert (await workers[1].file(async_session, file_id)).path == file.path
+        assert await workers[1].content(key) == b'shared'
+    assert statements == []
+
+    await workers[0].invalidate([file.id])
+    assert await workers[0].shared.get(f'file:{file_id}') is None
+    for worker in workers:
+        await worker.close()
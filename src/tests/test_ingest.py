@@ -0,0 +1,68 @@
+import hashlib
+
+import pytest
+import xxhash
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from main import app
+from services import ingest
+from services.blobs import BlobStore
+
+CONTENT = bytes(range(256)) * 400
+
+
+async def chunks(payload: bytes, size: int = 1000):
+    for start in range(0, len(payload), size):
+        yield payload[start:start + size]
+
+
+@pytest.mark.parametrize('kind', ['thread', 'process'])
+async def test_ingest_writes_and_hashes(tmp_path, monkeypatch, kind):
+    monkeypatch.setattr(ingest, 'executor', ingest.make_executor(kind, 1))
+    path = str(tmp_path / 'blob')
+
+    checksums, size = await ingest.ingest(chunks(CONTENT), path, len(CONTENT), queue_size=2, block_size=4096)
+
+    assert (checksums.sha256, size) == (hashlib.sha256(CONTENT).hexdigest(), len(CONTENT))
+    assert checksums.xxh3 == xxhash.xxh3_64(CONTENT).hexdigest()
+    with open(path, 'rb') as file:
+        assert file.read() == CONTENT
+    ingest.executor.shutdown()
+
+
+async def test_ingest_rejects_oversized_body(tmp_path):
+    with pytest.raises(ingest.BlobTooLarge):
+        await ingest.ingest(chunks(CONTENT), str(tmp_path / 'blob'), 5000, queue_size=1, block_size=1000)
+
+
+async def test_upload_streams_multipart_body(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore, monkeypatch
+):
+    url = app.url_path_for('upload_file_handler')
+    response = await client_auth.post(
+        url, params={'path': 'data'}, data={'comment': 'first field'}, files={'file': ('table.bin', CONTENT)}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['path'] == 'data/table.bin'
+    assert response.json()['size'] == len(CONTENT)
+
+    response = await client_auth.post(url, params={'path': 'data'}, data={'comment': 'no file'})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    # a filename that isn't UTF-8 is the client's error
+    body = b'--b\r\nContent-Disposition: form-data; name="file"; filename="caf\xe9.txt"\r\n\r\ndata\r\n--b--\r\n'
+    response = await client_auth.post(
+        url, params={'path': 'data'}, content=body, headers={'content-type': 'multipart/form-data; boundary=b'}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    # over the limit by more than the multipart overhead: rejected from content-length alone
+    monkeypatch.setattr(settings, 'MAX_FILE_SIZE', 1000)
+    response = await client_auth.post(url, params={'path': 'data'}, files={'file': ('big.bin', CONTENT)})
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    response = await client_auth.post(url, params={'path': 'data'}, files={'file': ('big.bin', CONTENT[:2000])})
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
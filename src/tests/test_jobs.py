@@ -0,0 +1,122 @@
+import asyncio
+import datetime
+
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from main import app
+from models.models import Blob, Job
+from services import jobs
+from services.blobs import BlobStore
+from services.jobs import JobWorker, job_crud
+
+
+async def test_upload_jobs_run_after_the_response(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore, monkeypatch
+):
+    monkeypatch.setattr(settings, 'UPLOAD_JOBS', ['verify_blob'])
+    for path in ('first', 'second'):
+        response = await client_auth.post(
+            app.url_path_for('upload_file_handler'), params={'path': path}, files={'file': ('a.txt', b'content')}
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+    # one job per new blob, queued with the upload and not run by it
+    response = await client_auth.get(app.url_path_for('jobs_list_handler'))
+    assert [(job['kind'], job['status']) for job in response.json()] == [('verify_blob', 'queued')]
+    assert (await async_session.execute(select(Blob.verified_at))).scalar_one() is None
+
+    assert await JobWorker(poll_interval=0.1, lease=60).drain() == 1
+    response = await client_auth.get(app.url_path_for('job_status_handler'), params={'id_': response.json()[0]['id']})
+    assert (response.json()['status'], response.json()['attempts']) == ('done', 1)
+    async_session.expire_all()
+    assert (await async_session.execute(select(Blob.verified_at))).scalar_one() is not None
+
+
+async def test_failed_jobs_are_retried_with_backoff(async_session: AsyncSession, monkeypatch):
+    calls = []
+
+    async def flaky(db, payload):
+        calls.append(payload)
+        raise RuntimeError('unavailable')
+
+    monkeypatch.setitem(jobs.job_types, 'flaky', jobs.JobType('flaky', flaky, concurrency=1, max_attempts=2))
+    id_ = await job_crud.enqueue(async_session, 'flaky', {'n': 1})
+    await async_session.commit()
+    worker = JobWorker(poll_interval=0.1, lease=60)
+
+    assert await worker.drain(['flaky']) == 1
+    job = await async_session.get(Job, id_)
+    assert (job.status, job.attempts, job.last_error) == ('queued', 1, "RuntimeError('unavailable')")
+    assert job.run_at > datetime.datetime.now(datetime.timezone.utc)
+    # not due until the backoff has passed
+    assert await worker.drain(['flaky']) == 0
+
+    await async_session.execute(update(Job).values(run_at=datetime.datetime.now(datetime.timezone.utc)))
+    await async_session.commit()
+    assert await worker.drain(['flaky']) == 1
+    await async_session.refresh(job)
+    assert (job.status, job.attempts, len(calls)) == ('failed', 2, 2)
+
+
+async def test_workers_share_jobs_and_respect_concurrency(async_session: AsyncSession, monkeypatch):
+    active, peak, seen = [0], [0], []
+
+    async def slow(db, payload):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.01)
+        seen.append(payload['n'])
+        active[0] -= 1
+
+    monkeypatch.setattr(jobs, 'job_types', {'slow': jobs.JobType('slow', slow, concurrency=2, max_attempts=1)})
+    await job_crud.enqueue_many(async_session, 'slow', [{'n': n} for n in range(10)])
+    await async_session.commit()
+
+    workers = [JobWorker(poll_interval=0.01, lease=60) for _ in range(2)]
+    runners = [asyncio.create_task(worker.run()) for worker in workers]
+    for _ in range(200):
+        if len(seen) == 10:
+            break
+        await asyncio.sleep(0.01)
+    for worker in workers:
+        await worker.close(1)
+    await asyncio.gather(*runners)
+
+    assert sorted(seen) == list(range(10))
+    assert peak[0] <= 4
+    statuses = (await async_session.execute(select(Job.status))).scalars().all()
+    assert statuses == ['done'] * 10
+
+
+async def test_expired_leases_are_fenced_and_bounded(async_session: AsyncSession, monkeypatch):
+    async def noop(db, payload):
+        pass
+
+    monkeypatch.setitem(jobs.job_types, 'noop', jobs.JobType('noop', noop, concurrency=1, max_attempts=2))
+    id_ = await job_crud.enqueue(async_session, 'noop', {})
+    await async_session.commit()
+    past = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+
+    # claimed in sessions of their own, as workers do
+    worker = JobWorker(poll_interval=0.1, lease=60)
+    [stale] = await worker.claim(jobs.job_types['noop'], 1)
+    await async_session.execute(update(Job).values(locked_at=past))
+    await async_session.commit()
+    [current] = await worker.claim(jobs.job_types['noop'], 1)
+    assert current.attempts == 2
+    # the first worker's lease is gone: its result doesn't overwrite the new claim
+    assert not await job_crud.complete(async_session, job=stale)
+    assert (await async_session.execute(select(Job.status).where(Job.id == id_))).scalar_one() == 'running'
+
+    # the last attempt's lease expires too, as when the job kills its worker: it fails instead of running again
+    await async_session.execute(update(Job).values(locked_at=past))
+    await async_session.commit()
+    assert await worker.claim(jobs.job_types['noop'], 1) == []
+    async_session.expire_all()
+    job = await async_session.get(Job, id_)
+    assert (job.status, job.attempts) == ('failed', 2)
+    assert not await job_crud.complete(async_session, job=current)
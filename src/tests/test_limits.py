@@ -0,0 +1,181 @@
+import functools
+import hashlib
+import os
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from main import app
+from services.blobs import BlobStore
+from services.cache import RedisClient
+from services.limits import LocalLimiter, RateLimited, SharedLimiter, TransferLimits, transfer_limits
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.now += seconds
+        self.slept += seconds
+
+
+async def test_requests_over_the_rate_are_rejected():
+    clock = Clock()
+    limits = TransferLimits(LocalLimiter(clock), requests=2, burst=3)
+    for _ in range(3):
+        await limits.check_request('user')
+    with pytest.raises(RateLimited) as err:
+        await limits.check_request('user')
+    assert err.value.retry_after == pytest.approx(0.5)
+    # a rejected request takes nothing, and other users have their own bucket
+    await limits.check_request('other')
+    clock.now += 0.5
+    await limits.check_request('user')
+
+
+async def test_streams_are_paced_not_rejected():
+    clock = Clock()
+    limits = TransferLimits(LocalLimiter(clock), bytes_rate=1000, quantum=100, sleep=clock.sleep)
+    stream = await limits.open('user')
+    for _ in range(30):
+        await stream.consume(100)
+    # a second of burst, then the user's own rate
+    assert clock.slept == pytest.approx(2.0)
+
+    # the other user's own rate is untouched
+    clock.slept = 0
+    other = await limits.open('other')
+    for _ in range(10):
+        await other.consume(100)
+    assert clock.slept == 0
+    limits = TransferLimits(LocalLimiter(clock), global_bytes_rate=4000, quantum=100, sleep=clock.sleep)
+    streams = [await limits.open(user) for user in ('a', 'b', 'c')]
+    for _ in range(20):
+        for stream in streams:
+            await stream.consume(100)
+    # but a global ceiling is shared by everyone
+    assert clock.slept == pytest.approx((6000 - 4000) / 4000)
+
+
+async def test_stream_slots():
+    limits = TransferLimits(LocalLimiter(), streams=1, global_streams=2)
+    first = await limits.open('user')
+    with pytest.raises(RateLimited):
+        await limits.open('user')
+    second = await limits.open('other')
+    # the global slots are taken, and the user slot taken on the way is given back
+    with pytest.raises(RateLimited):
+        await limits.open('third')
+    assert limits.limiter.streams == {'user': 1, 'other': 1, '*': 2}
+    for stream in (first, second):
+        await stream.close()
+    await first.close()
+    assert limits.limiter.streams == {}
+
+
+async def test_shared_limits_hold_across_workers(redis_url: str):
+    clock = Clock()
+    workers = [SharedLimiter(RedisClient(redis_url), clock=clock) for _ in range(2)]
+    assert await workers[0].acquire('user', 1)
+    assert not await workers[1].acquire('user', 1)
+    await workers[0].release('user')
+    assert await workers[1].acquire('user', 1)
+
+    for worker in workers:
+        assert await worker.take('requests:user', 1, rate=1, burst=2, wait=False) == 0
+    assert await workers[0].take('requests:user', 1, rate=1, burst=2, wait=False) > 0
+    # the rejected request was not counted: half a window on, the other worker may send one more
+    clock.now += 3
+    assert await workers[1].take('requests:user', 1, rate=1, burst=2, wait=False) == 0
+    for worker in workers:
+        await worker.close()
+
+
+async def test_shared_limits_fail_open():
+    limiter = SharedLimiter(RedisClient('redis://127.0.0.1:1/0', timeout=0.2))
+    assert await limiter.acquire('user', 1)
+    assert await limiter.take('requests:user', 100, rate=1, burst=1, wait=False) == 0
+
+
+async def test_transfer_limits_on_routes(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore, monkeypatch
+):
+    clock = Clock()
+    content = os.urandom(5000)
+    for key, value in vars(
+        TransferLimits(LocalLimiter(clock), requests=1, burst=2, streams=1, bytes_rate=1000, quantum=1000,
+                       sleep=clock.sleep)
+    ).items():
+        monkeypatch.setattr(transfer_limits, key, value)
+    response = await client_auth.post(
+        app.url_path_for('upload_file_handler'), params={'path': 'limits'}, files={'file': ('a.bin', content)}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    upload_paced = clock.slept
+    assert upload_paced > 3
+
+    response = await client_auth.get(app.url_path_for('download_file_handler'), params={'id_': response.json()['id']})
+    assert response.content == content
+    assert clock.slept - upload_paced == pytest.approx(5.0)
+    # both streams gave their slot back
+    assert transfer_limits.limiter.streams == {}
+
+    monkeypatch.setattr(transfer_limits, 'bytes_rate', 0)
+    codes = []
+    for _ in range(3):
+        response = await client_auth.get(app.url_path_for('download_by_path_handler'), params={'path': 'limits/a.bin'})
+        codes.append(response.status_code)
+    assert codes == [status.HTTP_200_OK, status.HTTP_200_OK, status.HTTP_429_TOO_MANY_REQUESTS]
+    assert response.headers['retry-after'] == '1'
+
+
+async def test_transfer_limits_cover_batches_archives_and_parts(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore, monkeypatch
+):
+    clock = Clock()
+    content = os.urandom(3000)
+    for key, value in vars(
+        TransferLimits(LocalLimiter(clock), streams=1, bytes_rate=1000, quantum=1000, sleep=clock.sleep)
+    ).items():
+        monkeypatch.setattr(transfer_limits, key, value)
+
+    files = [('files', ('a.bin', content)), ('files', ('b.bin', content))]
+    response = await client_auth.post(app.url_path_for('upload_batch_handler'), params={'path': 'batch'}, files=files)
+    assert response.status_code == status.HTTP_200_OK
+    assert clock.slept > 5
+    paced = clock.slept
+
+    archive = {'directory': 'batch', 'format': 'tar'}
+    response = await client_auth.post(app.url_path_for('archive_handler'), json=archive)
+    assert len(response.content) > 6000
+    assert clock.slept - paced > 5
+    paced = clock.slept
+
+    response = await client_auth.post(app.url_path_for('upload_create_handler'), params={'name': 'c', 'path': 'batch'})
+    url = app.url_path_for('upload_part_handler', upload_id=response.json()['id'], number=1)
+    assert (await client_auth.put(url, content=content)).status_code == status.HTTP_200_OK
+    assert clock.slept - paced > 2
+    assert transfer_limits.limiter.streams == {}
+
+    # starting, completing and by-hash uploads count as requests too
+    monkeypatch.setattr(transfer_limits, 'requests', 1)
+    monkeypatch.setattr(transfer_limits, 'burst', 1)
+    create = functools.partial(
+        client_auth.post, app.url_path_for('upload_create_handler'), params={'name': 'd', 'path': 'batch'}
+    )
+    upload_id = (await create()).json()['id']
+    by_hash = {'sha256': hashlib.sha256(content).hexdigest(), 'size': len(content), 'name': 'e', 'path': 'batch'}
+    responses = [
+        await create(),
+        await client_auth.post(app.url_path_for('upload_complete_handler', upload_id=upload_id)),
+        await client_auth.post(app.url_path_for('upload_by_hash_handler'), json=by_hash),
+    ]
+    assert [response.status_code for response in responses] == [status.HTTP_429_TOO_MANY_REQUESTS] * 3
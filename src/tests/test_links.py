@@ -0,0 +1,100 @@
+import uuid
+from collections import Counter
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from main import app
+from services.blobs import BlobStore
+from services.limits import transfer_limits
+from services.tiers import access_log
+from services.links import ExpiredLink, InvalidLink, LinkSigner
+from tests.conftest import upload
+from tests.test_users import queries
+
+
+def test_link_signer_rejects_tampering_and_expiry():
+    now = [1000.0]
+    signer = LinkSigner('secret', clock=lambda: now[0])
+    file_id, user_id = uuid.uuid4(), uuid.uuid4()
+    token, expires = signer.sign(file_id, user_id, 60)
+    link = signer.verify(token)
+    assert (link.file_id, link.user_id, link.expires) == (file_id, user_id, 1060)
+
+    for forged in (token[:-2] + ('AA' if token[-2:] != 'AA' else 'BB'), token[:10], '!!', ''):
+        with pytest.raises(InvalidLink):
+            signer.verify(forged)
+    with pytest.raises(InvalidLink):
+        LinkSigner('other', clock=lambda: now[0]).verify(token)
+    now[0] = 1060
+    with pytest.raises(ExpiredLink):
+        signer.verify(token)
+
+
+async def test_shared_download(async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore):
+    file = await upload(client_auth, 'docs', content=b'shared content')
+    response = await client_auth.post(app.url_path_for('link_create_handler'), params={'id_': file['id']})
+    assert response.status_code == status.HTTP_200_OK
+    url = response.json()['url']
+
+    async with AsyncClient(app=app, base_url='http://test') as anonymous:
+        response = await anonymous.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.content == b'shared content'
+        # once the row is hot, a link is served without a single query
+        with queries() as statements:
+            response = await anonymous.get(url, headers={'range': 'bytes=0-5'})
+            assert (response.status_code, response.content) == (status.HTTP_206_PARTIAL_CONTENT, b'shared')
+            assert statements == []
+
+        assert (await anonymous.get(url[:-3] + 'abc')).status_code == status.HTTP_403_FORBIDDEN
+        response = await client_auth.delete(app.url_path_for('delete_file_handler'), params={'id_': file['id']})
+        assert response.status_code == status.HTTP_200_OK
+        assert (await anonymous.get(url)).status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_shared_download_offloads_to_nginx(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore, monkeypatch
+):
+    monkeypatch.setattr(settings, 'ACCEL_REDIRECT', '/protected/')
+    monkeypatch.setattr(access_log, 'counts', Counter())
+    monkeypatch.setattr(access_log, 'last', {})
+    file = await upload(client_auth, 'docs', content=b'shared content')
+    response = await client_auth.post(app.url_path_for('link_create_handler'), params={'id_': file['id']})
+    url = response.json()['url']
+
+    response = await client_auth.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == b''
+    assert response.headers['x-accel-redirect'] == f'/protected/{storage.key(file["blob_hash"])}'
+    assert response.headers['content-disposition'] == 'attachment; filename="a.txt"'
+    assert response.headers['etag'] == f'"{file["blob_hash"]}"'
+    # offloaded downloads keep the blob hot like any other
+    assert access_log.counts[file['blob_hash']] == 1
+
+    # limited transfers stay in the app, where the limits apply
+    monkeypatch.setattr(transfer_limits, 'streams', 1)
+    response = await client_auth.get(url)
+    assert 'x-accel-redirect' not in response.headers
+    assert response.content == b'shared content'
+
+
+async def test_files_of_other_users_are_not_served(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore
+):
+    file = await upload(client_auth, 'docs', content=b'shared content')
+    async with AsyncClient(app=app, base_url='http://test') as other:
+        credentials = {'email': 'other@post.com', 'password': '12345'}
+        assert (await other.post('/v1/auth/register', json=credentials)).status_code == status.HTTP_201_CREATED
+        response = await other.post(
+            '/v1/auth/jwt/login', data={'username': credentials['email'], 'password': credentials['password']}
+        )
+        other.headers['Authorization'] = f'Bearer {response.json()["access_token"]}'
+
+        response = await other.get(app.url_path_for('download_file_handler'), params={'id_': file['id']})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = await other.post(app.url_path_for('link_create_handler'), params={'id_': file['id']})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,92 @@
+import datetime
+import json
+import uuid
+
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from main import app
+from models.models import File
+from schemas.files import FileCreate
+from services.files import file_crud
+from tests.test_users import queries
+
+
+async def create_files(session: AsyncSession, user_id: str) -> None:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    session.add_all([
+        File(
+            user_id=user_id, name=f'{index}.txt', path=f'{"docs" if index % 2 else "media"}/{index}.txt',
+            size=index, created_at=now - datetime.timedelta(minutes=index)
+        )
+        for index in range(5)
+    ])
+    await session.commit()
+
+
+async def test_files_list_pagination(async_session: AsyncSession, client_auth: AsyncClient):
+    await create_files(async_session, client_auth.headers['user_id'])
+
+    names, cursor = [], None
+    while True:
+        params = {'limit': 2} | ({'cursor': cursor} if cursor else {})
+        response = await client_auth.post(app.url_path_for('files_list_handler'), params=params)
+        assert response.status_code == status.HTTP_200_OK
+        names += [file['name'] for file in response.json()['files']]
+        if not (cursor := response.json()['next_cursor']):
+            break
+    assert names == ['0.txt', '1.txt', '2.txt', '3.txt', '4.txt']
+
+    response = await client_auth.post(app.url_path_for('files_list_handler'), params={'cursor': 'garbage'})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+async def test_files_list_filters(async_session: AsyncSession, client_auth: AsyncClient):
+    await create_files(async_session, client_auth.headers['user_id'])
+
+    response = await client_auth.post(app.url_path_for('files_list_handler'), params={'path': 'docs/'})
+    assert [file['name'] for file in response.json()['files']] == ['1.txt', '3.txt']
+
+    response = await client_auth.post(app.url_path_for('files_list_handler'), params={'name': '4.txt'})
+    assert [file['path'] for file in response.json()['files']] == ['media/4.txt']
+
+
+async def test_files_stream(async_session: AsyncSession, client_auth: AsyncClient):
+    await create_files(async_session, client_auth.headers['user_id'])
+
+    response = await client_auth.post(app.url_path_for('files_stream_handler'), params={'path': 'media/'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line['name'] for line in lines] == ['0.txt', '2.txt', '4.txt']
+
+
+async def test_cached_statements_take_new_values(async_session: AsyncSession, client_auth: AsyncClient):
+    user_id = client_auth.headers['user_id']
+    await create_files(async_session, user_id)
+    async_session.add(File(user_id=user_id, name='x.txt', path='do_s/x.txt', size=1))
+    await async_session.commit()
+
+    # the same call sites, compiled once, with other closure values each time
+    for path, names in (('docs/', ['1.txt', '3.txt']), ('media/', ['0.txt', '2.txt', '4.txt']), ('do_s/', ['x.txt'])):
+        rows = await file_crud.get_page(async_session, limit=10, user_id=user_id, path=path)
+        assert sorted(row.name for row in rows) == names
+    # LIKE wildcards in the prefix match literally
+    assert await file_crud.get_page(async_session, limit=10, user_id=user_id, path='do%') == []
+
+    row = await file_crud.get_by_path(async_session, user_id=user_id, path='media/4.txt')
+    assert (row.name, row.size) == ('4.txt', 4)
+    assert (await file_crud.get(async_session, row.id)).path == 'media/4.txt'
+
+
+async def test_create_returns_the_inserted_row(async_session: AsyncSession, client_auth: AsyncClient):
+    obj_in = FileCreate(
+        id=uuid.uuid4(), name='a.txt', path='a.txt', size=3, is_downloadable=True,
+        user_id=client_auth.headers['user_id'], blob_hash=None, stored_size=None, encoding=None, xxh3=None
+    )
+    with queries() as statements:
+        file = await file_crud.create(async_session, obj_in=obj_in)
+    assert [statement.split()[0] for statement in statements] == ['INSERT']
+    assert (file.id, file.directory, file.stored_size) == (obj_in.id, '', 3)
+    assert file.created_at is not None
@@ -1,7 +1,10 @@
+import sys
+
 from fastapi import status
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from core.config import settings
 from main import app
 from models.models import File
 
@@ -34,3 +37,22 @@ async def test_files_list_handler(async_session: AsyncSession, client_auth: Asyn
 
     assert response.status_code == status.HTTP_200_OK
     assert response.json()['files'][0]['name'] == 'test'
+
+
+async def test_fast_json_matches_the_models(async_session: AsyncSession, client_auth: AsyncClient, monkeypatch):
+    for index in range(3):
+        async_session.add(File(user_id=client_auth.headers['user_id'], name=f'{index}', path=f'{index}', size=index))
+    await async_session.commit()
+
+    responses = {}
+    for fast in (False, True):
+        monkeypatch.setattr(settings, 'FAST_JSON', fast)
+        responses[fast] = [
+            (await client_auth.post(app.url_path_for('files_list_handler'), params={'limit': 2})).json(),
+            (await client_auth.get(app.url_path_for('usage_memory'))).json(),
+        ]
+        ping = (await client_auth.get(app.url_path_for('ping'))).json()
+        assert isinstance(ping['db'], float)
+        assert ping['python'][:2] == list(sys.version_info[:2])
+    assert responses[True] == responses[False]
+    assert responses[True][0]['next_cursor'] is not None
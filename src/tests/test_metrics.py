@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+from fastapi import status
+from httpx import AsyncClient
+from prometheus_client import REGISTRY
+
+from core.config import settings
+from core.metrics import instrument_engine, monitor_loop
+from main import app
+from services.blobs import BlobStore
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+async def test_requests_and_queries_are_measured(initial_db, client: AsyncClient):
+    instrument_engine(initial_db[0])
+    selects = sample('db_query_duration_seconds_count', statement='SELECT')
+    pings = sample('http_request_duration_seconds_count', method='GET', route='/v1/ping', status='200')
+
+    assert (await client.get(app.url_path_for('ping'))).status_code == status.HTTP_200_OK
+
+    assert sample('http_request_duration_seconds_count', method='GET', route='/v1/ping', status='200') == pings + 1
+    assert sample('db_query_duration_seconds_count', statement='SELECT') > selects
+    response = await client.get('/metrics')
+    assert response.status_code == status.HTTP_200_OK
+    assert 'http_requests_in_flight' in response.text
+
+
+async def test_upload_bytes_are_counted(client_auth: AsyncClient, storage: BlobStore):
+    route = '/v1/files/upload'
+    before = sample('http_request_bytes_total', route=route)
+    response = await client_auth.post(
+        app.url_path_for('upload_file_handler'), params={'path': '/metrics'}, files={'file': ('a.txt', b'x' * 1000)}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert sample('http_request_bytes_total', route=route) - before > 1000
+
+
+async def test_loop_lag_is_measured():
+    before = sample('event_loop_lag_seconds_sum')
+    task = asyncio.create_task(monitor_loop(0.01))
+    await asyncio.sleep(0)
+    time.sleep(0.05)
+    await asyncio.sleep(0.02)
+    task.cancel()
+    assert sample('event_loop_lag_seconds_sum') - before >= 0.04
+
+
+async def test_slow_requests_are_profiled(client: AsyncClient, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, 'PROFILER', 'cprofile')
+    monkeypatch.setattr(settings, 'PROFILE_SAMPLE_RATE', 1)
+    monkeypatch.setattr(settings, 'PROFILE_SLOW_REQUEST', 0)
+    monkeypatch.setattr(settings, 'PROFILE_DIR', str(tmp_path))
+
+    await client.get(app.url_path_for('ping'))
+    assert [path.suffix for path in tmp_path.iterdir()] == ['.prof']
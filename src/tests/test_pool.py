@@ -0,0 +1,39 @@
+import asyncio
+
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from core.config import settings
+from db.db import engine_options
+from main import app
+
+
+async def test_pool_counts_waiters(monkeypatch):
+    monkeypatch.setattr(settings, 'DB_POOL_SIZE', 1)
+    monkeypatch.setattr(settings, 'DB_MAX_OVERFLOW', 0)
+    monkeypatch.setattr(settings, 'DB_PGBOUNCER', True)
+    engine = create_async_engine(settings.DATABASE_URL, **engine_options())
+
+    async def query():
+        async with engine.connect() as connection:
+            await connection.execute(text('SELECT pg_sleep(0.05)'))
+            # without statement caching the same statement can be prepared again and again
+            assert (await connection.execute(text('SELECT 1'))).scalar() == 1
+            assert (await connection.execute(text('SELECT 1'))).scalar() == 1
+
+    await asyncio.gather(query(), query())
+    status_ = engine.sync_engine.pool.status_dict()
+    await engine.dispose()
+
+    assert status_['checkouts'] == 2
+    assert status_['waits'] == 1
+    assert status_['waiting'] == 0
+    assert status_['max_wait'] > 0.02
+
+
+async def test_ping_reports_pool(client: AsyncClient):
+    response = await client.get(app.url_path_for('ping'))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['pool'].keys() >= {'size', 'checked_out', 'waiting', 'wait_time'}
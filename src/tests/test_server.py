@@ -0,0 +1,34 @@
+from uvicorn import Config
+
+import db.db
+from core.config import settings
+from core.server import Worker, cpu_count, options
+from db.db import dispose_engine, init_engine
+
+
+def test_options_scale_with_cores(monkeypatch):
+    monkeypatch.setattr(settings, 'WEB_WORKERS', None)
+    monkeypatch.setattr(settings, 'SHUTDOWN_TIMEOUT', 20)
+    assert options()['workers'] == cpu_count()
+    assert options(workers=3)['workers'] == 3
+    assert options()['graceful_timeout'] > 20
+    assert options()['preload_app'] is False
+
+    monkeypatch.setattr(settings, 'WEB_WORKERS', 2)
+    assert options()['workers'] == 2
+
+
+def test_worker_uses_uvloop_and_httptools():
+    config = Config(app='main:app', **Worker.CONFIG_KWARGS)
+    config.load()
+    assert config.http_protocol_class.__name__ == 'HttpToolsProtocol'
+    assert config.timeout_graceful_shutdown == settings.SHUTDOWN_TIMEOUT
+
+
+async def test_engine_is_created_lazily():
+    await dispose_engine()
+    assert db.db.engine is None
+    engine = init_engine()
+    assert init_engine() is engine
+    await dispose_engine()
+    assert db.db.engine is None
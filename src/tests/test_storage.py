@@ -0,0 +1,77 @@
+import os
+import socket
+
+import pytest
+import pytest_asyncio
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from main import app
+from services.blobs import BlobStore
+from services.storage import LocalStorage, S3Storage
+
+moto_server = pytest.importorskip('moto.server')
+
+
+async def chunks(content: bytes, size: int = 2 ** 20):
+    for start in range(0, len(content), size):
+        yield content[start:start + size]
+
+
+@pytest.fixture(scope='session')
+def s3_endpoint():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = moto_server.ThreadedMotoServer(ip_address='127.0.0.1', port=port)
+    server.start()
+    yield f'http://127.0.0.1:{port}'
+    server.stop()
+
+
+@pytest_asyncio.fixture()
+async def s3(s3_endpoint) -> S3Storage:
+    backend = S3Storage(
+        endpoint_url=s3_endpoint, bucket='files', access_key='test', secret_key='test',
+        part_size=5 * 1024 * 1024, concurrency=2
+    )
+    await backend.create_bucket()
+    yield backend
+    await backend.close()
+
+
+async def test_local_storage(tmp_path):
+    backend = LocalStorage(str(tmp_path))
+    assert await backend.write('a/b/c.bin', chunks(b'0123456789')) == 10
+    assert (await backend.stat('a/b/c.bin')).size == 10
+    assert b''.join([chunk async for chunk in backend.read('a/b/c.bin', 2, 4)]) == b'234'
+    await backend.delete('a/b/c.bin')
+    assert await backend.stat('a/b/c.bin') is None
+
+
+async def test_s3_storage_multipart(s3: S3Storage):
+    content = os.urandom(11 * 1024 * 1024)
+    assert await s3.write('blobs/large', chunks(content)) == len(content)
+    assert (await s3.stat('blobs/large')).size == len(content)
+    assert b''.join([chunk async for chunk in s3.read('blobs/large')]) == content
+    assert b''.join([chunk async for chunk in s3.read('blobs/large', 100, 199)]) == content[100:200]
+
+    await s3.delete('blobs/large')
+    assert await s3.stat('blobs/large') is None
+
+
+async def test_upload_and_download_through_s3(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore, s3: S3Storage, monkeypatch
+):
+    monkeypatch.setattr(storage, 'backend', s3)
+    response = await client_auth.post(
+        app.url_path_for('upload_file_handler'), params={'path': 'docs'}, files={'file': ('a.txt', b'remote bytes')}
+    )
+    assert await s3.exists(storage.key(response.json()['blob_hash']))
+
+    response = await client_auth.get(
+        app.url_path_for('download_file_handler'), params={'id_': response.json()['id']}, headers={'range': 'bytes=7-'}
+    )
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.content == b'bytes'
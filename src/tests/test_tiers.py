@@ -0,0 +1,105 @@
+import datetime
+import os
+from collections import Counter
+
+import pytest_asyncio
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from main import app
+from models.models import Blob, File, Job, Pack
+from services.blobs import BlobStore, blob_crud
+from services.jobs import JobWorker
+from services.storage import LocalStorage
+from services.tiers import TieredStorage, access_log, cold_tier, pack_key
+from tests.conftest import upload
+
+
+@pytest_asyncio.fixture()
+async def tiers(storage: BlobStore, tmp_path, monkeypatch) -> BlobStore:
+    monkeypatch.setattr(storage, 'backend', TieredStorage(storage.backend, LocalStorage(str(tmp_path / 'cold'))))
+    monkeypatch.setattr(access_log, 'counts', Counter())
+    monkeypatch.setattr(access_log, 'last', {})
+    yield storage
+
+
+async def demote(db: AsyncSession, store: BlobStore) -> int:
+    stale = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=2)
+    await db.execute(update(Blob).values(created_at=stale))
+    await db.commit()
+    return await cold_tier.demote(db, store, cold_after=60 * 60, pack_size=1024 * 1024, limit=100)
+
+
+async def test_cold_blobs_are_packed_and_promoted_on_access(
+        async_session: AsyncSession, client_auth: AsyncClient, tiers: BlobStore
+):
+    first = (await upload(client_auth, 'first', content=b'first content'))['id']
+    second = (await upload(client_auth, 'second', content=b'second content'))['id']
+    hashes = (await async_session.execute(select(Blob.hash))).scalars().all()
+
+    assert await demote(async_session, tiers) == 2
+    pack = (await async_session.execute(select(Pack))).scalar_one()
+    assert (pack.blobs, pack.size) == (2, len(b'first content') + len(b'second content'))
+    for hash_ in hashes:
+        assert tiers.path(hash_) is None
+        assert await tiers.backend.hot.stat(tiers.key(hash_)) is None
+
+    # served from the pack, ranges included
+    download = app.url_path_for('download_file_handler')
+    for _ in range(2):
+        response = await client_auth.get(download, params={'id_': first})
+        assert response.content == b'first content'
+    response = await client_auth.get(download, params={'id_': second}, headers={'Range': 'bytes=7-9'})
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.content == b'con'
+
+    # three downloads of two blobs, written in one flush
+    assert await access_log.flush(async_session) == 2
+    downloads = dict((await async_session.execute(select(Blob.hash, Blob.downloads))).all())
+    assert sorted(downloads.values()) == [1, 2]
+    jobs = (await async_session.execute(select(Job.kind, Job.payload))).all()
+    assert sorted(payload['hash'] for kind, payload in jobs if kind == 'promote_blob') == sorted(hashes)
+
+    assert await JobWorker(poll_interval=0.1, lease=60).drain(['promote_blob']) == 2
+    for hash_ in hashes:
+        assert os.path.exists(tiers.path(hash_))
+    assert (await async_session.execute(select(Blob.pack_id).where(Blob.pack_id.is_not(None)))).all() == []
+    # the pack emptied and went away
+    assert (await async_session.execute(select(Pack))).all() == []
+    assert await tiers.backend.cold.stat(pack_key(pack.id)) is None
+    response = await client_auth.get(download, params={'id_': first})
+    assert response.content == b'first content'
+
+
+async def test_recently_downloaded_blobs_stay_hot(
+        async_session: AsyncSession, client_auth: AsyncClient, tiers: BlobStore
+):
+    await upload(client_auth, 'first', content=b'first content')
+    id_ = (await upload(client_auth, 'second', content=b'second content'))['id']
+    await client_auth.get(app.url_path_for('download_file_handler'), params={'id_': id_})
+    stale = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=2)
+    await async_session.execute(update(Blob).values(created_at=stale))
+    await access_log.flush(async_session)
+
+    assert await cold_tier.demote(async_session, tiers, cold_after=60 * 60, pack_size=1024 * 1024, limit=100) == 1
+    packed = (await async_session.execute(select(Blob.downloads).where(Blob.pack_id.is_not(None)))).scalars().all()
+    assert packed == [0]
+
+
+async def test_collecting_packed_blobs_releases_their_pack(
+        async_session: AsyncSession, client_auth: AsyncClient, tiers: BlobStore
+):
+    await upload(client_auth, 'first', content=b'first content')
+    assert await demote(async_session, tiers) == 1
+    pack_id = (await async_session.execute(select(Pack.id))).scalar_one()
+    assert await tiers.backend.cold.stat(pack_key(pack_id)) is not None
+
+    stale = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=2)
+    await async_session.execute(delete(File))
+    await async_session.execute(update(Blob).values(refcount=0, updated_at=stale))
+    await async_session.commit()
+    assert await blob_crud.collect_garbage(async_session, tiers, grace=60) == 1
+    assert (await async_session.execute(select(Pack))).all() == []
+    assert await tiers.backend.cold.stat(pack_key(pack_id)) is None
@@ -0,0 +1,121 @@
+import datetime
+import os
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from main import app
+from models.models import Blob, DeletedFile
+from services.blobs import BlobStore, blob_crud
+from services.files import file_crud
+from services.throttle import Throttle
+from tests.conftest import upload
+
+
+async def test_delete_and_restore(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore, monkeypatch
+):
+    kept = await upload(client_auth, 'docs', 'a.txt', b'12345')
+    file = await upload(client_auth, 'docs', 'b.txt', b'123')
+
+    async def no_storage(*args):
+        raise AssertionError('deletes never wait for storage')
+
+    monkeypatch.setattr(storage.backend, 'delete', no_storage)
+    response = await client_auth.delete(app.url_path_for('delete_file_handler'), params={'id_': file['id']})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['path'] == 'docs/b.txt'
+    response = await client_auth.delete(app.url_path_for('delete_file_handler'), params={'id_': file['id']})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    assert (await client_auth.get(app.url_path_for('usage_memory'))).json() == {'files': 1, 'used': 5}
+    response = await client_auth.get(app.url_path_for('directory_list_handler'), params={'path': 'docs'})
+    assert [entry['id'] for entry in response.json()['entries']] == [kept['id']]
+    response = await client_auth.get(app.url_path_for('download_file_handler'), params={'id_': file['id']})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = await client_auth.get(app.url_path_for('trash_list_handler'))
+    assert [entry['id'] for entry in response.json()] == [file['id']]
+
+    response = await client_auth.post(app.url_path_for('restore_file_handler'), params={'id_': file['id']})
+    assert response.status_code == status.HTTP_200_OK
+    assert (await client_auth.get(app.url_path_for('usage_memory'))).json() == {'files': 2, 'used': 8}
+    response = await client_auth.get(app.url_path_for('download_file_handler'), params={'id_': file['id']})
+    assert response.content == b'123'
+    assert (await client_auth.get(app.url_path_for('trash_list_handler'))).json() == []
+
+
+async def test_bulk_delete_and_restore_conflict(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore
+):
+    files = [await upload(client_auth, 'docs', f'{index}.txt', b'same') for index in range(3)]
+    response = await client_auth.post(
+        app.url_path_for('delete_files_handler'), json={'ids': [file['id'] for file in files[:2]]}
+    )
+    assert sorted(entry['id'] for entry in response.json()) == sorted(file['id'] for file in files[:2])
+    assert (await client_auth.get(app.url_path_for('usage_memory'))).json() == {'files': 1, 'used': 4}
+
+    await upload(client_auth, 'docs', '0.txt', b'new')
+    response = await client_auth.post(app.url_path_for('restore_file_handler'), params={'id_': files[0]['id']})
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert len((await client_auth.get(app.url_path_for('trash_list_handler'))).json()) == 2
+
+
+async def test_expired_files_are_reclaimed(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore, monkeypatch
+):
+    monkeypatch.setattr(settings, 'TRASH_RETENTION', 60)
+    file = await upload(client_auth, 'docs', 'a.txt', b'12345')
+    blob_hash = file['blob_hash']
+    response = await client_auth.delete(app.url_path_for('delete_file_handler'), params={'id_': file['id']})
+    assert response.status_code == status.HTTP_200_OK
+    # the trash keeps the content referenced until retention ends
+    assert await file_crud.purge(async_session, retention=60, limit=10) == 0
+    assert (await async_session.execute(select(Blob.refcount))).scalar_one() == 1
+
+    stale = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=2)
+    await async_session.execute(update(DeletedFile).values(deleted_at=stale))
+    await async_session.commit()
+    response = await client_auth.post(app.url_path_for('restore_file_handler'), params={'id_': file['id']})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    assert await file_crud.purge(async_session, retention=60, limit=10) == 1
+    assert (await async_session.execute(select(DeletedFile))).first() is None
+    await async_session.execute(update(Blob).values(updated_at=stale))
+    await async_session.commit()
+    throttle = Throttle(1000)
+    assert await blob_crud.collect_garbage(async_session, storage, grace=60, throttle=throttle) == 1
+    assert throttle.total == 1
+    assert not os.path.exists(storage.path(blob_hash))
+
+
+async def test_legacy_objects_outlive_a_failed_purge(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore, monkeypatch
+):
+    file = await upload(client_auth, 'docs', 'old.txt', b'12345')
+    await client_auth.delete(app.url_path_for('delete_file_handler'), params={'id_': file['id']})
+    # a file from before the blob store, with its own object
+    stale = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=2)
+    await async_session.execute(update(DeletedFile).values(blob_hash=None, deleted_at=stale))
+    await async_session.commit()
+    path = storage.backend.local_path(f'{file["id"]}.txt')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as out_file:
+        out_file.write(b'12345')
+
+    async def fail():
+        raise ConnectionError('commit failed')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(async_session, 'commit', fail)
+        with pytest.raises(ConnectionError):
+            await file_crud.purge(async_session, retention=60, limit=10)
+    await async_session.rollback()
+    # still restorable, so still downloadable
+    assert os.path.exists(path)
+
+    assert await file_crud.purge(async_session, retention=60, limit=10) == 1
+    assert not os.path.exists(path)
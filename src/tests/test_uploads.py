@@ -0,0 +1,135 @@
+import asyncio
+import functools
+import os
+import uuid
+
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from main import app
+from models.models import File
+from services.blobs import BlobStore
+from services.uploads import part_store
+
+
+async def test_resumable_upload(async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore):
+    response = await client_auth.post(
+        app.url_path_for('upload_create_handler'), params={'name': 'video.mp4', 'path': 'media'}
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    upload_id = response.json()['id']
+
+    parts = [b'a' * 1000, b'b' * 1000, b'c' * 10]
+    responses = await asyncio.gather(*[
+        client_auth.put(app.url_path_for('upload_part_handler', upload_id=upload_id, number=number), content=part)
+        for number, part in enumerate(parts, start=1)
+    ])
+    assert [response.status_code for response in responses] == [status.HTTP_200_OK] * 3
+
+    response = await client_auth.get(app.url_path_for('upload_status_handler', upload_id=upload_id))
+    assert response.json()['parts'] == [
+        {'number': 1, 'size': 1000}, {'number': 2, 'size': 1000}, {'number': 3, 'size': 10}
+    ]
+
+    response = await client_auth.post(app.url_path_for('upload_complete_handler', upload_id=upload_id))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['size'] == 2010
+    assert response.json()['path'] == 'media/video.mp4'
+
+    response = await client_auth.get(app.url_path_for('download_file_handler'), params={'id_': upload_id})
+    assert response.content == b''.join(parts)
+
+
+async def test_resumable_upload_with_missing_part(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore
+):
+    response = await client_auth.post(
+        app.url_path_for('upload_create_handler'), params={'name': 'data.bin', 'path': 'tmp'}
+    )
+    upload_id = response.json()['id']
+    await client_auth.put(app.url_path_for('upload_part_handler', upload_id=upload_id, number=2), content=b'x')
+
+    response = await client_auth.post(app.url_path_for('upload_complete_handler', upload_id=upload_id))
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+
+async def test_file_names_are_validated(async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore):
+    for name in ('..', 'a/b', 'x' * 101):
+        response = await client_auth.post(
+            app.url_path_for('upload_file_handler'), params={'path': 'docs'}, files={'file': (name, b'content')}
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = await client_auth.post(
+            app.url_path_for('upload_create_handler'), params={'name': name, 'path': 'docs'}
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = await client_auth.post(
+        app.url_path_for('upload_file_handler'), params={'path': 'docs'}, files={'file': ('x' * 100, b'content')}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['path'] == 'docs/' + 'x' * 100
+
+
+async def test_parts_are_checked_when_accepted(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore, monkeypatch
+):
+    response = await client_auth.post(
+        app.url_path_for('upload_create_handler'), params={'name': 'data.bin', 'path': 'tmp'}
+    )
+    upload_id = response.json()['id']
+    part = functools.partial(app.url_path_for, 'upload_part_handler', upload_id=upload_id)
+
+    monkeypatch.setattr(settings, 'MAX_UPLOAD_SIZE', 15)
+    assert (await client_auth.put(part(number=1), content=b'x' * 10)).status_code == status.HTTP_200_OK
+    response = await client_auth.put(part(number=2), content=b'x' * 10)
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    # a retried part replaces the old one instead of adding to it
+    assert (await client_auth.put(part(number=1), content=b'x' * 15)).status_code == status.HTTP_200_OK
+
+    monkeypatch.setattr(settings, 'MAX_UPLOAD_SIZE', 100)
+    monkeypatch.setattr(settings, 'USER_QUOTA', 20)
+    response = await client_auth.put(part(number=2), content=b'x' * 10)
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert response.json()['detail'] == 'Storage quota exceeded'
+    assert await part_store.parts(uuid.UUID(upload_id)) == {1: 15}
+
+    # an abort while the part streams in leaves no part folder behind
+    stage = part_store.stage
+
+    async def abort_meanwhile(*args):
+        staged = await stage(*args)
+        await client_auth.delete(app.url_path_for('upload_abort_handler', upload_id=upload_id))
+        return staged
+
+    monkeypatch.setattr(part_store, 'stage', abort_meanwhile)
+    response = await client_auth.put(part(number=2), content=b'x')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert not os.path.exists(part_store.folder(uuid.UUID(upload_id)))
+
+
+async def test_concurrent_completions_create_one_file(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore
+):
+    response = await client_auth.post(
+        app.url_path_for('upload_create_handler'), params={'name': 'data.bin', 'path': 'tmp'}
+    )
+    upload_id = response.json()['id']
+    part = functools.partial(app.url_path_for, 'upload_part_handler', upload_id=upload_id)
+    complete = app.url_path_for('upload_complete_handler', upload_id=upload_id)
+    await client_auth.put(part(number=2), content=b'y' * 10)
+
+    # a failed completion hands the upload back for more parts
+    assert (await client_auth.post(complete)).status_code == status.HTTP_409_CONFLICT
+    assert (await client_auth.put(part(number=1), content=b'x' * 10)).status_code == status.HTTP_200_OK
+
+    responses = await asyncio.gather(*[client_auth.post(complete) for _ in range(2)])
+    codes = sorted(response.status_code for response in responses)
+    assert codes[0] == status.HTTP_200_OK
+    assert codes[1] in (status.HTTP_404_NOT_FOUND, status.HTTP_409_CONFLICT)
+    files = (await async_session.execute(select(File).where(File.name == 'data.bin'))).scalars().all()
+    assert [file.size for file in files] == [20]
+    assert not os.path.exists(part_store.folder(uuid.UUID(upload_id)))
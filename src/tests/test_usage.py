@@ -0,0 +1,47 @@
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from main import app
+from models.models import File, Usage
+from services.blobs import BlobStore
+from services.usage import usage_crud
+from tests.conftest import upload
+
+
+async def test_usage_counts_uploads(async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore):
+    await upload(client_auth, 'a', content=b'12345')
+    await upload(client_auth, 'b', content=b'1234567890')
+
+    response = await client_auth.get(app.url_path_for('usage_memory'))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {'files': 2, 'used': 15}
+
+
+async def test_upload_over_quota(
+        async_session: AsyncSession, client_auth: AsyncClient, storage: BlobStore, monkeypatch
+):
+    monkeypatch.setattr(settings, 'USER_QUOTA', 12)
+    await upload(client_auth, 'a', content=b'12345')
+
+    response = await client_auth.post(
+        app.url_path_for('upload_file_handler'), params={'path': 'b'}, files={'file': ('a.txt', b'1234567890')}
+    )
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    response = await client_auth.get(app.url_path_for('usage_memory'))
+    assert response.json() == {'files': 1, 'used': 5}
+
+
+async def test_reconcile_usage(async_session: AsyncSession, client_auth: AsyncClient):
+    user_id = client_auth.headers['user_id']
+    async_session.add_all([
+        File(user_id=user_id, name='a', path='a', size=5),
+        File(user_id=user_id, name='b', path='b', size=7),
+    ])
+    await async_session.commit()
+
+    assert await usage_crud.reconcile(async_session) == 1
+    usage = await async_session.get(Usage, user_id)
+    assert (usage.files, usage.used) == (2, 12)
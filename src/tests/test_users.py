@@ -0,0 +1,80 @@
+import uuid
+from contextlib import contextmanager
+
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from main import app
+from services.cache import TTLCache
+from services.users import user_cache
+
+
+@contextmanager
+def queries(match: str = ''):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if match in statement:
+            statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+
+
+def test_ttl_cache_expires_and_evicts():
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    now[0] = 10
+    assert cache.get('a') is None
+    assert len(cache) == 1
+
+
+async def test_user_resolution_is_cached(async_session: AsyncSession, client_auth: AsyncClient):
+    user_id = uuid.UUID(client_auth.headers['user_id'])
+    user_cache.pop(user_id)
+    url = app.url_path_for('usage_memory')
+
+    with queries('FROM "user"') as statements:
+        assert (await client_auth.get(url)).status_code == status.HTTP_200_OK
+        assert len(statements) == 1
+        assert (await client_auth.get(url)).status_code == status.HTTP_200_OK
+        assert len(statements) == 1
+
+    # a route that needs nothing but the user never touches the database
+    with queries() as statements:
+        assert (await client_auth.get('/v1/users/me')).status_code == status.HTTP_200_OK
+        assert statements == []
+
+    # the cached user can still be updated, which drops it from the cache
+    response = await client_auth.patch('/v1/users/me', json={'password': 'changed'})
+    assert response.status_code == status.HTTP_200_OK
+    assert user_cache.get(user_id) is None
+
+
+async def test_trusted_claims_skip_lookup(async_session: AsyncSession, client_auth: AsyncClient, monkeypatch):
+    monkeypatch.setattr(settings, 'AUTH_TRUST_CLAIMS', 60)
+    response = await client_auth.post(
+        '/v1/auth/jwt/login', data={'username': 'Mike@post.com', 'password': '12345'}
+    )
+    token = response.json()['access_token']
+    user_cache.clear()
+
+    with queries('FROM "user"') as statements:
+        response = await client_auth.get(
+            app.url_path_for('usage_memory'), headers={'Authorization': f'Bearer {token}'}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert statements == []